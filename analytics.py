@@ -0,0 +1,83 @@
+"""Dashboard metrics for many symbols from one aligned price matrix
+
+Each symbol's bars become one row of a (symbols x bars) matrix, right-aligned
+so the newest bar of every series sits in the last column and shorter
+histories are padded with NaN on the left. Rows are aligned by bar position
+rather than by date: per-symbol figures (change, moving averages, trend) need
+each series' own bars, and markets in different time zones and holiday
+calendars rarely share dates.
+"""
+import numpy as np
+
+from indicators import compute_matrix, round_value
+from metrics import timed
+from prediction import predict_many
+
+# Fields computed from bars, in /api/stock order
+BAR_FIELDS = ("current_price", "change", "change_percent", "high_52_week", "low_52_week",
+              "avg_volume", "sma_20", "sma_50", "rsi", "prediction")
+
+# Fields taken from ticker info
+INFO_FIELDS = {"name": "longName", "market_cap": "marketCap", "pe_ratio": "trailingPE"}
+
+FIELDS = ("name",) + BAR_FIELDS[:6] + ("market_cap", "pe_ratio") + BAR_FIELDS[6:]
+
+# Legacy fields backed by indicator specs
+LEGACY_INDICATORS = {"sma_20": "sma20", "sma_50": "sma50", "rsi": "srsi14"}
+
+
+def price_matrix(frames, column="Close"):
+    """(len(frames) x longest frame) float matrix of one column, right-aligned with NaN padding"""
+    length = max((len(frame) for frame in frames), default=0)
+    matrix = np.full((len(frames), length), np.nan)
+    for row, frame in enumerate(frames):
+        if len(frame):
+            matrix[row, length - len(frame):] = frame[column].to_numpy(dtype=np.float64)
+    return matrix
+
+
+def _floats(values, digits=2):
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+
+@timed("batch")
+def bar_metrics(frames, fields=BAR_FIELDS, specs=(), lookback=30, horizon=1):
+    """{field: [value per frame]} for the bar fields requested, plus {"indicators": {spec: [...]}}
+
+    Values match what /api/stock reports for each series on its own.
+    """
+    closes = price_matrix(frames)
+    columns = {}
+
+    if {"current_price", "change", "change_percent"} & set(fields):
+        current = np.round(closes[:, -1], 2)
+        previous = np.round(closes[:, -2], 2) if closes.shape[1] > 1 else np.full(len(frames), np.nan)
+        change = np.round(current - previous, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_percent = np.round(change / previous * 100, 2)
+        columns.update(current_price=_floats(current), change=_floats(change),
+                       change_percent=_floats(change_percent))
+    if "high_52_week" in fields:
+        columns["high_52_week"] = _floats(np.nanmax(price_matrix(frames, "High"), axis=1))
+    if "low_52_week" in fields:
+        columns["low_52_week"] = _floats(np.nanmin(price_matrix(frames, "Low"), axis=1))
+    if "avg_volume" in fields:
+        # Mean of the last 30 bars, skipping missing volumes
+        volume = price_matrix(frames, "Volume")[:, -30:]
+        count = (~np.isnan(volume)).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = np.nansum(volume, axis=1) / count
+        columns["avg_volume"] = [None if np.isnan(value) else int(value) for value in average]
+
+    legacy = [field for field in LEGACY_INDICATORS if field in fields]
+    wanted = [LEGACY_INDICATORS[field] for field in legacy] + list(specs)
+    if wanted:
+        values = compute_matrix(closes, list(dict.fromkeys(wanted)))
+        for field in legacy:
+            columns[field] = [round_value(value) for value in values[LEGACY_INDICATORS[field]]]
+        if specs:
+            columns["indicators"] = {spec: [round_value(value) for value in values[spec]] for spec in specs}
+
+    if "prediction" in fields:
+        columns["prediction"] = predict_many(closes, lookback, horizon)
+    return columns
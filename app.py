@@ -1,12 +1,125 @@
-from flask import Flask, request, jsonify, send_file
-import yfinance as yf
+from flask import Flask, Response, g, request, jsonify, send_file
 from datetime import datetime, timedelta
+import os
+import time
+
+# numpy stays eager, unlike pandas: the search index is built with it at import time
 import numpy as np
-from sklearn.linear_model import LinearRegression
+
+from analytics import BAR_FIELDS, FIELDS, INFO_FIELDS, bar_metrics
+from backtest import run_backtest
+from downsampling import METHODS, downsample
+from http_cache import (MIN_COMPRESS_BYTES, cacheable, compress_response, etag, negotiate, not_modified,
+                        uncacheable)
+from indicators import IndicatorEngine, parse_specs, round_value
+from intraday import IntradayStore
+from gateway import BACKGROUND, DETAIL, REALTIME, SEARCH, note_stale, priority, set_priority, track_stale
+from market_data import INTRADAY_INTERVALS, create_market_data, validate_range
+from metrics import REGISTRY, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, WorkerMetrics, count_error
+from portfolio import PortfolioAnalytics
+from prediction import predict
+from quotes import create_quote_engine
+from scheduler import SnapshotScheduler
+from screener import Screener, parse_filters, parse_sort
+from search_index import SearchIndex
+from sessions import create_session_calendar
+from shared_cache import create_shared_cache
+from serialization import historical_payload, json_response
+from streaming import QuoteHub, StreamLimitReached, sse_response
+from warm_cache import create_warm_cache
+from watchlist_store import WatchlistStore
 
 
 app = Flask(__name__)
 
+# Cache shared by all worker processes on this node
+shared_cache = create_shared_cache()
+
+# Exchange hours and holidays - caches hold data until the market reopens
+sessions = create_session_calendar()
+
+# Provider + persistent bar store shared by all endpoints
+market_data = create_market_data(shared_cache, sessions)
+quote_engine = create_quote_engine(market_data, shared_cache, sessions)
+indicator_engine = IndicatorEngine()
+
+# Shared results (market summary, status, trending) refreshed in the background
+snapshots = SnapshotScheduler(shared=shared_cache, sessions=sessions)
+
+# Watchlists shared by every worker process
+watchlists = WatchlistStore(os.environ.get("WATCHLIST_DB", os.path.join("data", "watchlist.db")))
+
+# Prometheus metrics, merged across worker processes through the shared cache
+worker_metrics = WorkerMetrics(REGISTRY, shared_cache)
+
+# Share of the upstream budget each background refresh may spend (one token per
+# symbol and refresh); together they leave half of it to requests
+BACKGROUND_BUDGET = {"market-summary": 0.1, "trending": 0.2, "screen": 0.2}
+
+def refresh_seconds(variable, default, job, symbol_count):
+    """Refresh interval from the environment, else default stretched to fit the job's share of the budget"""
+    configured = os.environ.get(variable)
+    if configured:
+        return int(configured)
+    return max(default, int(market_data.provider.budget_interval(symbol_count, BACKGROUND_BUDGET[job])))
+
+def request_route():
+    """Route pattern (not the raw path) so metrics stay one series per endpoint"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+# Upstream priority class per endpoint (anything else is DETAIL)
+ROUTE_PRIORITIES = {
+    'get_real_time_data': REALTIME,
+    'stream_real_time_data': REALTIME,
+    'search_stocks': SEARCH,
+}
+
+@app.before_request
+def start_request():
+    set_priority(ROUTE_PRIORITIES.get(request.endpoint, DETAIL))
+    g.stale_sources = track_stale()
+    # Scrapes are left out - they would publish their own in-flight request
+    if request.endpoint == 'get_metrics':
+        return
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc(route=request_route())
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_LATENCY.observe(time.perf_counter() - started, route=request_route(),
+                                method=request.method, status=response.status_code)
+    if g.get('stale_sources'):
+        # Upstream was unavailable and some of the data is an older cached copy -
+        # browsers and proxies must not hold on to it until the next session
+        response.headers['X-Data-Stale'] = 'true'
+        uncacheable(response)
+    worker_metrics.maybe_publish()
+    return compress_response(response)
+
+@app.teardown_request
+def finish_request(error=None):
+    if request.endpoint != 'get_metrics':
+        REQUESTS_IN_FLIGHT.dec(route=request_route())
+    if error is not None:
+        count_error(request_route(), error)
+
+def error_response(e):
+    """500 JSON error, counted in errors_total under the route and exception type"""
+    count_error(request_route(), e)
+    return jsonify({"error": str(e)}), 500
+
+def int_arg(name, default):
+    """Integer query parameter (default when absent); ValueError if it is not an integer"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+
 # Sample companies - mix of Indian and international stocks
 COMPANIES = [
     {"symbol": "RELIANCE.NS", "name": "Reliance Industries", "country": "India"},
@@ -23,6 +136,105 @@ COMPANIES = [
     {"symbol": "META", "name": "Meta Platforms Inc.", "country": "USA"}
 ]
 
+# Extended list of popular stocks for search
+EXTENDED_STOCKS = [
+    # US Tech Stocks
+    {"symbol": "AAPL", "name": "Apple Inc.", "country": "USA", "sector": "Technology"},
+    {"symbol": "GOOGL", "name": "Alphabet Inc.", "country": "USA", "sector": "Technology"},
+    {"symbol": "MSFT", "name": "Microsoft Corporation", "country": "USA", "sector": "Technology"},
+    {"symbol": "AMZN", "name": "Amazon.com Inc.", "country": "USA", "sector": "E-commerce"},
+    {"symbol": "TSLA", "name": "Tesla, Inc.", "country": "USA", "sector": "Automotive"},
+    {"symbol": "META", "name": "Meta Platforms Inc.", "country": "USA", "sector": "Technology"},
+    {"symbol": "NVDA", "name": "NVIDIA Corporation", "country": "USA", "sector": "Technology"},
+    {"symbol": "NFLX", "name": "Netflix Inc.", "country": "USA", "sector": "Entertainment"},
+    {"symbol": "CRM", "name": "Salesforce Inc.", "country": "USA", "sector": "Technology"},
+    {"symbol": "ORCL", "name": "Oracle Corporation", "country": "USA", "sector": "Technology"},
+    
+    # US Financial & Others
+    {"symbol": "JPM", "name": "JPMorgan Chase & Co.", "country": "USA", "sector": "Financial"},
+    {"symbol": "JNJ", "name": "Johnson & Johnson", "country": "USA", "sector": "Healthcare"},
+    {"symbol": "V", "name": "Visa Inc.", "country": "USA", "sector": "Financial"},
+    {"symbol": "PG", "name": "Procter & Gamble Co.", "country": "USA", "sector": "Consumer Goods"},
+    {"symbol": "UNH", "name": "UnitedHealth Group Inc.", "country": "USA", "sector": "Healthcare"},
+    {"symbol": "HD", "name": "Home Depot Inc.", "country": "USA", "sector": "Retail"},
+    {"symbol": "MA", "name": "Mastercard Inc.", "country": "USA", "sector": "Financial"},
+    {"symbol": "BAC", "name": "Bank of America Corp.", "country": "USA", "sector": "Financial"},
+    {"symbol": "XOM", "name": "Exxon Mobil Corporation", "country": "USA", "sector": "Energy"},
+    {"symbol": "WMT", "name": "Walmart Inc.", "country": "USA", "sector": "Retail"},
+    
+    # Indian Stocks (NSE)
+    {"symbol": "RELIANCE.NS", "name": "Reliance Industries Limited", "country": "India", "sector": "Energy"},
+    {"symbol": "TCS.NS", "name": "Tata Consultancy Services", "country": "India", "sector": "Technology"},
+    {"symbol": "HDFCBANK.NS", "name": "HDFC Bank Limited", "country": "India", "sector": "Banking"},
+    {"symbol": "INFY.NS", "name": "Infosys Limited", "country": "India", "sector": "Technology"},
+    {"symbol": "ICICIBANK.NS", "name": "ICICI Bank Limited", "country": "India", "sector": "Banking"},
+    {"symbol": "HINDUNILVR.NS", "name": "Hindustan Unilever Limited", "country": "India", "sector": "FMCG"},
+    {"symbol": "ITC.NS", "name": "ITC Limited", "country": "India", "sector": "FMCG"},
+    {"symbol": "SBIN.NS", "name": "State Bank of India", "country": "India", "sector": "Banking"},
+    {"symbol": "BHARTIARTL.NS", "name": "Bharti Airtel Limited", "country": "India", "sector": "Telecom"},
+    {"symbol": "KOTAKBANK.NS", "name": "Kotak Mahindra Bank", "country": "India", "sector": "Banking"},
+    {"symbol": "LT.NS", "name": "Larsen & Toubro Limited", "country": "India", "sector": "Infrastructure"},
+    {"symbol": "ASIANPAINT.NS", "name": "Asian Paints Limited", "country": "India", "sector": "Paints"},
+    {"symbol": "MARUTI.NS", "name": "Maruti Suzuki India Limited", "country": "India", "sector": "Automotive"},
+    {"symbol": "HCLTECH.NS", "name": "HCL Technologies Limited", "country": "India", "sector": "Technology"},
+    {"symbol": "WIPRO.NS", "name": "Wipro Limited", "country": "India", "sector": "Technology"},
+    
+    # Global Stocks
+    {"symbol": "BABA", "name": "Alibaba Group Holding", "country": "China", "sector": "E-commerce"},
+    {"symbol": "TSM", "name": "Taiwan Semiconductor", "country": "Taiwan", "sector": "Technology"},
+    {"symbol": "NESN.SW", "name": "Nestle SA", "country": "Switzerland", "sector": "Food & Beverage"},
+    {"symbol": "ASML", "name": "ASML Holding NV", "country": "Netherlands", "sector": "Technology"},
+    {"symbol": "SAP", "name": "SAP SE", "country": "Germany", "sector": "Technology"}
+]
+
+# Search index over COMPANIES + EXTENDED_STOCKS, plus an optional listings file
+# (CSV with symbol,name,country,sector columns, or a JSON list) for a larger universe
+search_index = SearchIndex.build(COMPANIES + EXTENDED_STOCKS, os.environ.get("SEARCH_LISTINGS"))
+
+# Seconds search results may reuse a previously fetched quote
+SEARCH_QUOTE_MAX_AGE = 60
+
+# Screener over every listed symbol - one close/volume matrix, rebuilt in the background
+# (COMPANIES entries come first in the index but lack a sector, so details are merged)
+LISTINGS = {}
+for listing in search_index.listings + EXTENDED_STOCKS:
+    details = LISTINGS.setdefault(listing['symbol'].upper(), {})
+    for key, value in listing.items():
+        details.setdefault(key, value)
+screener = Screener(market_data, LISTINGS.keys(), sessions=sessions,
+                    refresh_interval=refresh_seconds("SCREEN_REFRESH_SECONDS", 900, "screen", len(LISTINGS)))
+
+# Watchlist return statistics, kept as running sums and advanced with each new bar
+portfolios = PortfolioAnalytics(market_data)
+
+# Most watchlist symbols /api/watchlist/analytics covers
+PORTFOLIO_MAX_SYMBOLS = 200
+
+# How long a /api/backtest report is reused
+BACKTEST_CACHE_SECONDS = int(os.environ.get("BACKTEST_CACHE_SECONDS", "3600"))
+
+# One upstream poller per streamed symbol, shared by all connected clients
+quote_hub = QuoteHub(lambda symbol: poll_real_time_quote(symbol),
+                     interval=int(os.environ.get("STREAM_POLL_SECONDS", "10")), sessions=sessions,
+                     max_symbols=int(os.environ.get("STREAM_MAX_SYMBOLS", "100")))
+
+# Seconds a real-time quote is reused while its market is open
+REAL_TIME_CACHE_SECONDS = int(os.environ.get("REAL_TIME_CACHE_SECONDS", "5"))
+
+# Today's 1-minute bars per symbol in fixed-size ring buffers, refreshed with tail-only fetches
+intraday = IntradayStore(market_data, max_symbols=int(os.environ.get("INTRADAY_SYMBOLS", "1000")),
+                         refresh_interval=REAL_TIME_CACHE_SECONDS, sessions=sessions)
+
+# Most symbols one /api/stocks/batch request may ask for
+BATCH_MAX_SYMBOLS = 50
+
+# Default cap on chart points per response - longer series are downsampled
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", "1000"))
+
+# Hot caches persisted across restarts (restored and saved by create_app)
+warm_cache = create_warm_cache(market_data.info_cache, quote_engine, snapshots, intraday, shared_cache)
+WARM_CACHE_INTERVAL = int(os.environ.get("WARM_CACHE_INTERVAL", "300"))
+
 @app.route("/")
 def index():
     return send_file('index.html')
@@ -34,33 +246,67 @@ def get_companies():
 
 @app.route('/api/stock/<symbol>')
 def get_stock_data(symbol):
-    """Get historical stock data for a symbol"""
+    """Get historical stock data for a symbol
+
+    ?format=columnar returns historical as parallel arrays instead of per-bar objects.
+    ?range=5y&interval=1wk select the chart series (default 1y of daily bars).
+    ?max_points=500&downsample=ohlc|lttb cap the number of chart points.
+    ?indicators=sma10,ema12,rsi14,bb20,macd adds an "indicators" object (on the chart interval).
+    ?lookback=30&horizon=1 configure the trend prediction.
+    The summary fields (price, 52-week range, SMA/RSI, prediction) always use daily bars.
+    """
     try:
-        # Get stock info
-        stock = yf.Ticker(symbol)
-        
-        # Get historical data (1 year)
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        hist_data = stock.history(start=start_date, end=end_date)
+        response_format = request.args.get('format', 'rows')
+        if response_format not in ('rows', 'columnar'):
+            return jsonify({"error": "format must be 'rows' or 'columnar'"}), 400
+        try:
+            requested_indicators = parse_specs(request.args.get('indicators', ''))
+            lookback = int_arg('lookback', 30)
+            horizon = int_arg('horizon', 1)
+            max_points = int_arg('max_points', CHART_MAX_POINTS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not (2 <= lookback <= 365 and 1 <= horizon <= 30):
+            return jsonify({"error": "lookback must be 2-365 and horizon 1-30"}), 400
+        chart_range = request.args.get('range', '1y')
+        interval = request.args.get('interval', '1d')
+        try:
+            validate_range(chart_range, interval)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        method = request.args.get('downsample', 'ohlc')
+        if not 10 <= max_points <= 10000 or method not in METHODS:
+            return jsonify({"error": "max_points must be 10-10000 and downsample 'ohlc' or 'lttb'"}), 400
+        
+        # Get historical data (1 year) - only bars newer than the stored ones are downloaded
+        start_date = datetime.now() - timedelta(days=365)
+        hist_data = market_data.bars(symbol, start_date)
         
         if hist_data.empty:
             return jsonify({"error": "No data found for symbol"}), 404
         
-        # Get stock info
-        info = stock.info
-        
-        # Prepare historical data
-        historical = []
-        for date, row in hist_data.iterrows():
-            historical.append({
-                "date": date.strftime('%Y-%m-%d'),
-                "open": round(row['Open'], 2),
-                "high": round(row['High'], 2),
-                "low": round(row['Low'], 2),
-                "close": round(row['Close'], 2),
-                "volume": int(row['Volume'])
-            })
+        # Chart series - served from the same store, downsampled to max_points
+        chart_data = hist_data
+        if (chart_range, interval) != ('1y', '1d'):
+            chart_data = market_data.range_bars(symbol, chart_range, interval)
+            if chart_data.empty:
+                return jsonify({"error": f"No {interval} data found for symbol in range {chart_range}"}), 404
+        
+        # Get stock info (cached per field)
+        info = market_data.info(symbol, fields=('longName', 'marketCap', 'trailingPE'))
+        
+        # Everything below is derived from these bars and info - a client that has
+        # this version gets a 304 before any of it is computed
+        tag = etag(symbol.upper(), sorted(request.args.items(multi=True)), series_version(hist_data),
+                   series_version(chart_data), [info.get(key) for key in ('longName', 'marketCap', 'trailingPE')])
+        max_age = sessions.expires_in(symbol, market_data.refresh_interval)
+        cached = not_modified(tag, max_age)
+        if cached is not None:
+            return cached
+        
+        # Prepare historical data (vectorized)
+        date_format = '%Y-%m-%d %H:%M' if interval in INTRADAY_INTERVALS else '%Y-%m-%d'
+        historical = historical_payload(downsample(chart_data, max_points, method), response_format, date_format)
         
         # Calculate additional metrics
         current_price = round(hist_data['Close'].iloc[-1], 2)
@@ -75,23 +321,20 @@ def get_stock_data(symbol):
         # Average volume (30 days)
         avg_volume = int(hist_data['Volume'].tail(30).mean())
         
-        # Simple moving averages
-        sma_20 = round(hist_data['Close'].rolling(window=20).mean().iloc[-1], 2)
-        sma_50 = round(hist_data['Close'].rolling(window=50).mean().iloc[-1], 2)
-        
-        # RSI calculation
-        def calculate_rsi(prices, window=14):
-            delta = prices.diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs))
-            return rsi.iloc[-1]
-        
-        rsi = round(calculate_rsi(hist_data['Close']), 2)
+        # Moving averages and RSI - the engine keeps per-symbol state and only processes new bars
+        daily_specs = ['sma20', 'sma50', 'srsi14']
+        if interval == '1d':
+            daily_specs += requested_indicators
+        indicator_values = indicator_engine.compute((symbol.upper(), '1d'), hist_data, daily_specs)
+        if interval != '1d' and requested_indicators:
+            indicator_values.update(indicator_engine.compute(
+                (symbol.upper(), interval), chart_data, requested_indicators))
+        sma_20 = round_value(indicator_values['sma20'])
+        sma_50 = round_value(indicator_values['sma50'])
+        rsi = round_value(indicator_values['srsi14'])
         
         # AI Prediction (Simple Linear Regression)
-        prediction = get_price_prediction(hist_data['Close'])
+        prediction = get_price_prediction(hist_data['Close'], lookback, horizon)
         
         response_data = {
             "symbol": symbol,
@@ -108,487 +351,634 @@ def get_stock_data(symbol):
             "sma_50": sma_50,
             "rsi": rsi,
             "prediction": prediction,
+            "range": chart_range,
+            "interval": interval,
             "historical": historical
         }
+        if requested_indicators:
+            response_data["indicators"] = {spec: round_value(indicator_values[spec])
+                                           for spec in requested_indicators}
+        
+        return cacheable(json_response(response_data), tag, max_age)
         
-        return jsonify(response_data)
+    except Exception as e:
+        return error_response(e)
+
+def series_version(frame):
+    """Length plus the newest bar - changes whenever a bar is added or the forming bar moves"""
+    last = frame.iloc[-1]
+    return len(frame), str(frame.index[-1]), float(last['Close']), float(last['High']), float(last['Low']), \
+        float(last['Volume'])
+
+def get_price_prediction(prices, lookback=30, horizon=1):
+    """Simple AI prediction using linear regression (closed-form least squares)"""
+    return predict(prices.tail(lookback).values, lookback, horizon)
+
+@app.route('/api/stocks/batch', methods=['POST'])
+def get_stocks_batch():
+    """/api/stock metrics for many symbols in one request, without the historical series
+
+    Body: {"symbols": [...], "fields": [...], "indicators": "ema12,macd" (or a list),
+    "lookback": 30, "horizon": 1, "format": "rows" | "columnar"}. fields defaults
+    to all of them. Symbols without data are listed under "missing".
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    symbols = list(dict.fromkeys(requested_symbols(data)))
+    if not 1 <= len(symbols) <= BATCH_MAX_SYMBOLS:
+        return jsonify({"error": f"symbols must list 1-{BATCH_MAX_SYMBOLS} symbols"}), 400
+    fields = data.get('fields') or list(FIELDS)
+    if not isinstance(fields, list) or any(field not in FIELDS for field in fields):
+        return jsonify({"error": f"fields must be a list of: {', '.join(FIELDS)}"}), 400
+    indicators = data.get('indicators') or ''
+    try:
+        specs = parse_specs(','.join(map(str, indicators)) if isinstance(indicators, list) else str(indicators))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    lookback, horizon = data.get('lookback', 30), data.get('horizon', 1)
+    if not (isinstance(lookback, int) and isinstance(horizon, int) and 2 <= lookback <= 365 and 1 <= horizon <= 30):
+        return jsonify({"error": "lookback must be 2-365 and horizon 1-30"}), 400
+    response_format = data.get('format', 'rows')
+    if response_format not in ('rows', 'columnar'):
+        return jsonify({"error": "format must be 'rows' or 'columnar'"}), 400
+    
+    try:
+        # All series in one or two bulk downloads, then one matrix pass for every symbol
+        start_date = datetime.now() - timedelta(days=365)
+        frames = market_data.bars_many(symbols, start_date)
+        found = [symbol for symbol in symbols if symbol in frames and not frames[symbol].empty]
+        missing = [symbol for symbol in symbols if symbol not in found]
+        
+        columns = {"symbol": found}
+        if found:
+            bar_fields = [field for field in fields if field in BAR_FIELDS]
+            computed = bar_metrics([frames[symbol] for symbol in found], bar_fields, specs, lookback, horizon) \
+                if bar_fields or specs else {}
+            info_fields = [field for field in fields if field in INFO_FIELDS]
+            infos = quote_engine.infos(found, fields=tuple(INFO_FIELDS[field] for field in info_fields)) \
+                if info_fields else {}
+            for field in fields:
+                if field in INFO_FIELDS:
+                    columns[field] = [infos[symbol].get(INFO_FIELDS[field], 'N/A') for symbol in found]
+                else:
+                    columns[field] = computed[field]
+            if specs:
+                columns["indicators"] = computed["indicators"]
+        
+        if response_format == 'columnar':
+            return json_response({"stocks": columns, "missing": missing})
+        
+        stocks = []
+        for i, symbol in enumerate(found):
+            stock = {"symbol": symbol}
+            stock.update((field, columns[field][i]) for field in fields)
+            if specs:
+                stock["indicators"] = {spec: values[i] for spec, values in columns["indicators"].items()}
+            stocks.append(stock)
+        return json_response({"stocks": stocks, "missing": missing})
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
-def get_price_prediction(prices):
-    """Simple AI prediction using linear regression"""
+def snapshot_response(name):
+    """Serve the latest precomputed snapshot, with its age in the Age / X-Snapshot-Age headers
+
+    Cache-Control max-age counts from when the snapshot was computed (as Age
+    does), so browsers reuse it until it is due for a refresh.
+    """
     try:
-        # Use last 30 days for prediction
-        recent_prices = prices.tail(30).values.reshape(-1, 1)
-        days = np.arange(len(recent_prices)).reshape(-1, 1)
-        
-        # Fit linear regression model
-        model = LinearRegression()
-        model.fit(days, recent_prices)
-        
-        # Predict next day
-        next_day = np.array([[len(recent_prices)]])
-        prediction = model.predict(next_day)[0][0]
-        
-        # Calculate confidence (based on R-squared)
-        r_squared = model.score(days, recent_prices)
-        confidence = round(r_squared * 100, 1)
-        
-        return {
-            "next_day_price": round(prediction, 2),
-            "confidence": confidence,
-            "trend": "bullish" if model.coef_[0][0] > 0 else "bearish"
-        }
-    except:
-        return {
-            "next_day_price": "N/A",
-            "confidence": 0,
-            "trend": "neutral"
-        }
+        snapshot = snapshots.get(name)
+    except Exception as e:
+        return error_response(e)
+    
+    max_age = snapshot.age() + snapshots.fresh_for(name)
+    response = not_modified(snapshot.etag, max_age)
+    if response is None:
+        # The body is compressed once per snapshot, not once per request
+        encoding = negotiate()
+        if encoding is not None and len(snapshot.body) >= MIN_COMPRESS_BYTES:
+            response = Response(snapshot.encoded(encoding), mimetype='application/json')
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = Response(snapshot.body, mimetype='application/json')
+        cacheable(response, snapshot.etag, max_age)
+    response.headers['Age'] = str(int(snapshot.age()))
+    response.headers['X-Snapshot-Age'] = f"{snapshot.age():.1f}"
+    if snapshots.is_stale(name):
+        response.headers['X-Snapshot-Stale'] = 'true'
+        uncacheable(response)
+    return response
+
+# Major indices shown in the market summary
+MARKET_INDICES = {
+    "^NSEI": "NIFTY 50",
+    "^BSESN": "BSE SENSEX",
+    "^GSPC": "S&P 500",
+    "^DJI": "Dow Jones"
+}
+
+def compute_market_summary():
+    """Market summary snapshot - one batched fetch for all indices"""
+    with priority(BACKGROUND):
+        quotes = quote_engine.get_quotes(MARKET_INDICES.keys())
+    
+    summary = []
+    for symbol, name in MARKET_INDICES.items():
+        quote = quotes.get(symbol)
+        if quote is None or quote['prev_close'] is None:
+            continue
+        current = round(quote['price'], 2)
+        previous = round(quote['prev_close'], 2)
+        change = round(current - previous, 2)
+        change_percent = round((change / previous) * 100, 2)
+        
+        summary.append({
+            "name": name,
+            "value": current,
+            "change": change,
+            "change_percent": change_percent
+        })
+    
+    return summary
+
+snapshots.register('market-summary', compute_market_summary,
+                   refresh_seconds("MARKET_SUMMARY_REFRESH_SECONDS", 30, "market-summary", len(MARKET_INDICES)),
+                   keep_if_empty=True,
+                   symbols=MARKET_INDICES)
 
 @app.route('/api/market-summary')
 def get_market_summary():
     """Get overall market summary"""
-    try:
-        # Get major indices
-        indices = {
-            "^NSEI": "NIFTY 50",
-            "^BSESN": "BSE SENSEX",
-            "^GSPC": "S&P 500",
-            "^DJI": "Dow Jones"
-        }
-        
-        summary = []
-        for symbol, name in indices.items():
-            try:
-                ticker = yf.Ticker(symbol)
-                hist = ticker.history(period="2d")
-                if not hist.empty:
-                    current = round(hist['Close'].iloc[-1], 2)
-                    previous = round(hist['Close'].iloc[-2], 2)
-                    change = round(current - previous, 2)
-                    change_percent = round((change / previous) * 100, 2)
-                    
-                    summary.append({
-                        "name": name,
-                        "value": current,
-                        "change": change,
-                        "change_percent": change_percent
-                    })
-            except:
-                continue
-        
-        return jsonify(summary)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return snapshot_response('market-summary')
     
 @app.route('/api/search/<query>')
 def search_stocks(query):
-    """Search for stocks by symbol or name with real-time price information"""
+    """Search for stocks by symbol or name
+
+    ?quotes=1 adds real-time price information from one batched, briefly cached quote fetch.
+    """
     try:
-        # Extended list of popular stocks for search
-        extended_stocks = [
-            # US Tech Stocks
-            {"symbol": "AAPL", "name": "Apple Inc.", "country": "USA", "sector": "Technology"},
-            {"symbol": "GOOGL", "name": "Alphabet Inc.", "country": "USA", "sector": "Technology"},
-            {"symbol": "MSFT", "name": "Microsoft Corporation", "country": "USA", "sector": "Technology"},
-            {"symbol": "AMZN", "name": "Amazon.com Inc.", "country": "USA", "sector": "E-commerce"},
-            {"symbol": "TSLA", "name": "Tesla, Inc.", "country": "USA", "sector": "Automotive"},
-            {"symbol": "META", "name": "Meta Platforms Inc.", "country": "USA", "sector": "Technology"},
-            {"symbol": "NVDA", "name": "NVIDIA Corporation", "country": "USA", "sector": "Technology"},
-            {"symbol": "NFLX", "name": "Netflix Inc.", "country": "USA", "sector": "Entertainment"},
-            {"symbol": "CRM", "name": "Salesforce Inc.", "country": "USA", "sector": "Technology"},
-            {"symbol": "ORCL", "name": "Oracle Corporation", "country": "USA", "sector": "Technology"},
-            
-            # US Financial & Others
-            {"symbol": "JPM", "name": "JPMorgan Chase & Co.", "country": "USA", "sector": "Financial"},
-            {"symbol": "JNJ", "name": "Johnson & Johnson", "country": "USA", "sector": "Healthcare"},
-            {"symbol": "V", "name": "Visa Inc.", "country": "USA", "sector": "Financial"},
-            {"symbol": "PG", "name": "Procter & Gamble Co.", "country": "USA", "sector": "Consumer Goods"},
-            {"symbol": "UNH", "name": "UnitedHealth Group Inc.", "country": "USA", "sector": "Healthcare"},
-            {"symbol": "HD", "name": "Home Depot Inc.", "country": "USA", "sector": "Retail"},
-            {"symbol": "MA", "name": "Mastercard Inc.", "country": "USA", "sector": "Financial"},
-            {"symbol": "BAC", "name": "Bank of America Corp.", "country": "USA", "sector": "Financial"},
-            {"symbol": "XOM", "name": "Exxon Mobil Corporation", "country": "USA", "sector": "Energy"},
-            {"symbol": "WMT", "name": "Walmart Inc.", "country": "USA", "sector": "Retail"},
-            
-            # Indian Stocks (NSE)
-            {"symbol": "RELIANCE.NS", "name": "Reliance Industries Limited", "country": "India", "sector": "Energy"},
-            {"symbol": "TCS.NS", "name": "Tata Consultancy Services", "country": "India", "sector": "Technology"},
-            {"symbol": "HDFCBANK.NS", "name": "HDFC Bank Limited", "country": "India", "sector": "Banking"},
-            {"symbol": "INFY.NS", "name": "Infosys Limited", "country": "India", "sector": "Technology"},
-            {"symbol": "ICICIBANK.NS", "name": "ICICI Bank Limited", "country": "India", "sector": "Banking"},
-            {"symbol": "HINDUNILVR.NS", "name": "Hindustan Unilever Limited", "country": "India", "sector": "FMCG"},
-            {"symbol": "ITC.NS", "name": "ITC Limited", "country": "India", "sector": "FMCG"},
-            {"symbol": "SBIN.NS", "name": "State Bank of India", "country": "India", "sector": "Banking"},
-            {"symbol": "BHARTIARTL.NS", "name": "Bharti Airtel Limited", "country": "India", "sector": "Telecom"},
-            {"symbol": "KOTAKBANK.NS", "name": "Kotak Mahindra Bank", "country": "India", "sector": "Banking"},
-            {"symbol": "LT.NS", "name": "Larsen & Toubro Limited", "country": "India", "sector": "Infrastructure"},
-            {"symbol": "ASIANPAINT.NS", "name": "Asian Paints Limited", "country": "India", "sector": "Paints"},
-            {"symbol": "MARUTI.NS", "name": "Maruti Suzuki India Limited", "country": "India", "sector": "Automotive"},
-            {"symbol": "HCLTECH.NS", "name": "HCL Technologies Limited", "country": "India", "sector": "Technology"},
-            {"symbol": "WIPRO.NS", "name": "Wipro Limited", "country": "India", "sector": "Technology"},
-            
-            # Global Stocks
-            {"symbol": "BABA", "name": "Alibaba Group Holding", "country": "China", "sector": "E-commerce"},
-            {"symbol": "TSM", "name": "Taiwan Semiconductor", "country": "Taiwan", "sector": "Technology"},
-            {"symbol": "NESN.SW", "name": "Nestle SA", "country": "Switzerland", "sector": "Food & Beverage"},
-            {"symbol": "ASML", "name": "ASML Holding NV", "country": "Netherlands", "sector": "Technology"},
-            {"symbol": "SAP", "name": "SAP SE", "country": "Germany", "sector": "Technology"}
-        ]
-        
-        # Combine with existing companies
-        all_stocks = COMPANIES + extended_stocks
-        
-        # Remove duplicates based on symbol
-        seen_symbols = set()
-        unique_stocks = []
-        for stock in all_stocks:
-            if stock['symbol'] not in seen_symbols:
-                unique_stocks.append(stock)
-                seen_symbols.add(stock['symbol'])
-        
-        # Search logic
-        query_lower = query.lower().strip()
-        results = []
-        
-        for stock in unique_stocks:
-            symbol_match = query_lower in stock['symbol'].lower()
-            name_match = query_lower in stock['name'].lower()
-            
-            if symbol_match or name_match:
-                # Calculate relevance score
-                score = 0
-                if stock['symbol'].lower().startswith(query_lower):
-                    score += 10
-                elif symbol_match:
-                    score += 5
-                if stock['name'].lower().startswith(query_lower):
-                    score += 8
-                elif name_match:
-                    score += 3
-                
-                try:
-                    # Get real-time data for the stock
-                    ticker = yf.Ticker(stock['symbol'])
-                    hist = ticker.history(period="2d")  # Get 2 days of data for price change calculation
-                    
-                    if not hist.empty:
-                        current_price = float(hist['Close'].iloc[-1])
-                        prev_close = float(hist['Close'].iloc[-2]) if len(hist) > 1 else current_price
-                        change = current_price - prev_close
-                        change_percent = (change / prev_close) * 100
-                        
-                        # Get additional info
-                        info = ticker.info
-                        
-                        enhanced_stock = {
-                            **stock,
-                            'current_price': round(current_price, 2),
-                            'change': round(change, 2),
-                            'change_percent': round(change_percent, 2),
-                            'market_cap': info.get('marketCap', 'N/A'),
-                            'volume': info.get('volume', 'N/A'),
-                            'pe_ratio': info.get('trailingPE', 'N/A'),
-                            'day_high': round(float(hist['High'].iloc[-1]), 2) if 'High' in hist else 'N/A',
-                            'day_low': round(float(hist['Low'].iloc[-1]), 2) if 'Low' in hist else 'N/A',
-                            'relevance_score': score
-                        }
-                        
-                        results.append(enhanced_stock)
-                except Exception as e:
+        # Index lookup - no upstream calls
+        results = [dict(stock) for stock in search_index.search(query, limit=20)]
+        
+        if request.args.get('quotes', '').lower() in ('1', 'true', 'yes'):
+            quotes = quote_engine.get_quotes([stock['symbol'] for stock in results], with_info=True,
+                                             info_fields=('marketCap', 'volume', 'trailingPE'),
+                                             max_age=SEARCH_QUOTE_MAX_AGE)
+            for stock in results:
+                quote = quotes.get(stock['symbol'])
+                if quote is None:
                     # If we can't get real-time data, still include the stock with basic info
-                    results.append({
-                        **stock,
-                        'current_price': 'N/A',
-                        'change': 'N/A',
-                        'change_percent': 'N/A',
-                        'market_cap': 'N/A',
-                        'volume': 'N/A',
-                        'pe_ratio': 'N/A',
-                        'day_high': 'N/A',
-                        'day_low': 'N/A',
-                        'relevance_score': score
-                    })
-        
-        # Sort by relevance score (highest first)
-        results.sort(key=lambda x: x['relevance_score'], reverse=True)
-        
-        # Remove relevance_score from final results
-        for result in results:
-            result.pop('relevance_score', None)
-        
-        return jsonify(results[:20])  # Return top 20 matches
+                    stock.update({key: 'N/A' for key in ('current_price', 'change', 'change_percent', 'market_cap',
+                                                         'volume', 'pe_ratio', 'day_high', 'day_low')})
+                    continue
+                
+                current_price = quote['price']
+                prev_close = quote['prev_close'] if quote['prev_close'] is not None else current_price
+                change = current_price - prev_close
+                info = quote['info']
+                stock.update({
+                    'current_price': round(current_price, 2),
+                    'change': round(change, 2),
+                    'change_percent': round((change / prev_close) * 100, 2),
+                    'market_cap': info.get('marketCap', 'N/A'),
+                    'volume': info.get('volume', 'N/A'),
+                    'pe_ratio': info.get('trailingPE', 'N/A'),
+                    'day_high': round(quote['day_high'], 2),
+                    'day_low': round(quote['day_low'], 2)
+                })
+        
+        return jsonify(results)
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
+
+def build_real_time_quote(symbol):
+    """Latest real-time quote for a symbol, or None if there is no intraday data"""
+    # Today's 1-minute bars - only the bars after the last one seen are downloaded
+    hist_data = intraday.bars(symbol)
+    
+    if hist_data.empty:
+        return None
+    
+    # Get the latest data point
+    latest_data = hist_data.iloc[-1]
+    
+    # Get basic info
+    info = market_data.info(symbol, fields=('longName', 'previousClose', 'currency', 'marketCap'))
+    
+    # Calculate change from previous close
+    if len(hist_data) > 1:
+        prev_close = hist_data.iloc[-2]['Close']
+    else:
+        # Fallback to yesterday's close if available
+        prev_close = info.get('previousClose', latest_data['Close'])
+    
+    current_price = float(latest_data['Close'])
+    change = current_price - float(prev_close)
+    change_percent = (change / float(prev_close)) * 100
+    
+    # Get market status
+    market_time = hist_data.index[-1]
+    is_market_open = is_market_currently_open(symbol)
+    
+    real_time_data = {
+        "symbol": symbol,
+        "name": info.get('longName', symbol),
+        "current_price": round(current_price, 2),
+        "change": round(change, 2),
+        "change_percent": round(change_percent, 2),
+        "volume": int(latest_data['Volume']),
+        "high": round(float(latest_data['High']), 2),
+        "low": round(float(latest_data['Low']), 2),
+        "open": round(float(latest_data['Open']), 2),
+        "market_time": market_time.strftime('%Y-%m-%d %H:%M:%S'),
+        "is_market_open": is_market_open,
+        "currency": info.get('currency', 'USD'),
+        "market_cap": info.get('marketCap', 'N/A'),
+        "timezone": str(market_time.tz) if hasattr(market_time, 'tz') else 'UTC'
+    }
+    
+    return real_time_data
+
+def cached_real_time_quote(symbol):
+    """Real-time quote shared by all workers - refetched every few seconds while the market trades"""
+    symbol = symbol.upper()
+    key = f"realtime:{symbol}"
+    try:
+        quote, _ = shared_cache.get_or_compute(
+            key, lambda: build_real_time_quote(symbol),
+            max_age=sessions.max_age(symbol, REAL_TIME_CACHE_SECONDS),
+            ttl=sessions.expires_in(symbol, 3600))
+    except Exception:
+        # Upstream unavailable - fall back to the last quote we had
+        cached = shared_cache.get(key)
+        if cached is None or cached[0] is None:
+            raise
+        note_stale("real-time")
+        return cached[0]
+    return quote
+
+def poll_real_time_quote(symbol):
+    """Stream poller fetch - runs outside a request, so set the priority here"""
+    with priority(REALTIME):
+        return cached_real_time_quote(symbol)
 
 @app.route('/api/real-time/<symbol>')
 def get_real_time_data(symbol):
     """Get real-time stock data with minimal delay"""
     try:
-        stock = yf.Ticker(symbol)
+        real_time_data = cached_real_time_quote(symbol)
         
-        # Get the most recent data
-        hist_data = stock.history(period="1d", interval="1m")  # 1-minute intervals for today
-        
-        if hist_data.empty:
+        if real_time_data is None:
             return jsonify({"error": "No real-time data available"}), 404
         
-        # Get the latest data point
-        latest_data = hist_data.iloc[-1]
-        
-        # Get basic info
-        info = stock.info
-        
-        # Calculate change from previous close
-        if len(hist_data) > 1:
-            prev_close = hist_data.iloc[-2]['Close']
-        else:
-            # Fallback to yesterday's close if available
-            prev_close = info.get('previousClose', latest_data['Close'])
-        
-        current_price = float(latest_data['Close'])
-        change = current_price - float(prev_close)
-        change_percent = (change / float(prev_close)) * 100
-        
-        # Get market status
-        market_time = hist_data.index[-1]
-        is_market_open = is_market_currently_open(symbol)
-        
-        real_time_data = {
-            "symbol": symbol,
-            "name": info.get('longName', symbol),
-            "current_price": round(current_price, 2),
-            "change": round(change, 2),
-            "change_percent": round(change_percent, 2),
-            "volume": int(latest_data['Volume']),
-            "high": round(float(latest_data['High']), 2),
-            "low": round(float(latest_data['Low']), 2),
-            "open": round(float(latest_data['Open']), 2),
-            "market_time": market_time.strftime('%Y-%m-%d %H:%M:%S'),
-            "is_market_open": is_market_open,
-            "currency": info.get('currency', 'USD'),
-            "market_cap": info.get('marketCap', 'N/A'),
-            "timezone": str(market_time.tz) if hasattr(market_time, 'tz') else 'UTC'
-        }
-        
-        return jsonify(real_time_data)
+        tag = etag(real_time_data)
+        max_age = sessions.expires_in(symbol, REAL_TIME_CACHE_SECONDS)
+        cached = not_modified(tag, max_age)
+        if cached is not None:
+            return cached
+        return cacheable(jsonify(real_time_data), tag, max_age)
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
-def is_market_currently_open(symbol):
-    """Determine if the market is currently open for the given symbol"""
+@app.route('/api/stream/<symbol>')
+def stream_real_time_data(symbol):
+    """Stream real-time quote changes as Server-Sent Events
+
+    The first event carries the full quote, later events only the fields that changed.
+    All clients watching a symbol share one upstream poller. Only listed symbols,
+    market indices and symbols already in the bar store (loaded through /api/stock)
+    can be streamed.
+    """
+    symbol = symbol.upper()
+    if symbol not in LISTINGS and symbol not in MARKET_INDICES and market_data.store.last_timestamp(symbol) is None:
+        return jsonify({"error": "Unknown symbol"}), 404
     try:
-        from datetime import datetime
-        import pytz
-        
-        now = datetime.now()
-        
-        # Determine market timezone based on symbol
-        if symbol.endswith('.NS') or symbol.endswith('.BO'):
-            # Indian markets (NSE/BSE)
-            market_tz = pytz.timezone('Asia/Kolkata')
-            market_start = 9  # 9:15 AM IST
-            market_end = 15   # 3:30 PM IST
-        else:
-            # US markets (default)
-            market_tz = pytz.timezone('America/New_York')
-            market_start = 9  # 9:30 AM EST
-            market_end = 16   # 4:00 PM EST
-        
-        # Convert current time to market timezone
-        market_time = now.astimezone(market_tz)
-        current_hour = market_time.hour
+        subscription = quote_hub.subscribe(symbol)
+    except StreamLimitReached as e:
+        return jsonify({"error": str(e)}), 503
+    return sse_response(subscription)
+
+@app.route('/api/screen')
+def screen_stocks():
+    """Filter and rank every listed symbol in one pass over the universe matrix
+
+    ?filter=rsi14<30,close>sma50 - all comparisons must hold
+    ?sort=-change_pct - rank by a term, highest first with a leading "-"
+    ?limit=10 - number of results (default 50)
+    Terms: close, volume, change, change_pct, smaN, emaN, rsiN, srsiN, retN (N-bar return %), avgvolN.
+    """
+    try:
+        filters = parse_filters(request.args.get('filter', ''))
+        sort = parse_sort(request.args['sort']) if request.args.get('sort') else None
+        limit = int_arg('limit', 50)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not 1 <= limit <= 500:
+        return jsonify({"error": "limit must be 1-500"}), 400
+    
+    try:
+        matrix, rows, matched = screener.screen(filters, sort, limit)
+        tag = etag(matrix.built_at, sorted(request.args.items(multi=True)))
+        cached = not_modified(tag, 0)
+        if cached is not None:
+            return cached
+        
+        # Every term the screen used is reported alongside price and 1-day change
+        terms = ['close', 'change_pct']
+        for left, _, right in filters:
+            terms += [left] + ([] if isinstance(right, float) else [right])
+        if sort is not None:
+            terms.append(sort[0])
+        values = {term: matrix.term(term)[rows] for term in dict.fromkeys(terms)}
         
-        # Check if it's a weekday and within market hours
-        is_weekday = market_time.weekday() < 5  # 0-4 are Mon-Fri
-        is_market_hours = market_start <= current_hour <= market_end
+        results = []
+        for i, row in enumerate(rows):
+            symbol = matrix.symbols[row]
+            listing = LISTINGS.get(symbol, {})
+            result = {"symbol": symbol, "name": listing.get('name', symbol),
+                      "country": listing.get('country'), "sector": listing.get('sector')}
+            for term, column in values.items():
+                result[term] = None if np.isnan(column[i]) else round(float(column[i]), 2)
+            results.append(result)
+        
+        return cacheable(json_response({
+            "universe": len(matrix.symbols),
+            "matched": matched,
+            "as_of": datetime.fromtimestamp(matrix.built_at).isoformat(timespec='seconds'),
+            "results": results
+        }), tag, 0)
         
-        return is_weekday and is_market_hours
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/intraday/<symbol>')
+def get_intraday_data(symbol):
+    """Today's 1-minute bars from the in-memory intraday buffer
+
+    ?format=columnar and ?max_points= / ?downsample= work as for /api/stock.
+    """
+    response_format = request.args.get('format', 'rows')
+    try:
+        max_points = int_arg('max_points', CHART_MAX_POINTS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    method = request.args.get('downsample', 'ohlc')
+    if response_format not in ('rows', 'columnar') or not 10 <= max_points <= 10000 or method not in METHODS:
+        return jsonify({"error": "format must be rows/columnar, max_points 10-10000 and downsample ohlc/lttb"}), 400
+    
+    try:
+        bars = intraday.bars(symbol)
+        if bars.empty:
+            return jsonify({"error": "No intraday data found for symbol"}), 404
+        
+        tag = etag(symbol.upper(), sorted(request.args.items(multi=True)), series_version(bars))
+        max_age = sessions.expires_in(symbol, REAL_TIME_CACHE_SECONDS)
+        cached = not_modified(tag, max_age)
+        if cached is not None:
+            return cached
+        
+        return cacheable(json_response({
+            "symbol": symbol.upper(),
+            "interval": "1m",
+            "timezone": str(bars.index.tz),
+            "historical": historical_payload(downsample(bars, max_points, method), response_format,
+                                             '%Y-%m-%d %H:%M')
+        }), tag, max_age)
         
-    except:
-        # If we can't determine, assume market could be open
-        return True
+    except Exception as e:
+        return error_response(e)
+
+def is_market_currently_open(symbol):
+    """Determine if the market is currently open for the given symbol (hours and holidays)"""
+    return sessions.is_open(symbol)
+
+def compute_market_status():
+    """Market status snapshot for major exchanges"""
+    return sessions.market_status()
+
+snapshots.register('market-status', compute_market_status,
+                   int(os.environ.get("MARKET_STATUS_REFRESH_SECONDS", "15")))
 
 @app.route('/api/market-status')
 def get_market_status():
     """Get current market status for major exchanges"""
-    try:
-        from datetime import datetime
-        import pytz
-        
-        now = datetime.now(pytz.UTC)
-        
-        markets = {
-            "US": {
-                "name": "US Markets (NYSE/NASDAQ)",
-                "timezone": "America/New_York",
-                "open_time": "09:30",
-                "close_time": "16:00"
-            },
-            "India": {
-                "name": "Indian Markets (NSE/BSE)", 
-                "timezone": "Asia/Kolkata",
-                "open_time": "09:15",
-                "close_time": "15:30"
-            },
-            "UK": {
-                "name": "London Stock Exchange",
-                "timezone": "Europe/London",
-                "open_time": "08:00",
-                "close_time": "16:30"
-            },
-            "Japan": {
-                "name": "Tokyo Stock Exchange",
-                "timezone": "Asia/Tokyo",
-                "open_time": "09:00",
-                "close_time": "15:00"
-            }
-        }
-        
-        status_data = []
-        
-        for market_code, market_info in markets.items():
-            try:
-                tz = pytz.timezone(market_info["timezone"])
-                local_time = now.astimezone(tz)
-                
-                # Parse open/close times
-                open_hour, open_min = map(int, market_info["open_time"].split(":"))
-                close_hour, close_min = map(int, market_info["close_time"].split(":"))
-                
-                # Check if market is open
-                is_weekday = local_time.weekday() < 5
-                current_minutes = local_time.hour * 60 + local_time.minute
-                open_minutes = open_hour * 60 + open_min
-                close_minutes = close_hour * 60 + close_min
-                
-                is_open = is_weekday and open_minutes <= current_minutes <= close_minutes
-                
-                status = "OPEN" if is_open else "CLOSED"
-                if not is_weekday:
-                    status = "WEEKEND"
-                
-                status_data.append({
-                    "market": market_info["name"],
-                    "status": status,
-                    "local_time": local_time.strftime("%H:%M"),
-                    "timezone": market_info["timezone"],
-                    "is_open": is_open
-                })
-                
-            except Exception as e:
-                print(f"Error getting status for {market_code}: {e}")
-                continue
-        
-        return jsonify(status_data)
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return snapshot_response('market-status')
+
+# Popular stocks that are frequently traded
+TRENDING_SYMBOLS = [
+    "AAPL", "GOOGL", "MSFT", "TSLA", "AMZN", "META", "NVDA", "NFLX",
+    "RELIANCE.NS", "TCS.NS", "HDFCBANK.NS", "INFY.NS", "ICICIBANK.NS"
+]
+
+def compute_trending_stocks():
+    """Trending/most active stocks snapshot"""
+    trending_data = []
+    
+    # Prices and info for every symbol in one batch
+    with priority(BACKGROUND):
+        quotes = quote_engine.get_quotes(TRENDING_SYMBOLS, with_info=True,
+                                         info_fields=('longName', 'marketCap'))
+    
+    for symbol, quote in quotes.items():
+        current_price = quote['price']
+        prev_close = quote['prev_close'] if quote['prev_close'] is not None else current_price
+        change = current_price - prev_close
+        change_percent = (change / prev_close) * 100
+        info = quote['info']
+        name = info.get('longName', symbol)
+        
+        trending_data.append({
+            "symbol": symbol,
+            "name": name[:30] + "..." if len(name) > 30 else name,
+            "current_price": round(current_price, 2),
+            "change_percent": round(change_percent, 2),
+            "volume": quote['volume'],
+            "market_cap": info.get('marketCap', 0)
+        })
+    
+    # Sort by volume (most active first)
+    trending_data.sort(key=lambda x: x['volume'], reverse=True)
+    
+    return trending_data
+
+snapshots.register('trending', compute_trending_stocks,
+                   refresh_seconds("TRENDING_REFRESH_SECONDS", 60, "trending", len(TRENDING_SYMBOLS)),
+                   keep_if_empty=True,
+                   symbols=TRENDING_SYMBOLS)
 
 @app.route('/api/trending')
 def get_trending_stocks():
     """Get trending/most active stocks"""
-    try:
-        # Popular stocks that are frequently traded
-        trending_symbols = [
-            "AAPL", "GOOGL", "MSFT", "TSLA", "AMZN", "META", "NVDA", "NFLX",
-            "RELIANCE.NS", "TCS.NS", "HDFCBANK.NS", "INFY.NS", "ICICIBANK.NS"
-        ]
-        
-        trending_data = []
-        
-        for symbol in trending_symbols[:8]:  # Limit to 8 to avoid too many API calls
-            try:
-                stock = yf.Ticker(symbol)
-                hist = stock.history(period="2d")
-                
-                if not hist.empty:
-                    current_price = float(hist['Close'].iloc[-1])
-                    prev_close = float(hist['Close'].iloc[-2]) if len(hist) > 1 else current_price
-                    change = current_price - prev_close
-                    change_percent = (change / prev_close) * 100
-                    volume = int(hist['Volume'].iloc[-1])
-                    
-                    info = stock.info
-                    
-                    trending_data.append({
-                        "symbol": symbol,
-                        "name": info.get('longName', symbol)[:30] + "..." if len(info.get('longName', symbol)) > 30 else info.get('longName', symbol),
-                        "current_price": round(current_price, 2),
-                        "change_percent": round(change_percent, 2),
-                        "volume": volume,
-                        "market_cap": info.get('marketCap', 0)
-                    })
-                    
-            except Exception as e:
-                print(f"Error fetching trending data for {symbol}: {e}")
-                continue
-        
-        # Sort by volume (most active first)
-        trending_data.sort(key=lambda x: x['volume'], reverse=True)
-        
-        return jsonify(trending_data)
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return snapshot_response('trending')
+
+@REGISTRY.collector
+def component_metrics():
+    """Cache and stream counters the components keep themselves"""
+    info_stats = market_data.info_cache.stats
+    shared_stats = shared_cache.stats
+    stream_stats = quote_hub.stats()
+    intraday_stats = intraday.stats()
+    return [
+        ("cache_requests_total", "counter", "Cache lookups by cache and result", ("cache", "result"), {
+            ("info", "hit"): info_stats["hits"], ("info", "miss"): info_stats["misses"],
+            ("shared", "hit"): shared_stats["hits"], ("shared", "miss"): shared_stats["misses"]}),
+        ("cache_evictions_total", "counter", "Entries evicted to respect cache bounds", ("cache",),
+         {("info",): info_stats["evictions"]}),
+        ("shared_cache_computes_total", "counter", "Values computed on a shared cache miss", (),
+         {(): shared_stats["computes"]}),
+        ("cache_entries", "gauge", "Entries held in process-local caches", ("cache",),
+         {("info",): len(market_data.info_cache)}),
+        ("stream_symbols", "gauge", "Symbols with an active upstream poller", (),
+         {(): stream_stats["symbols"]}),
+        ("stream_subscribers", "gauge", "Connected streaming clients", (),
+         {(): stream_stats["subscribers"]}),
+        ("intraday_symbols", "gauge", "Symbols with an intraday ring buffer", (),
+         {(): intraday_stats["symbols"]}),
+        ("intraday_buffer_bytes", "gauge", "Memory held by intraday ring buffers", (),
+         {(): intraday_stats["bytes"]}),
+    ]
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Prometheus metrics for all worker processes on this node"""
+    return Response(worker_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def requested_symbols(data):
+    """Upper-cased symbols from a {"symbol": ...} or {"symbols": [...]} request body"""
+    symbols = data.get('symbols')
+    if symbols is None:
+        symbols = [data.get('symbol', '')]
+    if not isinstance(symbols, list):
+        return []
+    return [str(symbol).strip().upper() for symbol in symbols if str(symbol).strip()]
 
 @app.route('/api/watchlist', methods=['GET', 'POST', 'DELETE'])
 def manage_watchlist():
-    """Manage user's watchlist (simplified in-memory version)"""
-    # In a real application, this would be stored in database per user
-    # For demo purposes, we'll use a simple in-memory store
-    
-    if not hasattr(manage_watchlist, 'watchlist'):
-        manage_watchlist.watchlist = []
+    """Manage a watchlist, persisted in SQLite and keyed by ?list= (default "default")
+
+    POST/DELETE take {"symbol": "AAPL"} or {"symbols": [...]} for bulk changes.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    list_id = str(data.get('list') or request.args.get('list', 'default'))
     
     if request.method == 'GET':
-        # Return watchlist with current prices
+        # Return watchlist with current prices - one batched fetch, cached metadata
+        quotes = quote_engine.get_quotes(watchlists.symbols(list_id), with_info=True,
+                                         info_fields=('longName',))
+        
         watchlist_data = []
-        for symbol in manage_watchlist.watchlist:
-            try:
-                stock = yf.Ticker(symbol)
-                hist = stock.history(period="1d")
-                
-                if not hist.empty:
-                    current_price = float(hist['Close'].iloc[-1])
-                    info = stock.info
-                    
-                    watchlist_data.append({
-                        "symbol": symbol,
-                        "name": info.get('longName', symbol),
-                        "current_price": round(current_price, 2)
-                    })
-            except:
-                continue
+        for symbol, quote in quotes.items():
+            watchlist_data.append({
+                "symbol": symbol,
+                "name": quote['info'].get('longName', symbol),
+                "current_price": round(quote['price'], 2)
+            })
         
         return jsonify(watchlist_data)
     
-    elif request.method == 'POST':
+    symbols = requested_symbols(data)
+    
+    if request.method == 'POST':
         # Add to watchlist
-        data = request.get_json()
-        symbol = data.get('symbol', '').upper()
+        added = watchlists.add(list_id, symbols)
         
-        if symbol and symbol not in manage_watchlist.watchlist:
-            manage_watchlist.watchlist.append(symbol)
-            return jsonify({"message": f"{symbol} added to watchlist"})
-        
-        return jsonify({"error": "Invalid symbol or already in watchlist"}), 400
+        if not added:
+            return jsonify({"error": "Invalid symbol or already in watchlist"}), 400
+        if 'symbols' not in data:
+            return jsonify({"message": f"{added[0]} added to watchlist"})
+        return jsonify({"message": f"{len(added)} symbols added to watchlist", "added": added})
     
     elif request.method == 'DELETE':
         # Remove from watchlist
-        data = request.get_json()
-        symbol = data.get('symbol', '').upper()
+        removed = watchlists.remove(list_id, symbols)
         
-        if symbol in manage_watchlist.watchlist:
-            manage_watchlist.watchlist.remove(symbol)
-            return jsonify({"message": f"{symbol} removed from watchlist"})
+        if not removed:
+            return jsonify({"error": "Symbol not in watchlist"}), 400
+        if 'symbols' not in data:
+            return jsonify({"message": f"{removed[0]} removed from watchlist"})
+        return jsonify({"message": f"{len(removed)} symbols removed from watchlist", "removed": removed})
+
+def default_benchmark(symbols):
+    """NIFTY 50 for a mostly Indian watchlist, otherwise the S&P 500"""
+    indian = sum(1 for symbol in symbols if symbol.endswith(('.NS', '.BO')))
+    return '^NSEI' if indian * 2 > len(symbols) else '^GSPC'
+
+@app.route('/api/watchlist/analytics')
+def get_watchlist_analytics():
+    """Get correlation, volatility, beta and drawdowns for a watchlist (?list=, ?benchmark=)"""
+    try:
+        list_id = request.args.get('list', 'default')
+        symbols = watchlists.symbols(list_id)
+        if not symbols:
+            return jsonify({"error": "Watchlist is empty"}), 404
+        if len(symbols) > PORTFOLIO_MAX_SYMBOLS:
+            return jsonify({"error": f"Analytics cover at most {PORTFOLIO_MAX_SYMBOLS} symbols"}), 400
+        benchmark = request.args.get('benchmark', default_benchmark(symbols)).upper()
+        if benchmark not in MARKET_INDICES:
+            return jsonify({"error": f"benchmark must be one of: {', '.join(MARKET_INDICES)}"}), 400
+        
+        analytics = portfolios.analyze(symbols, benchmark)
+        analytics["list"] = list_id
+        return json_response(analytics)
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/backtest')
+def get_backtest():
+    """Get walk-forward accuracy of the trend prediction over stored daily bars
+
+    ?symbols=AAPL,MSFT (default: every listed symbol), ?years=5, ?lookback=30,
+    ?horizon=1. Reports the hit rate on direction, MAE/MAPE and how confidence
+    relates to the realized error. Only bars already in the bar store are used;
+    reports are reused for BACKTEST_CACHE_SECONDS.
+    """
+    try:
+        symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+        symbols = sorted(set(symbols)) if symbols else sorted(LISTINGS)
+        try:
+            years = int_arg('years', 5)
+            lookback = int_arg('lookback', 30)
+            horizon = int_arg('horizon', 1)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not (1 <= years <= 20 and 2 <= lookback <= 365 and 1 <= horizon <= 30):
+            return jsonify({"error": "years must be 1-20, lookback 2-365 and horizon 1-30"}), 400
+        
+        report, _ = shared_cache.get_or_compute(
+            "backtest:" + etag(symbols, years, lookback, horizon),
+            # In this process: a pool would cost more to start than the listed universe takes
+            lambda: run_backtest(market_data.store.root, symbols, years, lookback, horizon, workers=1),
+            max_age=BACKTEST_CACHE_SECONDS)
+        return json_response(report)
+    except Exception as e:
+        return error_response(e)
+
+
+def create_app():
+    """The app with its caches restored from the warm cache file and periodic saves started
 
-        return jsonify({"error": "Symbol not in watchlist"}), 400
+    This is the server entry point (gunicorn "app:create_app()"); importing
+    app.app directly still works but starts with cold caches.
+    """
+    if warm_cache is not None:
+        started = time.perf_counter()
+        restored = warm_cache.restore()
+        if restored is not None:
+            print(f"Restored warm cache in {(time.perf_counter() - started) * 1000:.1f} ms: {restored}")
+        warm_cache.start(WARM_CACHE_INTERVAL)
+    return app
 
 
 if __name__ == '__main__':
+    # The debug reloader serves from a child process (WERKZEUG_RUN_MAIN); only
+    # that one restores and saves the warm cache
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        create_app()
     app.run(debug=True, port=5000)
@@ -0,0 +1,301 @@
+"""Walk-forward backtest of the linear trend predictor
+
+Replays prediction.py's predictor over every day of every symbol's stored
+daily bars. On each day the last `lookback` closes are fitted exactly as
+/api/stock does, and the forecast for `horizon` bars later is compared with
+the close actually reported then:
+
+  hit rate     - how often the trend (sign of the fitted slope) matched the
+                 direction of the realized move (days without a move are left out)
+  MAE / MAPE   - absolute forecast error, in price and in percent of the actual
+  calibration  - hit rate and MAPE per confidence decile, plus the correlation
+                 between confidence and error; a meaningful confidence has
+                 error falling as confidence rises
+
+Every window's least-squares fit comes from cumulative sums of y, y^2 and
+index * y, so a series of n days costs a few O(n) array passes instead of n
+separate fits. The sums restart every few hundred windows around that
+stretch's own mean, so long series lose no precision to cancellation. Closes
+are read straight from the bar store's column files, without pandas or
+upstream calls. Only runs over thousands of symbols (the command line over a
+large universe) are spread over a process pool; below that, starting the
+workers costs more than it saves. Windows with a missing close are skipped.
+
+    python backtest.py                              # every listed symbol, last 5 years
+    python backtest.py --symbols AAPL,TCS.NS --years 10 --horizon 5
+    python backtest.py --fetch                      # fill the bar store from upstream first
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from bar_store import BarStore
+from metrics import timed
+from prediction import DEFAULT_HORIZON, DEFAULT_LOOKBACK
+
+CONFIDENCE_BUCKETS = 10
+
+# Measured: about 0.7 ms per symbol with 10 years of bars serially, against
+# 0.5-0.9 s to spawn the pool's workers (each imports numpy), so the pool only
+# pays off for a few thousand symbols
+PARALLEL_MIN_SYMBOLS = 2000
+
+# Windows per run of cumulative sums: short enough that differences of the sums
+# keep their precision, long enough that the overlap between runs stays small
+SUM_BLOCK = 64
+
+
+def rolling_trends(closes, lookback=DEFAULT_LOOKBACK, horizon=DEFAULT_HORIZON):
+    """(slope, forecast, r_squared) of the fit over the lookback closes ending at each day
+
+    Entries are NaN for the first lookback - 1 days and for windows with a
+    missing close. Values match prediction.fit_trends on the same window; a
+    flat window has R^2 exactly 1 rather than whatever rounding leaves.
+    """
+    y = np.asarray(closes, dtype=np.float64)
+    n = len(y)
+    slope, forecast, r_squared = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+    if n < lookback or lookback < 2:
+        return slope, forecast, r_squared
+
+    # Windows are taken in blocks, each block's closes as one row (rows overlap by
+    # lookback - 1 closes); the NaN padding only reaches windows past the end
+    windows = n - lookback + 1
+    block = max(SUM_BLOCK, lookback)
+    blocks = -(-windows // block)
+    padded = np.concatenate((y, np.full(blocks * block + lookback - 1 - n, np.nan)))
+    segments = np.lib.stride_tricks.sliding_window_view(padded, block + lookback - 1)[::block]
+
+    valid = ~np.isnan(segments)
+    # Shifting prices by a constant leaves slope and R^2 unchanged; shifting each
+    # row by its own mean keeps the sums small however far prices travel
+    offset = np.where(valid, segments, 0.0).sum(axis=1) / np.maximum(valid.sum(axis=1), 1)
+    v = np.where(valid, segments - offset[:, None], 0.0)
+    index = np.arange(segments.shape[1], dtype=np.float64)
+
+    def window_sums(values):
+        total = np.concatenate((np.zeros((blocks, 1)), np.cumsum(values, axis=1)), axis=1)
+        return total[:, lookback:] - total[:, :-lookback]
+
+    sum_y, sum_yy, sum_iy = window_sums(v), window_sums(v * v), window_sums(index * v)
+    gaps = window_sums(~valid)
+    first = np.arange(block, dtype=np.float64)
+    # Price changes inside each window (counts are exact, unlike the float sums)
+    steps = np.concatenate((np.zeros((blocks, 1)), np.diff(segments, axis=1) != 0), axis=1)
+    flat = window_sums(steps) - steps[:, :block] == 0
+
+    # Within a window x runs 0..lookback-1, so its sums are constants
+    sum_x = lookback * (lookback - 1) / 2
+    sxx = (lookback - 1) * lookback * (2 * lookback - 1) / 6 - sum_x * sum_x / lookback
+    # A flat window fits exactly; cancellation in the sums would leave noise instead
+    sxy = np.where(flat, 0.0, sum_iy - first * sum_y - sum_x * sum_y / lookback)
+    syy = np.where(flat, 0.0, sum_yy - sum_y * sum_y / lookback)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        b = sxy / sxx
+        f = sum_y / lookback + b * (lookback - 1 + horizon - sum_x / lookback) + offset[:, None]
+        ss_res = np.maximum(syy - b * sxy, 0.0)
+        r2 = np.where(syy > 0, 1.0 - ss_res / syy, np.where(ss_res > 0, 0.0, 1.0))
+    if lookback == 2:
+        # Two closes are always fitted exactly, however close together they are
+        r2 = np.ones_like(r2)
+    b, f, r2, gaps = (values.reshape(-1)[:windows] for values in (b, f, r2, gaps))
+
+    complete = gaps == 0
+    slope[lookback - 1:] = np.where(complete, b, np.nan)
+    forecast[lookback - 1:] = np.where(complete, f, np.nan)
+    r_squared[lookback - 1:] = np.where(complete, r2, np.nan)
+    return slope, forecast, r_squared
+
+
+def evaluate(timestamps, closes, start_ns=None, lookback=DEFAULT_LOOKBACK, horizon=DEFAULT_HORIZON):
+    """Summed outcomes of the predictions made on days from start_ns on (mergeable across symbols)"""
+    closes = np.asarray(closes, dtype=np.float64)
+    slope, forecast, r_squared = rolling_trends(closes, lookback, horizon)
+    made = np.arange(max(len(closes) - horizon, 0))
+    if start_ns is not None:
+        made = made[timestamps[made] >= start_ns]
+    made = made[~np.isnan(forecast[made]) & ~np.isnan(closes[made + horizon]) & ~np.isnan(closes[made])]
+
+    actual = closes[made + horizon]
+    move = np.sign(actual - closes[made])
+    trend = np.sign(slope[made])
+    moved = (move != 0) & (trend != 0)
+    hit = moved & (move == trend)
+    error = np.abs(forecast[made] - actual)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_error = np.where(actual != 0, error / np.abs(actual) * 100, np.nan)
+    confidence = r_squared[made] * 100
+    bucket = np.minimum((confidence // (100 / CONFIDENCE_BUCKETS)).astype(np.int64), CONFIDENCE_BUCKETS - 1)
+    pct_error = np.nan_to_num(pct_error)
+
+    def per_bucket(weights=None):
+        return np.bincount(bucket, weights, minlength=CONFIDENCE_BUCKETS).tolist()
+
+    return {
+        "predictions": len(made),
+        "hits": int(hit.sum()),
+        "moves": int(moved.sum()),
+        "abs_error": float(error.sum()),
+        "abs_pct_error": float(pct_error.sum()),
+        "buckets": {"predictions": per_bucket(), "hits": per_bucket(hit), "moves": per_bucket(moved),
+                    "abs_pct_error": per_bucket(pct_error)},
+        # Sums for the confidence / error correlation across every prediction
+        "moments": [float(confidence.sum()), float(pct_error.sum()), float((confidence ** 2).sum()),
+                    float((pct_error ** 2).sum()), float((confidence * pct_error).sum())],
+    }
+
+
+def _evaluate_symbols(root, symbols, start_ns, lookback, horizon):
+    """Pool task: {symbol: evaluate() sums, or None without enough stored bars}"""
+    store = BarStore(root)
+    results = {}
+    for symbol in symbols:
+        columns = store.columns(symbol, ("ts", "Close"))
+        if len(columns["ts"]) <= lookback + horizon:
+            results[symbol] = None
+            continue
+        results[symbol] = evaluate(columns["ts"], columns["Close"], start_ns, lookback, horizon)
+    return results
+
+
+def _rate(numerator, denominator, digits=2):
+    return round(numerator / denominator * 100, digits) if denominator else None
+
+
+def _correlation(count, moments):
+    sum_c, sum_e, sum_cc, sum_ee, sum_ce = moments
+    denominator = math.sqrt(max(count * sum_cc - sum_c ** 2, 0.0) * max(count * sum_ee - sum_e ** 2, 0.0))
+    return round((count * sum_ce - sum_c * sum_e) / denominator, 3) if denominator else None
+
+
+def summarize(results):
+    """Report over all evaluated symbols, with per-symbol figures and confidence calibration"""
+    evaluated = {symbol: result for symbol, result in results.items() if result and result["predictions"]}
+    totals = {"predictions": 0, "hits": 0, "moves": 0, "abs_pct_error": 0.0}
+    buckets = {name: np.zeros(CONFIDENCE_BUCKETS) for name in ("predictions", "hits", "moves", "abs_pct_error")}
+    moments = np.zeros(5)
+    per_symbol = {}
+    for symbol, result in evaluated.items():
+        for name in totals:
+            totals[name] += result[name]
+        for name in buckets:
+            buckets[name] += result["buckets"][name]
+        moments += result["moments"]
+        per_symbol[symbol] = {
+            "predictions": result["predictions"],
+            "hit_rate": _rate(result["hits"], result["moves"]),
+            "mae": round(result["abs_error"] / result["predictions"], 4),
+            "mape": round(result["abs_pct_error"] / result["predictions"], 3),
+        }
+
+    buckets = {name: values.tolist() for name, values in buckets.items()}
+    width = 100 // CONFIDENCE_BUCKETS
+    calibration = [{
+        "confidence": f"{i * width}-{(i + 1) * width}",
+        "predictions": int(buckets["predictions"][i]),
+        "hit_rate": _rate(buckets["hits"][i], buckets["moves"][i]),
+        "mape": round(buckets["abs_pct_error"][i] / buckets["predictions"][i], 3),
+    } for i in range(CONFIDENCE_BUCKETS) if buckets["predictions"][i]]
+    return {
+        "symbols": len(evaluated),
+        "missing": [symbol for symbol in results if symbol not in evaluated],
+        "predictions": totals["predictions"],
+        "hit_rate": _rate(totals["hits"], totals["moves"]),
+        "mape": round(totals["abs_pct_error"] / totals["predictions"], 3) if totals["predictions"] else None,
+        "confidence_error_correlation": _correlation(totals["predictions"], moments),
+        "calibration": calibration,
+        "per_symbol": per_symbol,
+    }
+
+
+@timed("backtest")
+def run_backtest(store_root, symbols, years=5, lookback=DEFAULT_LOOKBACK, horizon=DEFAULT_HORIZON, workers=None):
+    """Backtest report for symbols over the last `years` years of stored daily bars
+
+    workers defaults to one per CPU but is only used for PARALLEL_MIN_SYMBOLS
+    symbols or more; workers=1 always runs in this process.
+    """
+    started = time.perf_counter()
+    symbols = list(dict.fromkeys(symbols))
+    # Bar store timestamps are exchange wall-clock times
+    start_ns = int(np.datetime64(datetime.now() - timedelta(days=round(365.25 * years)), 'ns').astype(np.int64))
+    workers = workers or os.cpu_count() or 1
+
+    results = {}
+    if workers <= 1 or len(symbols) < PARALLEL_MIN_SYMBOLS:
+        results = _evaluate_symbols(store_root, symbols, start_ns, lookback, horizon)
+    else:
+        # A few chunks per worker evens out symbols with short histories; spawned workers
+        # do not inherit the server's threads and locks
+        size = math.ceil(len(symbols) / (workers * 4))
+        chunks = [symbols[i:i + size] for i in range(0, len(symbols), size)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_evaluate_symbols, store_root, chunk, start_ns, lookback, horizon)
+                       for chunk in chunks]
+            for future in futures:
+                results.update(future.result())
+
+    report = summarize(results)
+    report.update(years=years, lookback=lookback, horizon=horizon,
+                  elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+    return report
+
+
+def print_report(report):
+    print(f"{report['symbols']} symbols, {report['predictions']} predictions "
+          f"({report['years']}y, lookback {report['lookback']}, horizon {report['horizon']}) "
+          f"in {report['elapsed_ms']} ms")
+    print(f"hit rate {report['hit_rate']}%  MAPE {report['mape']}%  "
+          f"confidence/error correlation {report['confidence_error_correlation']}")
+    print(f"{'confidence':<12}{'predictions':>12}{'hit rate %':>12}{'MAPE %':>10}")
+    for row in report["calibration"]:
+        print(f"{row['confidence']:<12}{row['predictions']:>12}{str(row['hit_rate']):>12}{row['mape']:>10}")
+    if report["missing"]:
+        print(f"no stored history: {', '.join(report['missing'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", help="comma-separated symbols (default: every listed symbol)")
+    parser.add_argument("--years", type=int, default=5, help="predictions made in the last N years")
+    parser.add_argument("--lookback", type=int, default=DEFAULT_LOOKBACK)
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON)
+    parser.add_argument("--workers", type=int, help="processes for runs over 2000+ symbols (default: one per CPU)")
+    parser.add_argument("--fetch", action="store_true", help="download missing history into the bar store first")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as appmod
+    from gateway import BACKGROUND, priority
+
+    symbols = ([symbol.strip().upper() for symbol in args.symbols.split(",") if symbol.strip()]
+               if args.symbols else list(appmod.LISTINGS))
+    if args.fetch:
+        # The fit needs lookback bars before the first prediction
+        start = datetime.now() - timedelta(days=round(365.25 * args.years) + args.lookback * 2)
+        with priority(BACKGROUND):
+            for i in range(0, len(symbols), 500):
+                appmod.market_data.bars_many(symbols[i:i + 500], start)
+
+    report = run_backtest(appmod.market_data.store.root, symbols, args.years, args.lookback, args.horizon,
+                          args.workers)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
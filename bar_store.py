@@ -0,0 +1,290 @@
+"""Append-only columnar OHLCV store, one flat binary file per column"""
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows - series locks are then per process only
+    fcntl = None
+
+import numpy as np
+
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+# Column order in the store - matches the frames returned by yfinance
+COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+
+# Timestamps are int64 nanoseconds of exchange wall-clock time, values are float64
+TS_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f8')
+
+# Corporate action columns of a yfinance history() frame (not stored)
+ACTIONS = ("Stock Splits", "Dividends")
+
+# Relative change of a re-read bar's open that means upstream re-adjusted the history
+RESTATE_TOLERANCE = 1e-4
+
+
+class SeriesLock:
+    """Re-entrant lock that also excludes other processes (flock on a lock file)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and fcntl is not None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+def empty_frame():
+    """Empty OHLCV frame with the same shape as a yfinance history() result"""
+    return pd.DataFrame({name: pd.Series(dtype='float64') for name in COLUMNS},
+                        index=pd.DatetimeIndex([]))
+
+
+def frame_timestamps(frame):
+    """Wall-clock int64 ns timestamps for a frame index (timezone stripped)"""
+    index = frame.index
+    if getattr(index, 'tz', None) is not None:
+        index = index.tz_localize(None)
+    return index.values.astype('datetime64[ns]').astype(TS_DTYPE)
+
+
+class BarStore:
+    """Per-symbol bar files under root/<SYMBOL>/<interval>/
+
+    Each column lives in its own file (ts.bin, open.bin, ...) so a reader can
+    memory-map just the columns and rows it needs. Writes only ever append or
+    truncate the tail, except for backfills which rewrite the whole series.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def lock(self, symbol, interval='1d'):
+        """Lock serialising fetch + write for one series across threads and worker processes"""
+        key = (symbol.upper(), interval)
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = SeriesLock(os.path.join(self._dir(symbol, interval), '.lock'))
+            return self._locks[key]
+
+    def _dir(self, symbol, interval):
+        safe_symbol = symbol.upper().replace('/', '_').replace(os.sep, '_')
+        return os.path.join(self.root, safe_symbol, interval)
+
+    def _path(self, symbol, interval, name):
+        return os.path.join(self._dir(symbol, interval), name.lower() + '.bin')
+
+    def _length(self, symbol, interval):
+        # A torn write can leave columns with different lengths; trust the shortest
+        lengths = []
+        for name in ('ts',) + COLUMNS:
+            path = self._path(symbol, interval, name)
+            if not os.path.exists(path):
+                return 0
+            lengths.append(os.path.getsize(path) // 8)
+        return min(lengths)
+
+    def read_meta(self, symbol, interval='1d'):
+        """Series metadata (timezone, earliest requested start)"""
+        path = os.path.join(self._dir(symbol, interval), 'meta.json')
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self, symbol, interval='1d', **updates):
+        meta = self.read_meta(symbol, interval)
+        meta.update(updates)
+        directory = self._dir(symbol, interval)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+    def _map(self, symbol, interval, name, dtype, length):
+        return np.memmap(self._path(symbol, interval, name), dtype=dtype, mode='r', shape=(length,))
+
+    def timestamps(self, symbol, interval='1d'):
+        """Stored timestamps as an int64 ns array"""
+        length = self._length(symbol, interval)
+        if length == 0:
+            return np.empty(0, dtype=TS_DTYPE)
+        return np.array(self._map(symbol, interval, 'ts', TS_DTYPE, length))
+
+    def columns(self, symbol, names, interval='1d'):
+        """{name: array} of stored columns ('ts' or OHLCV names), equal length, without building a frame"""
+        length = self._length(symbol, interval)
+        arrays = {}
+        for name in names:
+            dtype = TS_DTYPE if name == 'ts' else VALUE_DTYPE
+            arrays[name] = (np.array(self._map(symbol, interval, name, dtype, length)) if length
+                            else np.empty(0, dtype=dtype))
+        return arrays
+
+    def last_timestamp(self, symbol, interval='1d'):
+        """Timestamp of the newest stored bar, or None if the series is empty"""
+        length = self._length(symbol, interval)
+        if length == 0:
+            return None
+        return self._to_timestamp(symbol, interval, int(self._map(symbol, interval, 'ts', TS_DTYPE, length)[-1]))
+
+    def _to_timestamp(self, symbol, interval, value):
+        stamp = pd.Timestamp(value, unit='ns')
+        tz = self.read_meta(symbol, interval).get('tz')
+        return stamp.tz_localize(tz) if tz else stamp
+
+    def load(self, symbol, interval='1d', start=None, end=None):
+        """Load stored bars in [start, end) as a yfinance-shaped DataFrame"""
+        length = self._length(symbol, interval)
+        if length == 0:
+            return empty_frame()
+
+        ts = self._map(symbol, interval, 'ts', TS_DTYPE, length)
+        lo = 0 if start is None else int(np.searchsorted(ts, _wall_clock_ns(start), side='left'))
+        hi = length if end is None else int(np.searchsorted(ts, _wall_clock_ns(end), side='left'))
+
+        # Copy the slice out: the tail of the files may be truncated by a later write
+        index = pd.DatetimeIndex(np.array(ts[lo:hi]).astype('datetime64[ns]'))
+        tz = self.read_meta(symbol, interval).get('tz')
+        if tz:
+            index = index.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+        data = {name: np.array(self._map(symbol, interval, name, VALUE_DTYPE, length)[lo:hi])
+                for name in COLUMNS}
+        return pd.DataFrame(data, index=index)
+
+    def write(self, symbol, frame, interval='1d'):
+        """Merge a freshly fetched frame into the stored series
+
+        Bars at or after the first fetched timestamp are replaced, so a delta
+        fetch that re-reads the last (possibly still forming) bar overwrites it.
+        """
+        if frame.empty:
+            return
+        frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        new_ts = frame_timestamps(frame)
+        tz = getattr(frame.index, 'tz', None)
+        if tz is not None and not self.read_meta(symbol, interval).get('tz'):
+            self.write_meta(symbol, interval, tz=str(tz))
+
+        stored_ts = self.timestamps(symbol, interval)
+        keep = int(np.searchsorted(stored_ts, new_ts[0], side='left'))
+        if stored_ts.size and stored_ts[-1] > new_ts[-1]:
+            # Backfill in the middle or front of the series - rewrite everything
+            self._rewrite(symbol, interval, stored_ts, keep, frame, new_ts)
+            return
+
+        self._truncate(symbol, interval, keep)
+        self._append(symbol, interval, frame, new_ts)
+
+    def replace(self, symbol, frame, interval='1d'):
+        """Replace the whole stored series with frame (e.g. a full refetch after a split)"""
+        if frame.empty:
+            return
+        frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        tz = getattr(frame.index, 'tz', None)
+        if tz is not None:
+            self.write_meta(symbol, interval, tz=str(tz))
+        self._replace_columns(symbol, interval, frame_timestamps(frame),
+                              {name: frame[name].to_numpy(dtype=VALUE_DTYPE, na_value=np.nan) for name in COLUMNS})
+
+    def restates(self, symbol, frame, interval='1d'):
+        """True if a delta fetch shows that upstream re-adjusted the stored history
+
+        Prices are split- and dividend-adjusted, so a split or dividend on a
+        bar newer than the stored ones rescales every stored bar, and so does
+        one the store missed - which shows as the re-read newest bar's open no
+        longer matching the stored one.
+        """
+        length = self._length(symbol, interval)
+        if frame.empty or length == 0:
+            return False
+        last = int(self._map(symbol, interval, 'ts', TS_DTYPE, length)[-1])
+        new_ts = frame_timestamps(frame)
+        newer = new_ts > last
+        for action in ACTIONS:
+            if action in frame.columns:
+                values = np.nan_to_num(frame[action].to_numpy(dtype=VALUE_DTYPE, na_value=np.nan))
+                if (values[newer] != 0).any():
+                    return True
+        overlap = np.flatnonzero(new_ts == last)
+        if not len(overlap):
+            return False
+        stored = float(self._map(symbol, interval, 'Open', VALUE_DTYPE, length)[-1])
+        fetched = float(frame['Open'].iloc[overlap[-1]])
+        # NaN compares unequal to itself - a missing open proves nothing
+        if stored != stored or fetched != fetched:
+            return False
+        return abs(fetched - stored) > RESTATE_TOLERANCE * abs(stored)
+
+    def _truncate(self, symbol, interval, length):
+        # Timestamps go first so a reader never sees a ts row without its values
+        for name in ('ts',) + COLUMNS:
+            path = self._path(symbol, interval, name)
+            if os.path.exists(path) and os.path.getsize(path) > length * 8:
+                os.truncate(path, length * 8)
+
+    def _append(self, symbol, interval, frame, new_ts):
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        for name in COLUMNS:
+            values = frame[name].to_numpy(dtype=VALUE_DTYPE, na_value=np.nan)
+            with open(self._path(symbol, interval, name), 'ab') as f:
+                f.write(values.tobytes())
+        with open(self._path(symbol, interval, 'ts'), 'ab') as f:
+            f.write(new_ts.tobytes())
+
+    def _rewrite(self, symbol, interval, stored_ts, keep, frame, new_ts):
+        stored = self.load(symbol, interval)
+        after = int(np.searchsorted(stored_ts, new_ts[-1], side='right'))
+        merged_ts = np.concatenate([stored_ts[:keep], new_ts, stored_ts[after:]])
+        columns = {name: np.concatenate([
+            stored[name].to_numpy(dtype=VALUE_DTYPE)[:keep],
+            frame[name].to_numpy(dtype=VALUE_DTYPE, na_value=np.nan),
+            stored[name].to_numpy(dtype=VALUE_DTYPE)[after:],
+        ]) for name in COLUMNS}
+        self._replace_columns(symbol, interval, merged_ts, columns)
+
+    def _replace_columns(self, symbol, interval, ts, columns):
+        directory = self._dir(symbol, interval)
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS:
+            _replace_file(os.path.join(directory, name.lower() + '.bin'), columns[name])
+        _replace_file(os.path.join(directory, 'ts.bin'), ts)
+
+
+def _wall_clock_ns(value):
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is not None:
+        stamp = stamp.tz_localize(None)
+    return stamp.to_datetime64().astype('datetime64[ns]').astype(TS_DTYPE)
+
+
+def _replace_file(path, values):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(values.tobytes())
+    os.replace(tmp_path, path)
@@ -0,0 +1,366 @@
+"""Endpoint benchmark against replayed market data
+
+Drives every API route concurrently through the Flask test client with the
+fixture provider standing in for Yahoo (MARKET_DATA_LATENCY_MS of simulated
+round trip per upstream call) and reports latency percentiles, throughput and
+upstream call counts per scenario.
+
+    python benchmark.py                         # synthetic fixtures, print results
+    python benchmark.py --fixtures fixtures     # replay recorded fixtures
+    python benchmark.py --save-baseline         # store results as the baseline
+    python benchmark.py --compare               # exit 1 on regressions vs the baseline
+    python benchmark.py --startup               # import time and time to first response
+
+Fixtures can be recorded from live traffic with MARKET_DATA_PROVIDER=record.
+The SSE stream endpoint is long-lived and is not benchmarked.
+
+--startup boots the app in fresh processes instead: once cold (empty bar store,
+no warm cache file) and once warm (restored from the warm cache file a previous
+process saved), reporting the median import time, create_app() time, the
+latency of the first request to each of a few endpoints and the upstream calls
+those first requests made.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy import lazy_import
+
+# Deferred so a --startup probe process measures the app's own imports only
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+# First requests timed by --startup: static page, a snapshot, a cached quote, a full stock payload
+STARTUP_PATHS = ("/", "/api/market-status", "/api/real-time/AAPL", "/api/stock/AAPL")
+
+# Startup timings of a few ms jitter by more than any relative tolerance
+STARTUP_NOISE_MS = 5
+
+
+def synthesize_fixtures(root, symbols, days=400, seed=7):
+    """Random-walk daily and 1-minute bars plus info for each symbol"""
+    rng = np.random.default_rng(seed)
+    for symbol in symbols:
+        directory = os.path.join(root, symbol.upper())
+        os.makedirs(directory, exist_ok=True)
+        tz = "Asia/Kolkata" if symbol.endswith((".NS", ".BO")) or symbol in ("^NSEI", "^BSESN") \
+            else "America/New_York"
+        start_price = rng.uniform(50, 500)
+
+        daily_index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=days).tz_localize(tz)
+        _write_bars(os.path.join(directory, "1d.csv"), daily_index, start_price, rng)
+
+        session_open = daily_index[-1] + pd.Timedelta(hours=9, minutes=30)
+        minute_index = pd.date_range(session_open, periods=390, freq="min")
+        _write_bars(os.path.join(directory, "1m.csv"), minute_index, start_price, rng, scale=0.001)
+
+        info = {"longName": f"{symbol} Synthetic", "shortName": symbol, "currency": "USD",
+                "exchangeTimezoneName": tz, "marketCap": int(rng.uniform(1e9, 1e12)),
+                "trailingPE": round(float(rng.uniform(5, 60)), 2), "previousClose": round(start_price, 2),
+                "volume": int(rng.uniform(1e5, 1e7))}
+        with open(os.path.join(directory, "info.json"), "w") as f:
+            json.dump(info, f)
+
+
+def _write_bars(path, index, start_price, rng, scale=0.02):
+    close = start_price * np.exp(np.cumsum(rng.normal(0, scale, len(index))))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    spread = np.abs(rng.normal(0, scale / 2, len(index))) * close
+    frame = pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) + spread,
+        "Low": np.minimum(open_, close) - spread,
+        "Close": close,
+        "Volume": rng.integers(1e4, 1e7, len(index)).astype(float),
+    }, index=index)
+    frame.to_csv(path)
+
+
+def build_scenarios(appmod):
+    """{name: [(method, path, json body)]} - each scenario cycles through its requests"""
+    symbols = [company["symbol"] for company in appmod.COMPANIES]
+    queries = ["app", "tcs", "bank", "tech", "m", "reliance", "micro", "india"]
+
+    def get(paths):
+        return [("GET", path, None) for path in paths]
+
+    return {
+        "stock": get(f"/api/stock/{symbol}" for symbol in symbols),
+        "stock-columnar": get(f"/api/stock/{symbol}?format=columnar&indicators=ema12,macd,bb20"
+                              for symbol in symbols),
+        "stocks-batch": [("POST", "/api/stocks/batch", {"symbols": symbols, "indicators": "ema12,macd"})],
+        "search": get(f"/api/search/{query}" for query in queries),
+        "screen": get(["/api/screen?filter=rsi14<70,close>sma50&sort=-change_pct&limit=10",
+                       "/api/screen?sort=-ret5&limit=20"]),
+        "search-quotes": get(f"/api/search/{query}?quotes=1" for query in queries),
+        "real-time": get(f"/api/real-time/{symbol}" for symbol in symbols),
+        "intraday": get(f"/api/intraday/{symbol}?format=columnar" for symbol in symbols),
+        "market-summary": get(["/api/market-summary"]),
+        "market-status": get(["/api/market-status"]),
+        "trending": get(["/api/trending"]),
+        "watchlist": get(["/api/watchlist?list=benchmark"]),
+        "portfolio": get(["/api/watchlist/analytics?list=benchmark"]),
+        "watchlist-write": [("POST", "/api/watchlist?list=benchmark-writes", {"symbols": symbols}),
+                            ("DELETE", "/api/watchlist?list=benchmark-writes", {"symbols": symbols})],
+    }
+
+
+def _percentiles(latencies):
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return round(float(p50), 2), round(float(p95), 2), round(float(p99), 2)
+
+
+def run_scenario(appmod, provider, requests, total, concurrency):
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = appmod.app.test_client()
+        return local.client
+
+    def call(i):
+        method, path, body = requests[i % len(requests)]
+        started = time.perf_counter()
+        response = client().open(path, method=method, json=body)
+        response.get_data()
+        return time.perf_counter() - started, response.status_code
+
+    calls_before = Counter(provider.calls)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+    upstream = Counter(provider.calls)
+    upstream.subtract(calls_before)
+
+    latencies = [latency for latency, _ in results]
+    p50, p95, p99 = _percentiles(latencies)
+    return {
+        "requests": total,
+        "errors": sum(1 for _, status in results if status >= 500),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "rps": round(total / elapsed, 1),
+        "upstream_calls": {kind: count for kind, count in sorted(upstream.items()) if count},
+    }
+
+
+def startup_probe(paths):
+    """Child side of --startup: import and create the app, then time one request per path"""
+    started = time.perf_counter()
+    import app as appmod
+    imported = time.perf_counter()
+    client = appmod.create_app().test_client()
+    created = time.perf_counter()
+    first_response = {}
+    for path in paths:
+        request_started = time.perf_counter()
+        client.get(path).get_data()
+        first_response[path] = round((time.perf_counter() - request_started) * 1000, 2)
+    print(json.dumps({
+        "import_ms": round((imported - started) * 1000, 2),
+        "factory_ms": round((created - imported) * 1000, 2),
+        "first_response_ms": first_response,
+        "upstream_calls": dict(sorted(appmod.market_data.provider.calls.items())),
+    }))
+    # The warm cache is saved at exit
+    return 0
+
+
+def _probe(workdir, warm_file, paths, bars=None):
+    """Run startup_probe in a new process with its own shared cache and bar store (a copy of bars)"""
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    if bars is not None:
+        shutil.copytree(bars, os.path.join(workdir, "bars"))
+    env = dict(os.environ, BAR_STORE_DIR=os.path.join(workdir, "bars"),
+               SHARED_CACHE="file:" + os.path.join(workdir, "cache"), WARM_CACHE_FILE=warm_file)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--startup-probe", ",".join(paths)],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _median_startup(probes):
+    def median(values):
+        return round(float(np.median(values)), 2)
+
+    calls = Counter()
+    for probe in probes:
+        calls.update(probe["upstream_calls"])
+    return {
+        "runs": len(probes),
+        "import_ms": median([probe["import_ms"] for probe in probes]),
+        "factory_ms": median([probe["factory_ms"] for probe in probes]),
+        "first_response_ms": {path: median([probe["first_response_ms"][path] for probe in probes])
+                              for path in probes[0]["first_response_ms"]},
+        "upstream_calls": {kind: round(count / len(probes), 1) for kind, count in sorted(calls.items())},
+    }
+
+
+def run_startup(workdir, runs, paths=STARTUP_PATHS):
+    """{"startup-cold": ..., "startup-warm": ...} medians over runs fresh processes each"""
+    run_dir = os.path.join(workdir, "startup")
+    warm_file = os.path.join(workdir, "warm_cache.bin")
+    cold = [_probe(run_dir, os.path.join(run_dir, "warm_cache.bin"), paths) for _ in range(runs)]
+    # One process fills the caches and saves them; each warm run restarts from its bar store and file
+    prep_dir = os.path.join(workdir, "startup-prep")
+    _probe(prep_dir, warm_file, paths)
+    warm = [_probe(run_dir, warm_file, paths, bars=os.path.join(prep_dir, "bars")) for _ in range(runs)]
+    return {"startup-cold": _median_startup(cold), "startup-warm": _median_startup(warm)}
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for scenarios that got slower or call upstream more often"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if "import_ms" in result:
+            regressions.extend(_compare_startup(name, result, base, tolerance))
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rps']} req/s vs baseline {base['rps']} req/s")
+        calls = sum(result["upstream_calls"].values())
+        base_calls = sum(base["upstream_calls"].values())
+        # Call counts shift a little with thread interleaving under load
+        if calls > base_calls * (1 + tolerance):
+            regressions.append(f"{name}: {calls} upstream calls vs baseline {base_calls}")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name}: {result['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+
+def _compare_startup(name, result, base, tolerance):
+    regressions = []
+    timings = [("import", result["import_ms"], base["import_ms"])]
+    timings += [(f"first {path}", ms, base["first_response_ms"][path])
+                for path, ms in result["first_response_ms"].items() if path in base["first_response_ms"]]
+    for label, ms, base_ms in timings:
+        if ms > base_ms * (1 + tolerance) + STARTUP_NOISE_MS:
+            regressions.append(f"{name}: {label} {ms}ms vs baseline {base_ms}ms")
+    calls = sum(result["upstream_calls"].values())
+    base_calls = sum(base["upstream_calls"].values())
+    if calls > base_calls * (1 + tolerance):
+        regressions.append(f"{name}: {calls} upstream calls vs baseline {base_calls}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<16}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}  upstream")
+    for name, result in results.items():
+        upstream = ", ".join(f"{kind}={count}" for kind, count in result["upstream_calls"].items()) or "-"
+        print(f"{name:<16}{result['requests']:>6}{result['errors']:>5}{result['p50_ms']:>9}"
+              f"{result['p95_ms']:>9}{result['p99_ms']:>9}{result['rps']:>9}  {upstream}")
+
+
+def print_startup_table(results):
+    paths = list(next(iter(results.values()))["first_response_ms"])
+    print(f"{'startup':<16}{'import ms':>11}{'create ms':>11}" + "".join(f"{path:>22}" for path in paths)
+          + "  upstream")
+    for name, result in results.items():
+        upstream = ", ".join(f"{kind}={count}" for kind, count in result["upstream_calls"].items()) or "-"
+        print(f"{name:<16}{result['import_ms']:>11}{result['factory_ms']:>11}"
+              + "".join(f"{result['first_response_ms'][path]:>22}" for path in paths) + f"  {upstream}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="recorded fixture directory (default: synthetic data)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50, help="simulated upstream latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--scenarios", help="comma-separated subset of scenarios to run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="exit 1 if a scenario regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative drift in p95, throughput and upstream calls")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--startup", action="store_true", help="measure cold and warm process startup")
+    parser.add_argument("--runs", type=int, default=5, help="processes per --startup measurement")
+    parser.add_argument("--startup-probe", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.startup_probe:
+        return startup_probe(args.startup_probe.split(","))
+
+    # Isolated state: nothing is shared with a running server or a previous run
+    workdir = tempfile.mkdtemp(prefix="stock-dashboard-bench-")
+    fixtures = args.fixtures or os.path.join(workdir, "fixtures")
+    os.environ.update({
+        "MARKET_DATA_PROVIDER": "fixture",
+        "MARKET_DATA_FIXTURES": fixtures,
+        "MARKET_DATA_LATENCY_MS": str(args.latency_ms),
+        "MARKET_DATA_JITTER_MS": str(args.jitter_ms),
+        "MARKET_CALENDAR": "24x7",
+        "UPSTREAM_RATE_PER_HOUR": "0",
+        "BAR_STORE_DIR": os.path.join(workdir, "bars"),
+        "SHARED_CACHE": "file:" + os.path.join(workdir, "cache"),
+        "WATCHLIST_DB": os.path.join(workdir, "watchlist.db"),
+        "WARM_CACHE_FILE": os.path.join(workdir, "warm_cache.bin"),
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as appmod
+
+    if not args.fixtures:
+        symbols = {stock["symbol"] for stock in appmod.EXTENDED_STOCKS}
+        symbols.update(company["symbol"] for company in appmod.COMPANIES)
+        symbols.update(appmod.MARKET_INDICES)
+        symbols.update(appmod.TRENDING_SYMBOLS)
+        synthesize_fixtures(fixtures, sorted(symbols))
+    appmod.watchlists.add("benchmark", [company["symbol"] for company in appmod.COMPANIES[:6]])
+
+    if args.startup:
+        results = run_startup(workdir, args.runs)
+        print_startup_table(results)
+    else:
+        provider = appmod.market_data.provider
+        selected = set(args.scenarios.split(",")) if args.scenarios else None
+        results = {}
+        for name, requests in build_scenarios(appmod).items():
+            if selected is not None and name not in selected:
+                continue
+            results[name] = run_scenario(appmod, provider, requests, args.requests, args.concurrency)
+        print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        # Startup and endpoint results share one baseline file
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}")
+            return 1
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
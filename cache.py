@@ -0,0 +1,173 @@
+"""In-process caches for upstream lookups"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from gateway import note_stale
+
+# Seconds a cached ticker.info field stays fresh. Static descriptive fields
+# change rarely; anything price-like goes stale quickly.
+INFO_FIELD_TTLS = {
+    "longName": 24 * 3600,
+    "shortName": 24 * 3600,
+    "currency": 24 * 3600,
+    "exchangeTimezoneName": 24 * 3600,
+    "sector": 24 * 3600,
+    "industry": 24 * 3600,
+    "trailingPE": 3600,
+    "previousClose": 3600,
+    "marketCap": 15 * 60,
+    "volume": 60,
+}
+DEFAULT_INFO_TTL = 10 * 60
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one execution
+
+    The first caller runs the function; callers that arrive while it is in
+    flight wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"event": threading.Event(), "result": None, "error": None}
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["event"].set()
+
+
+class InfoCache:
+    """LRU cache of ticker.info dicts with per-field freshness
+
+    A lookup names the fields it needs; the cached dict is served only if each
+    of those fields is younger than its TTL. The cache is bounded both by entry
+    count and by the approximate serialized size of the stored dicts. If a
+    refresh fails, the expired entry is served (and reported stale). With a
+    shared cache, a local miss is first looked up there, so only one worker
+    process fetches a given symbol's info. With a session calendar, info
+    fetched after the symbol's market closed stays fresh until it reopens.
+    """
+
+    def __init__(self, fetch, field_ttls=None, default_ttl=DEFAULT_INFO_TTL,
+                 max_entries=2000, max_bytes=32 * 1024 * 1024, shared=None, sessions=None):
+        self.fetch = fetch
+        self.shared = shared
+        self.sessions = sessions
+        self.field_ttls = INFO_FIELD_TTLS if field_ttls is None else field_ttls
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _ttl(self, fields):
+        if not fields:
+            return self.default_ttl
+        return min(self.field_ttls.get(field, self.default_ttl) for field in fields)
+
+    def get(self, symbol, fields=None):
+        """Info dict for symbol, refetched only if a requested field is stale"""
+        key = symbol.upper()
+        ttl = self._ttl(fields)
+        if self.sessions is not None:
+            ttl = self.sessions.max_age(key, ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["fetched_at"] < ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry["info"]
+            self.stats["misses"] += 1
+
+        return self._flight.do(key, lambda: self._refresh(key, symbol, ttl))
+
+    def _refresh(self, key, symbol, ttl):
+        try:
+            return self._fetch(key, symbol, ttl)
+        except Exception:
+            with self._lock:
+                entry = self._entries.get(key)
+            info = entry["info"] if entry is not None else None
+            if info is None and self.shared is not None:
+                # Another worker may still hold an older copy
+                cached = self.shared.get("info:" + key)
+                info = cached[0] if cached is not None else None
+            if info is None:
+                raise
+            note_stale("info")
+            return info
+
+    def _fetch(self, key, symbol, ttl):
+        if self.shared is None:
+            info = self.fetch(symbol) or {}
+            self.put(key, info)
+            return info
+
+        longest_ttl = max([self.default_ttl] + list(self.field_ttls.values()))
+        if self.sessions is not None:
+            longest_ttl = self.sessions.expires_in(key, longest_ttl)
+        info, fetched_at = self.shared.get_or_compute("info:" + key, lambda: self.fetch(symbol) or {},
+                                                      max_age=ttl, ttl=longest_ttl)
+        self.put(key, info, fetched_at)
+        return info
+
+    def put(self, symbol, info, fetched_at=None):
+        key = symbol.upper()
+        size = len(json.dumps(info, default=str))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old["size"]
+            self._entries[key] = {"info": info, "size": size,
+                                  "fetched_at": time.time() if fetched_at is None else fetched_at}
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+                self.stats["evictions"] += 1
+
+    def export(self):
+        """[(symbol, info, fetched_at)] least recently used first"""
+        with self._lock:
+            return [(key, entry["info"], entry["fetched_at"]) for key, entry in self._entries.items()]
+
+    def restore(self, entries):
+        """Re-add exported entries with their original fetch times (symbols already cached are kept)"""
+        for symbol, info, fetched_at in entries:
+            if symbol.upper() not in self._entries:
+                self.put(symbol, info, fetched_at)
+
+    def invalidate(self, symbol):
+        with self._lock:
+            entry = self._entries.pop(symbol.upper(), None)
+            if entry is not None:
+                self._bytes -= entry["size"]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,71 @@
+"""Shape-preserving downsampling of bar series for charts
+
+A chart a few hundred pixels wide cannot show more points than it has pixels,
+so long or fine-grained ranges are reduced on the server before serializing:
+
+  ohlc  - consecutive bars are merged into max_points buckets (first open,
+          highest high, lowest low, last close, summed volume), so every point
+          is still a valid bar and no extreme is lost
+  lttb  - Largest-Triangle-Three-Buckets picks the max_points real bars that
+          best preserve the visual shape of the close line
+"""
+import numpy as np
+
+METHODS = ("ohlc", "lttb")
+
+
+def _bucket_starts(length, buckets):
+    """First row of each of buckets near-equal runs over length rows"""
+    return np.unique(np.arange(buckets) * length // buckets)
+
+
+def ohlc_buckets(frame, max_points):
+    """Merge runs of consecutive bars into at most max_points bars, stamped with each run's first bar"""
+    if len(frame) <= max_points:
+        return frame
+    starts = _bucket_starts(len(frame), max_points)
+    ends = np.append(starts[1:], len(frame)) - 1
+    merged = frame.iloc[starts].copy()
+    merged["Open"] = frame["Open"].to_numpy()[starts]
+    merged["High"] = np.maximum.reduceat(frame["High"].to_numpy(dtype=np.float64), starts)
+    merged["Low"] = np.minimum.reduceat(frame["Low"].to_numpy(dtype=np.float64), starts)
+    merged["Close"] = frame["Close"].to_numpy()[ends]
+    merged["Volume"] = np.add.reduceat(frame["Volume"].to_numpy(dtype=np.float64), starts)
+    return merged
+
+
+def lttb_indices(values, max_points):
+    """Row indices Largest-Triangle-Three-Buckets keeps from a series (x is the row number)"""
+    length = len(values)
+    if length <= max_points:
+        return np.arange(length)
+    if max_points < 3:
+        return np.linspace(0, length - 1, max_points).astype(np.int64)
+    y = np.asarray(values, dtype=np.float64)
+    # First and last points are always kept; the rest is split into max_points - 2 buckets
+    edges = 1 + np.arange(max_points - 1) * (length - 2) // (max_points - 2)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, length - 1
+    previous = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Third vertex: the mean of the next bucket (the last point for the final bucket)
+        if i + 2 < len(edges):
+            next_x = (edges[i + 1] + edges[i + 2] - 1) / 2.0
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = length - 1, y[-1]
+        x = np.arange(lo, hi)
+        area = np.abs((previous - next_x) * (y[lo:hi] - y[previous]) - (previous - x) * (next_y - y[previous]))
+        previous = lo + int(np.argmax(area))
+        keep[i + 1] = previous
+    return keep
+
+
+def downsample(frame, max_points, method="ohlc"):
+    """frame reduced to at most max_points bars with the given method"""
+    if max_points is None or len(frame) <= max_points:
+        return frame
+    if method == "lttb":
+        return frame.iloc[lttb_indices(frame["Close"].to_numpy(dtype=np.float64), max_points)]
+    return ohlc_buckets(frame, max_points)
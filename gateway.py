@@ -0,0 +1,296 @@
+"""Single gateway for all upstream market data calls
+
+Every provider call passes through UpstreamGateway, which enforces:
+  - a token-bucket budget (Yahoo allows roughly 200 requests/hour), shared by
+    all worker processes when a shared cache is configured
+  - priority classes: waiting calls are served highest priority first, and
+    lower classes may not drain the bucket below a reserve kept for the
+    classes above them, so a search burst cannot starve real-time quotes
+  - a queue deadline per call, after which it gives up instead of piling up
+  - a circuit breaker that fails fast after repeated errors or throttling
+
+Priority ordering applies among the calls waiting in one process; the budget
+itself is shared across processes. A bulk download costs one token per symbol
+(Yahoo makes one request per symbol) and is split into chunks no larger than
+the caller's class may draw at once.
+
+A call that is rejected raises UpstreamUnavailable. Callers that hold an older
+value (info cache, bar store, recent quotes) serve it instead and report it
+with note_stale(), which the app turns into an X-Data-Stale response header.
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+
+# Priority classes, most important first
+REALTIME = "realtime"
+DETAIL = "detail"
+BACKGROUND = "background"
+SEARCH = "search"
+PRIORITIES = (REALTIME, DETAIL, BACKGROUND, SEARCH)
+
+# Share of the bucket each class must leave untouched for the classes above it
+RESERVES = {REALTIME: 0.0, DETAIL: 0.1, BACKGROUND: 0.25, SEARCH: 0.5}
+
+# Seconds a call may wait for a token before giving up
+DEADLINES = {REALTIME: 5.0, DETAIL: 15.0, BACKGROUND: 30.0, SEARCH: 2.0}
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "upstream_queue_wait_seconds", "Time calls waited for an upstream token", ("priority",))
+REJECTED = REGISTRY.counter(
+    "upstream_rejected_total", "Upstream calls refused by the gateway", ("priority", "reason"))
+BREAKER_STATE = REGISTRY.gauge(
+    "upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open), worst worker's",
+    aggregate="max")
+
+_priority = contextvars.ContextVar("upstream_priority", default=DETAIL)
+_stale = contextvars.ContextVar("upstream_stale", default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """The gateway refused a call (budget exhausted, deadline passed or circuit open)"""
+
+
+@contextlib.contextmanager
+def priority(name):
+    """Run the enclosed upstream calls in the given priority class"""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_priority(name):
+    _priority.set(name)
+
+
+def track_stale():
+    """Start collecting stale-fallback notes for the current request; returns the list"""
+    notes = []
+    _stale.set(notes)
+    return notes
+
+
+def note_stale(source):
+    """Record that a cached value was served because upstream was unavailable"""
+    notes = _stale.get()
+    if notes is not None:
+        notes.append(source)
+
+
+class TokenBucket:
+    """Refills rate_per_hour tokens an hour up to capacity
+
+    With a shared cache the bucket state lives there and is updated under the
+    key's cross-process lock, so all workers draw from one budget.
+    """
+
+    KEY = "gateway:bucket"
+
+    def __init__(self, rate_per_hour, capacity, shared=None):
+        self.rate = rate_per_hour / 3600.0
+        self.capacity = float(capacity)
+        self.shared = shared
+        self._state = (self.capacity, time.time())
+        self._lock = threading.Lock()
+
+    def _lock_state(self):
+        return self.shared.backend.lock(self.KEY) if self.shared is not None else self._lock
+
+    def _load(self):
+        if self.shared is None:
+            return self._state
+        entry = self.shared.backend.get_entry(self.KEY)
+        return entry[1] if entry is not None else (self.capacity, time.time())
+
+    def _save(self, state):
+        if self.shared is None:
+            self._state = state
+        else:
+            self.shared.set(self.KEY, state, ttl=24 * 3600)
+
+    def take(self, reserve=0.0, cost=1.0):
+        """Take cost tokens if reserve (a share of capacity) remains afterwards; else seconds until it would"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock_state():
+            tokens, updated_at = self._load()
+            now = time.time()
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+            needed = cost + reserve * self.capacity
+            if tokens >= needed:
+                self._save((tokens - cost, now))
+                return 0.0
+            self._save((tokens, now))
+            return (needed - tokens) / self.rate
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures (or one throttling response)
+
+    While open, calls are refused for the cooldown, which doubles on each
+    failed probe up to max_cooldown. After the cooldown one probe call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=600.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.failures < self.failure_threshold:
+                return True
+            if time.time() < self.open_until or self.probing:
+                return False
+            self.probing = True
+            BREAKER_STATE.set(1)
+            return True
+
+    def cancel_probe(self):
+        """The probe never reached upstream - let the next call probe instead"""
+        with self._lock:
+            self.probing = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+            self.cooldown = self.base_cooldown
+            BREAKER_STATE.set(0)
+
+    def failure(self, throttled=False):
+        with self._lock:
+            if self.probing:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self.failures = max(self.failures + 1, self.failure_threshold if throttled else 0)
+            self.probing = False
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.time() + self.cooldown
+                BREAKER_STATE.set(2)
+
+
+def is_throttled(error):
+    """True for Yahoo's rate-limit responses"""
+    text = f"{type(error).__name__} {error}".lower()
+    return "ratelimit" in text or "rate limit" in text or "too many requests" in text or "429" in text
+
+
+class UpstreamGateway:
+    """Provider wrapper that budgets, prioritises and guards every upstream call"""
+
+    def __init__(self, provider, bucket, breaker=None):
+        self.provider = provider
+        self.name = provider.name
+        self.bucket = bucket
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _acquire(self, priority_name, cost=1):
+        rank = PRIORITIES.index(priority_name)
+        waiter = (rank, next(self._sequence))
+        started = time.monotonic()
+        deadline = started + DEADLINES[priority_name]
+        with self._cond:
+            heapq.heappush(self._waiters, waiter)
+            try:
+                while True:
+                    # Only the most important waiter draws from the bucket
+                    wait = None
+                    if self._waiters[0] == waiter:
+                        wait = self.bucket.take(RESERVES[priority_name], cost)
+                        if wait == 0:
+                            QUEUE_WAIT.observe(time.monotonic() - started, priority=priority_name)
+                            return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        REJECTED.inc(priority=priority_name, reason="deadline")
+                        raise UpstreamUnavailable(f"No upstream capacity for {priority_name} call")
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def _call(self, fn, *args, cost=1, **kwargs):
+        priority_name = _priority.get()
+        if not self.breaker.allow():
+            REJECTED.inc(priority=priority_name, reason="circuit_open")
+            raise UpstreamUnavailable("Upstream circuit open after repeated failures")
+        try:
+            self._acquire(priority_name, cost)
+        except UpstreamUnavailable:
+            self.breaker.cancel_probe()
+            raise
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.breaker.failure(throttled=is_throttled(e))
+            raise
+        self.breaker.success()
+        return result
+
+    def history(self, symbol, start=None, end=None, period=None, interval="1d"):
+        return self._call(self.provider.history, symbol, start=start, end=end, period=period, interval=interval)
+
+    def budget_interval(self, cost, share):
+        """Fewest seconds between runs of a job costing cost tokens that may spend share of the rate"""
+        if self.bucket.rate <= 0:
+            return 0.0
+        return cost / (self.bucket.rate * share)
+
+    def chunk_size(self):
+        """Most symbols one bulk download may cover in the current priority class"""
+        if self.bucket.rate <= 0:
+            return None
+        return max(int(self.bucket.capacity * (1 - RESERVES[_priority.get()])), 1)
+
+    def history_many(self, symbols, period="2d", interval="1d"):
+        """Bulk download costing one token per symbol, in chunks the bucket can pay for
+
+        If a later chunk is refused, the frames already fetched are returned
+        (callers treat the missing symbols as having no new data); if the
+        first one is, UpstreamUnavailable is raised.
+        """
+        symbols = list(symbols)
+        size = self.chunk_size() or max(len(symbols), 1)
+        frames = {}
+        for i in range(0, len(symbols), size):
+            chunk = symbols[i:i + size]
+            try:
+                frames.update(self._call(self.provider.history_many, chunk, cost=len(chunk),
+                                         period=period, interval=interval))
+            except UpstreamUnavailable:
+                if i == 0:
+                    raise
+                note_stale("bars")
+                break
+        return frames
+
+    def info(self, symbol):
+        return self._call(self.provider.info, symbol)
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+
+def create_gateway(provider, shared_cache=None):
+    """Gateway configured by UPSTREAM_RATE_PER_HOUR (0 disables the budget) and UPSTREAM_BURST"""
+    bucket = TokenBucket(float(os.environ.get("UPSTREAM_RATE_PER_HOUR", "200")),
+                         float(os.environ.get("UPSTREAM_BURST", "40")), shared=shared_cache)
+    return UpstreamGateway(provider, bucket)
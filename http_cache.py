@@ -0,0 +1,84 @@
+"""Conditional GET and response compression for polled endpoints
+
+Each cacheable endpoint derives a weak ETag from the version of the data behind
+it (last bar, snapshot contents, quote) before doing any work, so a client
+whose copy is current gets a 304 without the response being rebuilt or
+serialized. Cache-Control max-age follows the market session: seconds while a
+market trades, until the next open once it has closed. A response served from
+a stale fallback is never cached or tagged, so nothing downstream keeps data
+already known to be old.
+
+Bodies of 1 KB or more are compressed with brotli (if the package is
+installed) or gzip, whichever the client prefers.
+"""
+import gzip
+import hashlib
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional - gzip only without it
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE = ("application/json", "text/plain", "text/html", "text/css", "application/javascript")
+
+
+def etag(*parts):
+    """Opaque tag that changes whenever any of the version parts does"""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def cache_control(max_age):
+    return f"public, max-age={max(int(max_age), 0)}"
+
+
+def not_modified(tag, max_age):
+    """304 response if the client's If-None-Match already has this version, else None"""
+    if not request.if_none_match.contains_weak(tag):
+        return None
+    response = Response(status=304)
+    return cacheable(response, tag, max_age)
+
+
+def cacheable(response, tag, max_age):
+    """Attach the ETag and a session-aware Cache-Control to a response"""
+    response.set_etag(tag, weak=True)
+    response.headers['Cache-Control'] = cache_control(max_age)
+    return response
+
+
+def uncacheable(response):
+    """Drop the ETag and ask caches to revalidate every time (for stale fallback data)"""
+    response.headers.pop('ETag', None)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def negotiate():
+    """Content coding to use for this request ("br", "gzip" or None)"""
+    offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    return request.accept_encodings.best_match(offered)
+
+
+def compress(body, encoding, best=False):
+    """Encoded body - best=True trades CPU for size, for bodies encoded once and reused"""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else 5)
+    return gzip.compress(body, compresslevel=9 if best else 6)
+
+
+def compress_response(response):
+    """Compress a finished response in place if the client accepts it and it is worth it"""
+    if response.mimetype not in COMPRESSIBLE or response.direct_passthrough or response.is_streamed:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    body = response.get_data()
+    encoding = negotiate() if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding is not None:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
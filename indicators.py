@@ -0,0 +1,432 @@
+"""Incremental technical indicators with O(1) updates per bar
+
+Every indicator supports push(close) for a new bar and replace(close) to revise
+the newest bar (the delta fetch re-reads the last, possibly still forming bar).
+IndicatorEngine keeps one set of indicators per symbol and only feeds it the
+bars it has not seen yet.
+"""
+import re
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from metrics import timed
+
+# Spec grammar for ?indicators=: sma20, ema12, rsi14 (Wilder), srsi14 (simple
+# moving average RSI, as used for the legacy "rsi" field), bb20, macd
+SPEC_PATTERN = re.compile(r"(sma|ema|rsi|srsi|bb)(\d+)|macd")
+MAX_WINDOW = 1000
+
+
+class SMA:
+    """Simple moving average over a running sum"""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+        self._pushes = 0
+
+    def push(self, close):
+        self.values.append(close)
+        self.total += close
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+        # Re-sum every window pushes so floating point error cannot accumulate
+        self._pushes += 1
+        if self._pushes % self.window == 0:
+            self.total = sum(self.values)
+
+    def replace(self, close):
+        self.total += close - self.values[-1]
+        self.values[-1] = close
+
+    @property
+    def value(self):
+        if len(self.values) < self.window:
+            return None
+        return self.total / self.window
+
+
+class Bollinger(SMA):
+    """Bollinger bands from running sums of x and x^2"""
+
+    def __init__(self, window, width=2.0):
+        super().__init__(window)
+        self.width = width
+        self.total_sq = 0.0
+
+    def push(self, close):
+        self.total_sq += close * close
+        if len(self.values) == self.window:
+            self.total_sq -= self.values[0] ** 2
+        super().push(close)
+        if self._pushes % self.window == 0:
+            self.total_sq = sum(v * v for v in self.values)
+
+    def replace(self, close):
+        self.total_sq += close * close - self.values[-1] ** 2
+        super().replace(close)
+
+    @property
+    def value(self):
+        middle = super().value
+        if middle is None:
+            return None
+        # Population standard deviation, the usual Bollinger convention
+        variance = max(self.total_sq / self.window - middle * middle, 0.0)
+        spread = self.width * variance ** 0.5
+        return {"middle": middle, "upper": middle + spread, "lower": middle - spread}
+
+
+class EMA:
+    """Exponential moving average seeded with the SMA of the first window bars"""
+
+    def __init__(self, window):
+        self.window = window
+        self.alpha = 2.0 / (window + 1)
+        self._seed = SMA(window)
+        self._prev = None  # EMA before the newest bar
+        self._ema = None
+
+    def _step(self, prev, close):
+        return self.alpha * close + (1 - self.alpha) * prev
+
+    def push(self, close):
+        self._prev = self._ema
+        if self._ema is None:
+            self._seed.push(close)
+            self._ema = self._seed.value
+        else:
+            self._ema = self._step(self._ema, close)
+
+    def replace(self, close):
+        if self._prev is None:
+            self._seed.replace(close)
+            self._ema = self._seed.value
+        else:
+            self._ema = self._step(self._prev, close)
+
+    @property
+    def value(self):
+        return self._ema
+
+
+class MACD:
+    """MACD line, signal line and histogram (12/26/9 by default)"""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self._signal_fed = False
+
+    def _line(self):
+        if self.fast.value is None or self.slow.value is None:
+            return None
+        return self.fast.value - self.slow.value
+
+    def push(self, close):
+        self.fast.push(close)
+        self.slow.push(close)
+        line = self._line()
+        self._signal_fed = line is not None
+        if self._signal_fed:
+            self.signal.push(line)
+
+    def replace(self, close):
+        self.fast.replace(close)
+        self.slow.replace(close)
+        line = self._line()
+        if line is not None and self._signal_fed:
+            self.signal.replace(line)
+        elif line is not None:
+            self.signal.push(line)
+            self._signal_fed = True
+
+    @property
+    def value(self):
+        line = self._line()
+        if line is None or self.signal.value is None:
+            return None
+        return {"macd": line, "signal": self.signal.value, "histogram": line - self.signal.value}
+
+
+class RSI:
+    """Relative Strength Index
+
+    wilder=True uses Wilder's smoothing of gains/losses; wilder=False uses a
+    plain rolling mean, matching pandas' diff().where().rolling().mean().
+    """
+
+    def __init__(self, window=14, wilder=True):
+        self.window = window
+        self.wilder = wilder
+        self._closes = deque(maxlen=2)  # previous and newest close
+        if wilder:
+            self._avg = None  # (avg_gain, avg_loss) including the newest bar
+            self._prev_avg = None
+            self._seed_gains = []
+            self._seed_losses = []
+        else:
+            self._gains = SMA(window)
+            self._losses = SMA(window)
+
+    def _delta(self):
+        if len(self._closes) < 2:
+            # pandas: the first diff is NaN and where() turns it into 0
+            return 0.0, 0.0
+        delta = self._closes[-1] - self._closes[-2]
+        return max(delta, 0.0), max(-delta, 0.0)
+
+    def _apply(self, replace):
+        gain, loss = self._delta()
+        if not self.wilder:
+            if replace:
+                self._gains.replace(gain)
+                self._losses.replace(loss)
+            else:
+                self._gains.push(gain)
+                self._losses.push(loss)
+            return
+
+        if len(self._closes) < 2:
+            return
+        if not replace:
+            self._prev_avg = self._avg
+        if self._prev_avg is None:
+            # Still seeding: the first window deltas are averaged
+            if replace and self._seed_gains:
+                self._seed_gains[-1], self._seed_losses[-1] = gain, loss
+            else:
+                self._seed_gains.append(gain)
+                self._seed_losses.append(loss)
+            if len(self._seed_gains) == self.window:
+                self._avg = (sum(self._seed_gains) / self.window, sum(self._seed_losses) / self.window)
+        else:
+            prev_gain, prev_loss = self._prev_avg
+            n = self.window
+            self._avg = ((prev_gain * (n - 1) + gain) / n, (prev_loss * (n - 1) + loss) / n)
+
+    def push(self, close):
+        self._closes.append(close)
+        self._apply(replace=False)
+
+    def replace(self, close):
+        self._closes[-1] = close
+        self._apply(replace=True)
+
+    @property
+    def value(self):
+        if self.wilder:
+            if self._avg is None:
+                return None
+            gain, loss = self._avg
+        else:
+            gain, loss = self._gains.value, self._losses.value
+            if gain is None:
+                return None
+        if loss == 0:
+            return None if gain == 0 else 100.0
+        return 100 - (100 / (1 + gain / loss))
+
+
+def parse_specs(text):
+    """Validated list of indicator specs from a comma separated string"""
+    specs = []
+    for spec in (part.strip().lower() for part in text.split(",")):
+        if not spec:
+            continue
+        match = SPEC_PATTERN.fullmatch(spec)
+        if match is None:
+            raise ValueError(f"Unknown indicator '{spec}'")
+        if match.group(2) is not None and not 2 <= int(match.group(2)) <= MAX_WINDOW:
+            raise ValueError(f"Indicator window must be between 2 and {MAX_WINDOW}: '{spec}'")
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def build_indicator(spec):
+    match = SPEC_PATTERN.fullmatch(spec)
+    if spec == "macd":
+        return MACD()
+    kind, window = match.group(1), int(match.group(2))
+    if kind == "sma":
+        return SMA(window)
+    if kind == "ema":
+        return EMA(window)
+    if kind == "rsi":
+        return RSI(window, wilder=True)
+    if kind == "srsi":
+        return RSI(window, wilder=False)
+    return Bollinger(window)
+
+
+def round_value(value, digits=2):
+    """Round a scalar or dict indicator value for the API response"""
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return {key: round(v, digits) for key, v in value.items()}
+    return round(value, digits)
+
+
+class _SymbolState:
+    def __init__(self):
+        self.indicators = {}
+        self.last_ts = None
+        self.last_close = None
+        self.count = 0
+
+
+class IndicatorEngine:
+    """Per-symbol indicator state, advanced only by bars it has not seen"""
+
+    def __init__(self, max_symbols=500):
+        self.max_symbols = max_symbols
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    @timed("indicators")
+    def compute(self, key, frame, specs):
+        """{spec: value} for the newest bar of frame (a bar-store series)"""
+        timestamps = frame.index.values
+        closes = frame['Close'].to_numpy(dtype=np.float64)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None or not self._advance(state, timestamps, closes):
+                state = _SymbolState()
+                self._feed(state, state.indicators.values(), timestamps, closes)
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_symbols:
+                self._states.popitem(last=False)
+
+            for spec in specs:
+                if spec not in state.indicators:
+                    # New window for this symbol: one replay of what has been seen so far
+                    indicator = build_indicator(spec)
+                    seen = int(np.searchsorted(timestamps, state.last_ts, side='right')) if state.count else 0
+                    for close in closes[:seen]:
+                        indicator.push(float(close))
+                    state.indicators[spec] = indicator
+            return {spec: state.indicators[spec].value for spec in specs}
+
+    def _feed(self, state, indicators, timestamps, closes):
+        indicators = list(indicators)
+        for close in closes:
+            for indicator in indicators:
+                indicator.push(float(close))
+        if len(timestamps):
+            state.last_ts = timestamps[-1]
+            state.last_close = float(closes[-1])
+            state.count += len(timestamps)
+
+    def _advance(self, state, timestamps, closes):
+        """Apply bars newer than the state; False if the state no longer lines up"""
+        if state.last_ts is None:
+            return False
+        pos = int(np.searchsorted(timestamps, state.last_ts))
+        if pos >= len(timestamps) or timestamps[pos] != state.last_ts:
+            # The series was rewritten (backfill / gap) - start over
+            return False
+        if float(closes[pos]) != state.last_close:
+            for indicator in state.indicators.values():
+                indicator.replace(float(closes[pos]))
+            state.last_close = float(closes[pos])
+        if pos + 1 < len(timestamps):
+            self._feed(state, state.indicators.values(), timestamps[pos + 1:], closes[pos + 1:])
+        return True
+
+
+# Vectorized forms for many symbols at once. Rows of the close matrix are
+# right-aligned (newest bar in the last column, shorter series left-padded with
+# NaN) and every row gets the same value the incremental indicator would give
+# after being fed that row's bars.
+
+def _smooth(values, window, alpha):
+    """Row-wise exponential smoothing seeded with the mean of each row's first window values"""
+    rows, columns = values.shape
+    out = np.full((rows, columns), np.nan)
+    current = np.full(rows, np.nan)
+    total = np.zeros(rows)
+    seen = np.zeros(rows, dtype=np.int64)
+    for j in range(columns):
+        x = values[:, j]
+        valid = ~np.isnan(x)
+        seeding = valid & (seen < window)
+        stepping = valid & ~seeding
+        total[seeding] += x[seeding]
+        seen[valid] += 1
+        seeded = seeding & (seen == window)
+        current[seeded] = total[seeded] / window
+        current[stepping] = alpha * x[stepping] + (1 - alpha) * current[stepping]
+        out[:, j] = current
+    return out
+
+
+def _rsi(gain, loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + gain / loss)
+    rsi = np.where(loss == 0, np.where(gain == 0, np.nan, 100.0), rsi)
+    return [None if np.isnan(value) else float(value) for value in rsi]
+
+
+def _matrix_value(kind, window, closes, counts):
+    if kind in ("sma", "bb"):
+        tail = closes[:, -window:] if closes.shape[1] >= window else None
+        if tail is None:
+            return [None] * len(closes)
+        middle = tail.mean(axis=1)
+        if kind == "sma":
+            return [float(m) if n >= window else None for m, n in zip(middle, counts)]
+        spread = 2.0 * tail.std(axis=1)
+        return [{"middle": float(m), "upper": float(m + s), "lower": float(m - s)} if n >= window else None
+                for m, s, n in zip(middle, spread, counts)]
+
+    if kind == "ema":
+        ema = _smooth(closes, window, 2.0 / (window + 1))[:, -1]
+        return [None if np.isnan(value) else float(value) for value in ema]
+
+    deltas = np.diff(closes, axis=1)
+    gains, losses = np.maximum(deltas, 0.0), np.maximum(-deltas, 0.0)
+    if kind == "srsi":
+        # The first bar contributes a zero delta, as in the incremental form
+        if closes.shape[1] < window:
+            return [None] * len(closes)
+        gain = np.nan_to_num(gains[:, -window:]).mean(axis=1)
+        loss = np.nan_to_num(losses[:, -window:]).mean(axis=1)
+        return [value if n >= window else None for value, n in zip(_rsi(gain, loss), counts)]
+    # Wilder's smoothing is an EMA with alpha = 1/window
+    gain = _smooth(gains, window, 1.0 / window)[:, -1]
+    loss = _smooth(losses, window, 1.0 / window)[:, -1]
+    return _rsi(gain, loss)
+
+
+def _matrix_macd(closes, fast=12, slow=26, signal=9):
+    line = _smooth(closes, fast, 2.0 / (fast + 1)) - _smooth(closes, slow, 2.0 / (slow + 1))
+    signal_line = _smooth(line, signal, 2.0 / (signal + 1))
+    values = []
+    for macd, sig in zip(line[:, -1], signal_line[:, -1]):
+        if np.isnan(macd) or np.isnan(sig):
+            values.append(None)
+        else:
+            values.append({"macd": float(macd), "signal": float(sig), "histogram": float(macd - sig)})
+    return values
+
+
+@timed("indicators")
+def compute_matrix(closes, specs):
+    """{spec: [value per row]} for the newest bar of each row of a (symbols x bars) close matrix"""
+    closes = np.atleast_2d(np.asarray(closes, dtype=np.float64))
+    counts = (~np.isnan(closes)).sum(axis=1)
+    values = {}
+    for spec in specs:
+        if spec == "macd":
+            values[spec] = _matrix_macd(closes)
+        else:
+            match = SPEC_PATTERN.fullmatch(spec)
+            values[spec] = _matrix_value(match.group(1), int(match.group(2)), closes, counts)
+    return values
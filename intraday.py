@@ -0,0 +1,189 @@
+"""In-memory intraday 1-minute bars in fixed-size ring buffers
+
+Each symbol gets preallocated arrays (timestamps plus OHLCV) holding the
+newest `capacity` minutes - one full session on every exchange the calendar
+knows (LSE trades 510 minutes). A refresh only asks upstream for bars from the
+buffer's tail onward and appends those newer than the tail, overwriting the
+oldest slots; the tail bar itself is replaced, since it may still have been
+forming. Memory per symbol is fixed (about 24 KB) and the number of symbols is
+capped, least recently used first out.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from gateway import note_stale
+from lazy import lazy_import
+from metrics import count_error
+
+pd = lazy_import("pandas")
+
+CAPACITY = 512
+
+# A tail older than this is not worth a delta fetch (Yahoo keeps 1m bars for a
+# few days only) - the buffer is reloaded with the latest session instead
+MAX_DELTA_SECONDS = 4 * 24 * 3600
+
+COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+
+
+class IntradayBuffer:
+    """Ring buffer of the newest capacity 1-minute bars of one symbol"""
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)  # epoch nanoseconds (UTC)
+        self.values = np.zeros((capacity, len(COLUMNS)), dtype=np.float64)
+        self.start = 0
+        self.count = 0
+        self.tz = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def tail(self):
+        """Timestamp (ns) of the newest bar, or None when empty"""
+        if self.count == 0:
+            return None
+        return int(self.ts[(self.start + self.count - 1) % self.capacity])
+
+    def merge(self, frame):
+        """Append the frame's bars newer than the tail (the tail bar itself is replaced)"""
+        if frame.empty:
+            return
+        if frame.index.tz is not None:
+            self.tz = str(frame.index.tz)
+        stamps = frame.index.tz_convert("UTC") if frame.index.tz is not None else frame.index
+        stamps = stamps.tz_localize(None).values.astype("datetime64[ns]").astype(np.int64)
+        values = frame[list(COLUMNS)].to_numpy(dtype=np.float64)
+        tail = self.tail()
+        if tail is not None:
+            keep = stamps >= tail
+            stamps, values = stamps[keep], values[keep]
+            if len(stamps) and stamps[0] == tail:
+                self.values[(self.start + self.count - 1) % self.capacity] = values[0]
+                stamps, values = stamps[1:], values[1:]
+        # Only the newest capacity bars can survive
+        stamps, values = stamps[-self.capacity:], values[-self.capacity:]
+        for stamp, row in zip(stamps, values):
+            if self.count < self.capacity:
+                slot = (self.start + self.count) % self.capacity
+                self.count += 1
+            else:
+                slot = self.start
+                self.start = (self.start + 1) % self.capacity
+            self.ts[slot] = stamp
+            self.values[slot] = row
+
+    @classmethod
+    def from_arrays(cls, ts, values, start, count, tz=None, checked_at=0.0):
+        """Buffer over existing arrays (e.g. memory-mapped from a warm cache file)"""
+        buffer = cls(len(ts))
+        buffer.ts, buffer.values = ts, values
+        buffer.start, buffer.count, buffer.tz, buffer.checked_at = start, count, tz, checked_at
+        return buffer
+
+    def copy_state(self):
+        """(state dict, ts copy, values copy) taken consistently under the buffer lock"""
+        with self.lock:
+            state = {"start": self.start, "count": self.count, "tz": self.tz,
+                     "checked_at": self.checked_at, "capacity": self.capacity}
+            return state, self.ts.copy(), self.values.copy()
+
+    def frame(self, session_only=True):
+        """Bars oldest first as a yfinance-shaped frame - by default only the newest bar's trading day"""
+        order = (self.start + np.arange(self.count)) % self.capacity
+        index = pd.DatetimeIndex(self.ts[order].astype("datetime64[ns]")).tz_localize("UTC")
+        if self.tz:
+            index = index.tz_convert(self.tz)
+        frame = pd.DataFrame(self.values[order], index=index, columns=list(COLUMNS))
+        if session_only and len(frame):
+            frame = frame[index.normalize() == index[-1].normalize()]
+        return frame
+
+
+class IntradayStore:
+    """Per-symbol intraday buffers refreshed with tail-only delta fetches
+
+    A buffer is refreshed at most every refresh_interval seconds while its
+    market trades; with a session calendar, one refreshed after the market
+    settled is not fetched again until it reopens.
+    """
+
+    def __init__(self, market_data, capacity=CAPACITY, max_symbols=1000, refresh_interval=5, sessions=None):
+        self.market_data = market_data
+        self.capacity = capacity
+        self.max_symbols = max_symbols
+        self.refresh_interval = refresh_interval
+        self.sessions = sessions
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _buffer(self, symbol):
+        with self._lock:
+            buffer = self._buffers.get(symbol)
+            if buffer is None:
+                buffer = self._buffers[symbol] = IntradayBuffer(self.capacity)
+            self._buffers.move_to_end(symbol)
+            while len(self._buffers) > self.max_symbols:
+                self._buffers.popitem(last=False)
+            return buffer
+
+    def _max_age(self, symbol):
+        if self.sessions is None:
+            return self.refresh_interval
+        return self.sessions.max_age(symbol, self.refresh_interval)
+
+    def _refresh(self, symbol, buffer):
+        tail = buffer.tail()
+        if tail is not None and time.time() - tail / 1e9 > MAX_DELTA_SECONDS:
+            buffer.clear()
+            tail = None
+        try:
+            if tail is None:
+                frame = self.market_data.history(symbol, period="1d", interval="1m")
+            else:
+                frame = self.market_data.history(symbol, start=pd.Timestamp(tail, unit="ns", tz="UTC"),
+                                                 interval="1m")
+        except Exception as e:
+            if buffer.count == 0:
+                raise
+            count_error("intraday", e)
+            note_stale("intraday")
+            return
+        buffer.merge(frame)
+        buffer.checked_at = time.time()
+
+    def bars(self, symbol, session_only=True):
+        """Intraday bars for symbol (latest session by default), refreshed first if due"""
+        symbol = symbol.upper()
+        buffer = self._buffer(symbol)
+        with buffer.lock:
+            if time.time() - buffer.checked_at >= self._max_age(symbol):
+                self._refresh(symbol, buffer)
+            return buffer.frame(session_only)
+
+    def export(self):
+        """[(symbol, buffer)] least recently used first"""
+        with self._lock:
+            return list(self._buffers.items())
+
+    def restore(self, symbol, buffer):
+        """Adopt a rebuilt buffer unless the symbol already has one or the capacity differs"""
+        if buffer.capacity != self.capacity:
+            return False
+        with self._lock:
+            if symbol in self._buffers or len(self._buffers) >= self.max_symbols:
+                return False
+            self._buffers[symbol] = buffer
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {"symbols": len(self._buffers),
+                    "bytes": sum(b.ts.nbytes + b.values.nbytes for b in self._buffers.values())}
@@ -0,0 +1,28 @@
+"""Deferred imports for heavy dependencies
+
+`pd = lazy_import("pandas")` binds a stand-in that imports the real module on
+first attribute access, so routes that never touch pandas (the page itself,
+company lists, market status, search) do not pay for loading it at startup.
+"""
+import importlib
+
+
+class LazyModule:
+    """Module proxy that imports name the first time one of its attributes is read"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        # importlib's per-module locks make concurrent first uses safe
+        value = getattr(importlib.import_module(self._name), attr)
+        # Later reads of the same attribute skip this hook
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
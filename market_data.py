@@ -0,0 +1,506 @@
+"""Pluggable market data providers and the bar-store backed access layer"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from bar_store import COLUMNS, BarStore, empty_frame
+from cache import InfoCache
+from gateway import UpstreamUnavailable, create_gateway, note_stale
+from lazy import lazy_import
+from metrics import UPSTREAM_LATENCY, count_error
+
+pd = lazy_import("pandas")
+
+
+class YFinanceProvider:
+    """Live data from Yahoo Finance"""
+
+    name = "yfinance"
+
+    def history(self, symbol, start=None, end=None, period=None, interval="1d"):
+        import yfinance as yf
+
+        ticker = yf.Ticker(symbol)
+        if period is not None:
+            return ticker.history(period=period, interval=interval)
+        return ticker.history(start=start, end=end, interval=interval)
+
+    def history_many(self, symbols, period="2d", interval="1d"):
+        """One bulk download for many symbols - {symbol: frame}"""
+        import yfinance as yf
+
+        symbols = list(symbols)
+        data = yf.download(symbols, period=period, interval=interval, group_by="ticker",
+                           auto_adjust=True, threads=True, progress=False)
+        if data.empty:
+            return {}
+        if not isinstance(data.columns, pd.MultiIndex):
+            return {symbols[0]: data.dropna(subset=["Close"])}
+
+        frames = {}
+        for symbol in symbols:
+            if symbol in data.columns.get_level_values(0):
+                # Rows are aligned across exchanges, so drop other markets' trading days
+                frame = data[symbol].dropna(subset=["Close"])
+                if not frame.empty:
+                    frames[symbol] = frame
+        return frames
+
+    def info(self, symbol):
+        import yfinance as yf
+
+        return yf.Ticker(symbol).info
+
+
+class FixtureProvider:
+    """Offline data from a fixture directory
+
+    Layout: <root>/<SYMBOL>/<interval>.csv (a DataFrame.to_csv() dump of a
+    history() result) and <root>/<SYMBOL>/info.json, as written by
+    RecordingProvider. Each call sleeps latency seconds (plus up to jitter)
+    to stand in for the upstream round trip, and is counted in calls.
+    """
+
+    name = "fixture"
+
+    def __init__(self, root, latency=0.0, jitter=0.0):
+        self.root = root
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+        self._frames = {}
+        self._calls_lock = threading.Lock()
+
+    def _upstream_call(self, kind):
+        with self._calls_lock:
+            self.calls[kind] += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _symbol_dir(self, symbol):
+        return os.path.join(self.root, symbol.upper())
+
+    def _frame(self, symbol, interval):
+        key = (symbol.upper(), interval)
+        if key not in self._frames:
+            path = os.path.join(self._symbol_dir(symbol), interval + ".csv")
+            if not os.path.exists(path):
+                self._frames[key] = empty_frame()
+            else:
+                frame = pd.read_csv(path, index_col=0)
+                tz = self._info(symbol).get("exchangeTimezoneName", "UTC")
+                frame.index = pd.to_datetime(frame.index, utc=True).tz_convert(tz)
+                self._frames[key] = frame.sort_index()
+        return self._frames[key]
+
+    def history(self, symbol, start=None, end=None, period=None, interval="1d"):
+        self._upstream_call("history")
+        return self._history(symbol, start, end, period, interval)
+
+    def _history(self, symbol, start=None, end=None, period=None, interval="1d"):
+        frame = self._frame(symbol, interval)
+        if frame.empty:
+            return frame
+        if period is not None:
+            return _tail_for_period(frame, period)
+        if start is not None:
+            frame = frame[frame.index >= _localize(start, frame.index.tz)]
+        if end is not None:
+            frame = frame[frame.index < _localize(end, frame.index.tz)]
+        return frame
+
+    def history_many(self, symbols, period="2d", interval="1d"):
+        # One simulated round trip for the whole batch, like yf.download
+        self._upstream_call("history_many")
+        frames = {}
+        for symbol in symbols:
+            frame = self._history(symbol, period=period, interval=interval)
+            if not frame.empty:
+                frames[symbol] = frame
+        return frames
+
+    def info(self, symbol):
+        self._upstream_call("info")
+        return self._info(symbol)
+
+    def _info(self, symbol):
+        path = os.path.join(self._symbol_dir(symbol), "info.json")
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+class RecordingProvider:
+    """Passes calls through to another provider and saves every response as a fixture
+
+    Recorded history is merged into <root>/<SYMBOL>/<interval>.csv and the
+    latest info into <root>/<SYMBOL>/info.json, so a session against the live
+    provider can later be replayed offline with FixtureProvider.
+    """
+
+    name = "record"
+
+    def __init__(self, provider, root):
+        self.provider = provider
+        self.root = root
+        self._lock = threading.Lock()
+
+    def history(self, symbol, start=None, end=None, period=None, interval="1d"):
+        frame = self.provider.history(symbol, start=start, end=end, period=period, interval=interval)
+        self._record_history(symbol, interval, frame)
+        return frame
+
+    def history_many(self, symbols, period="2d", interval="1d"):
+        frames = self.provider.history_many(symbols, period=period, interval=interval)
+        for symbol, frame in frames.items():
+            self._record_history(symbol, interval, frame)
+        return frames
+
+    def info(self, symbol):
+        info = self.provider.info(symbol)
+        if info:
+            directory = self._symbol_dir(symbol)
+            with self._lock:
+                os.makedirs(directory, exist_ok=True)
+                with open(os.path.join(directory, "info.json"), "w") as f:
+                    json.dump(info, f, default=str)
+        return info
+
+    def _symbol_dir(self, symbol):
+        return os.path.join(self.root, symbol.upper())
+
+    def _record_history(self, symbol, interval, frame):
+        if frame is None or frame.empty:
+            return
+        path = os.path.join(self._symbol_dir(symbol), interval + ".csv")
+        frame = frame[[column for column in COLUMNS if column in frame.columns]].copy()
+        frame.index = pd.to_datetime(frame.index, utc=True)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                stored = pd.read_csv(path, index_col=0)
+                stored.index = pd.to_datetime(stored.index, utc=True)
+                frame = pd.concat([stored, frame])
+                frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+            frame.to_csv(path)
+
+
+class TimedProvider:
+    """Records the latency and outcome of every call to the wrapped provider"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.name = provider.name
+
+    def _call(self, call, fn, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, call=call, outcome=outcome)
+
+    def history(self, symbol, start=None, end=None, period=None, interval="1d"):
+        return self._call("history", self.provider.history, symbol,
+                          start=start, end=end, period=period, interval=interval)
+
+    def history_many(self, symbols, period="2d", interval="1d"):
+        return self._call("history_many", self.provider.history_many, symbols,
+                          period=period, interval=interval)
+
+    def info(self, symbol):
+        return self._call("info", self.provider.info, symbol)
+
+    def __getattr__(self, name):
+        # Provider-specific extras (e.g. FixtureProvider.calls)
+        return getattr(self.provider, name)
+
+
+def _localize(value, tz):
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is None:
+        return stamp.tz_localize(tz)
+    return stamp.tz_convert(tz)
+
+
+def _tail_for_period(frame, period):
+    """Rows covered by a yfinance-style period string ("2d", "1mo", "1y", "max")"""
+    match = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if period == "max" or match is None:
+        return frame
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == "d":
+        # Trading days, not calendar days - same as Yahoo
+        days = frame.index.normalize().unique()[-count:]
+        return frame[frame.index.normalize().isin(days)]
+    span = {"wk": timedelta(weeks=count),
+            "mo": timedelta(days=30 * count),
+            "y": timedelta(days=365 * count)}[unit]
+    return frame[frame.index > frame.index[-1] - span]
+
+
+# Smallest yfinance period covering a number of calendar days ("5d" is trading days)
+PERIODS = ((4, "5d"), (28, "1mo"), (89, "3mo"), (180, "6mo"), (366, "1y"), (731, "2y"),
+           (1826, "5y"), (3652, "10y"))
+
+
+def period_covering(days):
+    for limit, period in PERIODS:
+        if days <= limit:
+            return period
+    return "max"
+
+
+# Chart ranges (yfinance names) -> calendar days of bars to load. "d" ranges count
+# trading days, so they load a few extra calendar days and are trimmed afterwards.
+RANGES = {"1d": 4, "5d": 8, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 365, "2y": 730,
+          "5y": 1826, "10y": 3652, "ytd": None, "max": None}
+
+# Bar intervals -> how far back (in days) Yahoo keeps them; None for no limit
+INTERVALS = {"1m": 30, "2m": 60, "5m": 60, "15m": 60, "30m": 60, "60m": 730, "90m": 60, "1h": 730,
+             "1d": None, "5d": None, "1wk": None, "1mo": None, "3mo": None}
+
+# Longest span one request may cover, where Yahoo limits it separately from the
+# lookback ("Only 7 days worth of 1m granularity data are allowed to be fetched
+# per request"). Longer requests start later instead - the bar store keeps what
+# earlier requests fetched.
+REQUEST_SPANS = {"1m": timedelta(days=7)}
+
+INTRADAY_INTERVALS = {"1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h"}
+
+
+def range_start(range_name, now=None):
+    """Earliest bar time a chart range needs"""
+    now = datetime.now() if now is None else now
+    if range_name == "ytd":
+        return datetime(now.year, 1, 1)
+    if range_name == "max":
+        return datetime(1970, 1, 1)
+    return now - timedelta(days=RANGES[range_name])
+
+
+def request_start(start, interval):
+    """start, moved forward if one request for interval bars may not reach back that far"""
+    span = REQUEST_SPANS.get(interval)
+    if span is None or start is None:
+        return start
+    start = pd.Timestamp(start)
+    # Naive times are local wall-clock time, as from datetime.now()
+    earliest = pd.Timestamp.now(tz=start.tz) - span + timedelta(minutes=1)
+    return max(start, earliest)
+
+
+def validate_range(range_name, interval):
+    """Raise ValueError unless the range and interval exist and Yahoo serves that combination"""
+    if range_name not in RANGES:
+        raise ValueError(f"range must be one of: {', '.join(RANGES)}")
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of: {', '.join(INTERVALS)}")
+    limit = INTERVALS[interval]
+    now = datetime.now()
+    if limit is not None and now - range_start(range_name, now) > timedelta(days=limit):
+        raise ValueError(f"{interval} bars are only available for the last {limit} days")
+
+
+def get_provider():
+    """Provider selected by the MARKET_DATA_PROVIDER environment variable
+
+    "fixture" replays MARKET_DATA_FIXTURES with MARKET_DATA_LATENCY_MS (+ up to
+    MARKET_DATA_JITTER_MS) per call; "record" uses Yahoo and saves everything
+    it returns into MARKET_DATA_FIXTURES.
+    """
+    name = os.environ.get("MARKET_DATA_PROVIDER", "yfinance")
+    fixtures = os.environ.get("MARKET_DATA_FIXTURES", "fixtures")
+    if name == "fixture":
+        return FixtureProvider(fixtures,
+                               latency=float(os.environ.get("MARKET_DATA_LATENCY_MS", "0")) / 1000,
+                               jitter=float(os.environ.get("MARKET_DATA_JITTER_MS", "0")) / 1000)
+    if name == "record":
+        return RecordingProvider(YFinanceProvider(), fixtures)
+    return YFinanceProvider()
+
+
+class MarketData:
+    """Provider access with a persistent local copy of historical bars
+
+    The bar store lives on disk and is shared by all worker processes; a series
+    checked within refresh_interval seconds (by any worker) is served without
+    a delta fetch. With a session calendar, a series checked after its market
+    closed is not fetched again until the market reopens.
+    """
+
+    def __init__(self, provider, store, info_cache=None, refresh_interval=60, sessions=None):
+        self.provider = provider
+        self.store = store
+        self.info_cache = info_cache if info_cache is not None else InfoCache(provider.info)
+        self.refresh_interval = refresh_interval
+        self.sessions = sessions
+
+    def _refresh_age(self, symbol):
+        if self.sessions is None:
+            return self.refresh_interval
+        return self.sessions.max_age(symbol, self.refresh_interval)
+
+    def history(self, symbol, start=None, end=None, period=None, interval="1d"):
+        """Uncached pass-through to the provider"""
+        return self.provider.history(symbol, start=start, end=end, period=period, interval=interval)
+
+    def history_many(self, symbols, period="2d", interval="1d"):
+        """Uncached bulk fetch - {symbol: frame}, symbols without data are left out"""
+        return self.provider.history_many(symbols, period=period, interval=interval)
+
+    def info(self, symbol, fields=None):
+        """Cached ticker info; only refetched when one of the given fields is stale"""
+        return self.info_cache.get(symbol, fields)
+
+    def bars(self, symbol, start, end=None, interval="1d"):
+        """Bars in [start, end), fetching only what the store does not have yet"""
+        with self.store.lock(symbol, interval):
+            last = self.store.last_timestamp(symbol, interval)
+            meta = self.store.read_meta(symbol, interval)
+            covered_since = meta.get("since")
+            start_key = pd.Timestamp(start).strftime("%Y-%m-%d")
+
+            if last is None or covered_since is None or start_key < covered_since:
+                # Nothing stored for this range yet - full download
+                try:
+                    frame = self.provider.history(symbol, start=request_start(start, interval), end=end,
+                                                  interval=interval)
+                except Exception as e:
+                    if last is None:
+                        raise
+                    # Part of the range is stored - serve that rather than nothing
+                    count_error("bars", e)
+                    note_stale("bars")
+                    return self.store.load(symbol, interval, start=start, end=end)
+                self.store.write(symbol, frame, interval)
+                if not frame.empty:
+                    self.store.write_meta(symbol, interval, since=min(start_key, covered_since or start_key),
+                                          checked_at=time.time())
+            elif time.time() - meta.get("checked_at", 0) >= self._refresh_age(symbol):
+                # Re-read from the newest stored bar: it may still have been forming
+                try:
+                    frame = self.provider.history(symbol, start=request_start(last, interval), end=end,
+                                                  interval=interval)
+                    if self.store.restates(symbol, frame, interval):
+                        self._refetch(symbol, interval)
+                    else:
+                        self.store.write(symbol, frame, interval)
+                        self.store.write_meta(symbol, interval, checked_at=time.time())
+                except Exception as e:
+                    count_error("bars", e)
+                    note_stale("bars")
+                    print(f"Delta fetch failed for {symbol}, serving stored bars: {e}")
+
+            return self.store.load(symbol, interval, start=start, end=end)
+
+    def _refetch(self, symbol, interval):
+        """Replace a series re-adjusted upstream (split or dividend) with a full download of its range"""
+        print(f"Stored {interval} bars of {symbol} were re-adjusted upstream, refetching them")
+        since = self.store.read_meta(symbol, interval).get("since")
+        frame = self.provider.history(symbol, start=request_start(since, interval), interval=interval)
+        self.store.replace(symbol, frame, interval)
+        self.store.write_meta(symbol, interval, checked_at=time.time())
+
+    def range_bars(self, symbol, range_name="1y", interval="1d"):
+        """Bars for a chart range such as "5d" or "5y" (see RANGES)"""
+        frame = self.bars(symbol, range_start(range_name), interval=interval)
+        if range_name in ("1d", "5d"):
+            frame = _tail_for_period(frame, range_name)
+        return frame
+
+    def bars_many(self, symbols, start, interval="1d"):
+        """{symbol: bars since start} with at most two bulk downloads for the whole list
+
+        Series the store does not cover are downloaded together, as are those
+        due a delta refresh. If a bulk download fails its symbols go through
+        bars() one at a time; if the gateway refuses it, stored bars are served
+        as they are.
+        """
+        now = time.time()
+        start_key = pd.Timestamp(start).strftime("%Y-%m-%d")
+        full, delta, oldest = [], [], now
+        for symbol in symbols:
+            last = self.store.last_timestamp(symbol, interval)
+            meta = self.store.read_meta(symbol, interval)
+            if last is None or meta.get("since") is None or start_key < meta["since"]:
+                full.append(symbol)
+            elif now - meta.get("checked_at", 0) >= self._refresh_age(symbol):
+                delta.append(symbol)
+                oldest = min(oldest, pd.Timestamp(last).timestamp())
+
+        retry, refused = set(), set()
+        for group, days in ((full, (now - pd.Timestamp(start).timestamp()) / 86400),
+                            (delta, (now - oldest) / 86400)):
+            if not group:
+                continue
+            try:
+                frames = self.provider.history_many(group, period=period_covering(days), interval=interval)
+            except UpstreamUnavailable as e:
+                # Refused by the gateway - bars() would only be refused again
+                count_error("bars", e)
+                refused.update(group)
+                continue
+            except Exception as e:
+                count_error("bars", e)
+                print(f"Bulk bar fetch failed, falling back to per-symbol fetches: {e}")
+                retry.update(group)
+                continue
+            for symbol in group:
+                frame = frames.get(symbol)
+                if frame is None or frame.empty:
+                    continue
+                with self.store.lock(symbol, interval):
+                    if group is delta and self.store.restates(symbol, frame, interval):
+                        try:
+                            self._refetch(symbol, interval)
+                        except Exception as e:
+                            count_error("bars", e)
+                            note_stale("bars")
+                        continue
+                    self.store.write(symbol, frame, interval)
+                    if group is full:
+                        since = self.store.read_meta(symbol, interval).get("since")
+                        self.store.write_meta(symbol, interval, since=min(start_key, since or start_key),
+                                              checked_at=time.time())
+                    else:
+                        self.store.write_meta(symbol, interval, checked_at=time.time())
+
+        result = {}
+        for symbol in symbols:
+            if symbol in retry:
+                try:
+                    result[symbol] = self.bars(symbol, start, interval=interval)
+                except Exception as e:
+                    count_error("bars", e)
+                    print(f"Error fetching bars for {symbol}: {e}")
+            else:
+                result[symbol] = self.store.load(symbol, interval, start=start)
+                if symbol in refused and not result[symbol].empty:
+                    note_stale("bars")
+        return result
+
+
+def create_market_data(shared_cache=None, sessions=None):
+    """MarketData wired from environment configuration"""
+    store = BarStore(os.environ.get("BAR_STORE_DIR", os.path.join("data", "bars")))
+    # Every upstream call is budgeted by the gateway; timing covers only the call itself
+    provider = create_gateway(TimedProvider(get_provider()), shared_cache)
+    info_cache = InfoCache(provider.info,
+                           max_entries=int(os.environ.get("INFO_CACHE_ENTRIES", "2000")),
+                           max_bytes=int(os.environ.get("INFO_CACHE_MB", "32")) * 1024 * 1024,
+                           shared=shared_cache, sessions=sessions)
+    return MarketData(provider, store, info_cache,
+                      refresh_interval=int(os.environ.get("BAR_REFRESH_SECONDS", "60")),
+                      sessions=sessions)
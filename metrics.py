@@ -0,0 +1,302 @@
+"""Request, upstream and compute instrumentation in Prometheus text format
+
+Instruments live in a process-wide registry (REGISTRY) so any module can time
+itself without extra wiring. Stats that components already keep (cache hit
+counters, stream subscribers, ...) are read at scrape time by collectors.
+
+With several worker processes, each one periodically publishes a snapshot of
+its registry to the shared cache and /api/metrics merges the snapshots of all
+workers seen recently, so a scrape that lands on any worker sees the whole
+node. Counters and histograms are summed; each gauge says how it combines
+("sum" for totals such as requests in flight, "max" for states such as the
+circuit breaker's, where the worst worker is what matters).
+"""
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, description, labelnames=(), aggregate="sum"):
+        super().__init__(name, description, labelnames)
+        self.aggregate = aggregate
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Bucket counts are stored per bucket and made cumulative when rendered"""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Registry:
+    """Named instruments plus collectors read at scrape time"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, description, labelnames=()):
+        return self._add(Counter(name, description, labelnames))
+
+    def gauge(self, name, description, labelnames=(), aggregate="sum"):
+        """Gauge merged across workers by aggregate ("sum" or "max")"""
+        return self._add(Gauge(name, description, labelnames, aggregate))
+
+    def histogram(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, description, labelnames, buckets))
+
+    def collector(self, fn):
+        """Register fn() -> [(name, kind, description, labelnames, {label values: value})] (gauges are summed)"""
+        self._collectors.append(fn)
+        return fn
+
+    def snapshot(self):
+        """Plain-data copy of every metric: {name: (kind, description, labelnames, buckets, values, aggregate)}"""
+        families = {}
+        for metric in list(self._metrics.values()):
+            families[metric.name] = (metric.kind, metric.description, metric.labelnames,
+                                     getattr(metric, "buckets", None), metric.snapshot(),
+                                     getattr(metric, "aggregate", "sum"))
+        for collect in self._collectors:
+            try:
+                for name, kind, description, labelnames, values in collect():
+                    families[name] = (kind, description, tuple(labelnames), None,
+                                      {tuple(str(v) for v in key): value for key, value in values.items()}, "sum")
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return families
+
+
+def to_plain(snapshot):
+    """JSON-compatible copy of a snapshot: each {label values: value} map becomes [[labels, value]]"""
+    return {name: [kind, description, list(labelnames), buckets, [[list(key), value] for key, value in values.items()],
+                   aggregate]
+            for name, (kind, description, labelnames, buckets, values, aggregate) in snapshot.items()}
+
+
+def from_plain(plain):
+    """Snapshot back from to_plain()"""
+    return {name: (kind, description, tuple(labelnames), buckets, {tuple(key): value for key, value in values},
+                   aggregate)
+            for name, (kind, description, labelnames, buckets, values, aggregate) in plain.items()}
+
+
+def merge(snapshots):
+    """Combine several registry snapshots (one per worker): sums, except for "max" gauges"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, (kind, description, labelnames, buckets, values, aggregate) in snapshot.items():
+            if name not in merged:
+                merged[name] = (kind, description, labelnames, buckets, {}, aggregate)
+            target = merged[name][4]
+            for key, value in values.items():
+                if kind == "histogram":
+                    state = target.setdefault(key, [[0] * len(value[0]), 0.0, 0])
+                    state[0] = [a + b for a, b in zip(state[0], value[0])]
+                    state[1] += value[1]
+                    state[2] += value[2]
+                elif kind == "gauge" and aggregate == "max":
+                    target[key] = max(target.get(key, value), value)
+                else:
+                    target[key] = target.get(key, 0) + value
+    return merged
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name in sorted(snapshot):
+        kind, description, labelnames, buckets, values, _ = snapshot[name]
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key in sorted(values):
+            value = values[key]
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(tuple(buckets) + (float("inf"),), value[0]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(value[1])}")
+            lines.append(f"{name}_count{_labels(labelnames, key)} {value[2]}")
+    return "\n".join(lines) + "\n"
+
+
+class WorkerMetrics:
+    """Publishes this worker's snapshot to the shared cache and merges everyone's"""
+
+    # Versioned with the snapshot format, so workers still running an older one are not merged
+    KEY = "metrics:workers:2"
+
+    def __init__(self, registry, shared=None, publish_interval=10, worker_ttl=60):
+        self.registry = registry
+        self.shared = shared
+        self.publish_interval = publish_interval
+        self.worker_ttl = worker_ttl
+        self._published_at = 0.0
+
+    def _update(self, own=None):
+        # Read-modify-write of the worker table under the key's cross-process lock
+        with self.shared.backend.lock(self.KEY):
+            # Backend access directly so scrapes do not show up in the shared cache's hit counts
+            entry = self.shared.backend.get_entry(self.KEY)
+            workers = dict(entry[1]) if entry is not None else {}
+            now = time.time()
+            workers = {pid: entry for pid, entry in workers.items() if now - entry[0] < self.worker_ttl}
+            if own is not None:
+                # Keys come back from the shared cache as strings
+                workers[str(os.getpid())] = (now, to_plain(own))
+                self.shared.set(self.KEY, workers, self.worker_ttl)
+            return workers
+
+    def maybe_publish(self):
+        """Publish this worker's snapshot if the last one is older than publish_interval"""
+        if self.shared is None or time.time() - self._published_at < self.publish_interval:
+            return
+        self._published_at = time.time()
+        try:
+            self._update(self.registry.snapshot())
+        except Exception as e:
+            print(f"Publishing metrics failed: {e}")
+
+    def render(self):
+        own = self.registry.snapshot()
+        if self.shared is None:
+            return render(own)
+        self._published_at = time.time()
+        try:
+            workers = self._update(own)
+        except Exception as e:
+            print(f"Reading worker metrics failed: {e}")
+            return render(own)
+        return render(merge(from_plain(snapshot) for _, snapshot in workers.values()))
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Request latency by route", ("route", "method", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being handled", ("route",))
+ERRORS = REGISTRY.counter(
+    "errors_total", "Errors by where they were caught and exception type", ("source", "type"))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Market data provider call latency", ("call", "outcome"))
+COMPUTE_LATENCY = REGISTRY.histogram(
+    "compute_duration_seconds", "Time spent in indicator, prediction and other computations", ("stage",))
+
+
+def count_error(source, error):
+    ERRORS.inc(source=source, type=type(error).__name__)
+
+
+def timed(stage):
+    """Decorator recording a function's run time in compute_duration_seconds"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with COMPUTE_LATENCY.time(stage=stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,256 @@
+"""Watchlist portfolio analytics over a date-aligned daily return matrix
+
+Unlike analytics.py, rows here are aligned by calendar date: correlation and
+beta compare same-day returns. Each symbol's return is taken between its own
+consecutive bars, so a holiday on one exchange leaves a gap (NaN) instead of a
+zero return, and every pairwise figure uses only the days both symbols traded.
+
+Covariance is never recomputed over the whole window. The pairwise counts,
+sums and cross products are kept as running sums: a new day adds one row and
+the day falling out of the window subtracts one. A day's row is committed to
+the sums only once it can no longer change (every market has traded at least
+two days later); the latest day or two, whose bars may still be forming, are
+applied on top of a copy of the sums for each request.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from bar_store import frame_timestamps
+from metrics import timed
+
+TRADING_DAYS = 252
+# Daily standard deviation to annualized percent
+ANNUALIZE = np.sqrt(TRADING_DAYS) * 100
+NS_PER_DAY = 86400 * 10 ** 9
+
+
+def _floats(values, digits=2):
+    # Rounded as one array; NaN (the only value unequal to itself) becomes None
+    rounded = np.round(np.asarray(values, dtype=np.float64), digits).tolist()
+    return [None if value != value else value for value in rounded]
+
+
+class RunningCovariance:
+    """Pairwise-complete covariance of return rows kept as running sums
+
+    For each pair (i, j), only rows where both returns exist count:
+    count[i, j] such rows, sums[i, j] the sum of i's returns over them and
+    products[i, j] the sum of i * j. Adding or dropping rows costs
+    O(rows x symbols^2); reading the covariance never touches the rows.
+    """
+
+    def __init__(self, size):
+        self.count = np.zeros((size, size))
+        self.sums = np.zeros((size, size))
+        self.products = np.zeros((size, size))
+
+    def update(self, rows, sign=1):
+        """Add (sign=1) or remove (sign=-1) return rows, NaN where a symbol has no return"""
+        rows = np.atleast_2d(rows)
+        present = ~np.isnan(rows)
+        values = np.where(present, rows, 0.0)
+        weights = present.astype(np.float64)
+        self.count += sign * (weights.T @ weights)
+        self.sums += sign * (values.T @ weights)
+        self.products += sign * (values.T @ values)
+
+    def copy(self):
+        other = RunningCovariance(0)
+        other.count, other.sums, other.products = self.count.copy(), self.sums.copy(), self.products.copy()
+        return other
+
+    def covariance(self):
+        """Sample covariance matrix, NaN for pairs with fewer than two common rows"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = (self.products - self.sums * self.sums.T / self.count) / (self.count - 1)
+        covariance[self.count < 2] = np.nan
+        return covariance
+
+
+def _rows(frames, symbols, after, last_close):
+    """(days, close rows, return rows) for bars dated after `after`, one row per day any symbol traded
+
+    Days are wall-clock dates as days since the epoch. The first return of a
+    symbol is taken against last_close (its last committed close).
+    """
+    series = []
+    for symbol in symbols:
+        frame = frames.get(symbol)
+        if frame is None or frame.empty:
+            series.append((np.empty(0, dtype=np.int64), np.empty(0)))
+            continue
+        days = frame_timestamps(frame) // NS_PER_DAY
+        closes = frame["Close"].to_numpy(dtype=np.float64)
+        if after is not None:
+            keep = days > after
+            days, closes = days[keep], closes[keep]
+        series.append((days, closes))
+
+    all_days = np.unique(np.concatenate([days for days, _ in series]))
+    closes = np.full((len(all_days), len(symbols)), np.nan)
+    returns = np.full((len(all_days), len(symbols)), np.nan)
+    for column, (days, values) in enumerate(series):
+        if not len(days):
+            continue
+        rows = np.searchsorted(all_days, days)
+        closes[rows, column] = values
+        previous = np.concatenate(([last_close[column]], values[:-1]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[rows, column] = values / previous - 1
+    return all_days, closes, returns
+
+
+def _drawdowns(closes):
+    """Drawdown from the running peak for each column (holidays carry the last close forward)"""
+    filled = np.where(np.isnan(closes), 0, np.arange(len(closes))[:, None])
+    filled = np.take_along_axis(closes, np.maximum.accumulate(filled, axis=0), axis=0)
+    with np.errstate(invalid='ignore'):
+        return filled / np.fmax.accumulate(filled, axis=0) - 1
+
+
+class _Portfolio:
+    """Committed window of one symbol list plus its running sums"""
+
+    def __init__(self, symbols, window):
+        self.symbols = symbols
+        self.window = window
+        self.days = deque()
+        self.closes = deque()
+        self.returns = deque()
+        self.last_close = np.full(len(symbols), np.nan)
+        self.sums = RunningCovariance(len(symbols))
+        self.built_at = time.time()
+        self.lock = threading.Lock()
+
+    def advance(self, frames):
+        """Commit the days that are final; (days, closes, returns) of the provisional rest"""
+        after = self.days[-1] if self.days else None
+        days, closes, returns = _rows(frames, self.symbols, after, self.last_close)
+        if not len(days):
+            return days, closes, returns
+        # Days at least two days older than the newest bar are final on every exchange
+        final = days < days[-1] - 1
+        if final.any():
+            self.sums.update(returns[final])
+            for day, close_row, return_row in zip(days[final], closes[final], returns[final]):
+                self.days.append(day)
+                self.closes.append(close_row)
+                self.returns.append(return_row)
+            committed = closes[final]
+            seen = ~np.isnan(committed)
+            last_rows = len(committed) - 1 - np.argmax(seen[::-1], axis=0)
+            self.last_close = np.where(seen.any(axis=0), committed[last_rows, np.arange(len(self.symbols))],
+                                       self.last_close)
+            while len(self.days) > self.window:
+                self.days.popleft()
+                self.closes.popleft()
+                self.sums.update(self.returns.popleft(), sign=-1)
+        return days[~final], closes[~final], returns[~final]
+
+    def report(self, days, closes, returns):
+        """Figures for the committed window plus the provisional rows"""
+        sums = self.sums
+        if len(days):
+            sums = sums.copy()
+            sums.update(returns)
+        covariance = sums.covariance()
+        size = len(self.symbols)
+        all_days = np.concatenate([np.array(self.days, dtype=np.int64), days])
+        all_closes = np.vstack([np.array(self.closes).reshape(-1, size), closes])
+        all_returns = np.vstack([np.array(self.returns).reshape(-1, size), returns])
+
+        # The benchmark is the last column
+        variance = np.diag(covariance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            deviation = np.sqrt(variance)
+            correlation = np.clip(covariance / np.outer(deviation, deviation), -1, 1)
+            beta = covariance[:, -1] / variance[-1]
+        if len(all_closes):
+            drawdowns = _drawdowns(all_closes)
+            current, deepest = drawdowns[-1], np.fmin.reduce(drawdowns, axis=0)
+        else:
+            current = deepest = np.full(size, np.nan)
+
+        # Equal-weight portfolio of the symbols with enough history
+        holdings = np.flatnonzero(~np.isnan(variance[:-1]))
+        portfolio = {"volatility": None, "beta": None, "drawdown": None, "max_drawdown": None,
+                     "drawdown_series": {"dates": [], "values": []}}
+        if len(holdings):
+            weights = np.full(len(holdings), 1 / len(holdings))
+            # Pairs that never traded on the same day contribute no covariance
+            portfolio_variance = weights @ np.nan_to_num(covariance[np.ix_(holdings, holdings)]) @ weights
+            held = all_returns[:, holdings]
+            count = (~np.isnan(held)).sum(axis=1)
+            # Rebalanced daily; a day none of the holdings traded counts as flat
+            daily = np.where(count > 0, np.nansum(held, axis=1) / np.maximum(count, 1), 0.0)
+            value = np.cumprod(1 + daily)
+            drawdown = value / np.maximum.accumulate(value) - 1
+            portfolio = {
+                "volatility": _floats([np.sqrt(portfolio_variance) * ANNUALIZE])[0],
+                "beta": _floats([weights @ beta[holdings]], 3)[0],
+                "drawdown": _floats(drawdown[-1:] * 100)[0],
+                "max_drawdown": _floats([drawdown.min() * 100])[0],
+                "drawdown_series": {"dates": [str(day) for day in all_days.astype('datetime64[D]')],
+                                    "values": _floats(drawdown * 100)},
+            }
+
+        symbols = self.symbols[:-1]
+        return {
+            "symbols": symbols,
+            "benchmark": self.symbols[-1],
+            "as_of": str(all_days[-1:].astype('datetime64[D]')[0]) if len(all_days) else None,
+            "days": len(all_days),
+            "volatility": _floats(deviation[:-1] * ANNUALIZE),
+            "beta": _floats(beta[:-1], 3),
+            "drawdown": _floats(current[:-1] * 100),
+            "max_drawdown": _floats(deepest[:-1] * 100),
+            "correlation": [_floats(row, 3) for row in correlation[:-1, :-1]],
+            "benchmark_volatility": _floats(deviation[-1:] * ANNUALIZE)[0],
+            "portfolio": portfolio,
+            "missing": [symbol for symbol, value in zip(symbols, variance[:-1]) if np.isnan(value)],
+        }
+
+
+class PortfolioAnalytics:
+    """Per-watchlist running return statistics, updated with the bars added since the last request
+
+    A portfolio's state is rebuilt from scratch once it is rebuild_after
+    seconds old, which also picks up backfilled history and bounds
+    floating-point drift in the running sums.
+    """
+
+    def __init__(self, market_data, window=TRADING_DAYS, max_portfolios=32, rebuild_after=24 * 3600):
+        self.market_data = market_data
+        self.window = window
+        self.max_portfolios = max_portfolios
+        self.rebuild_after = rebuild_after
+        self._portfolios = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _portfolio(self, key):
+        with self._lock:
+            portfolio = self._portfolios.get(key)
+            if portfolio is None or time.time() - portfolio.built_at >= self.rebuild_after:
+                portfolio = self._portfolios[key] = _Portfolio(list(key), self.window)
+            self._portfolios.move_to_end(key)
+            while len(self._portfolios) > self.max_portfolios:
+                self._portfolios.popitem(last=False)
+            return portfolio
+
+    @timed("portfolio")
+    def analyze(self, symbols, benchmark):
+        """Volatility, beta vs benchmark, drawdowns and correlations for symbols"""
+        portfolio = self._portfolio(tuple(symbols) + (benchmark,))
+        with portfolio.lock:
+            if portfolio.days:
+                # Only bars after the last committed day are needed
+                start = datetime(1970, 1, 1) + timedelta(days=int(portfolio.days[-1]))
+            else:
+                # Calendar days spanning the window, plus a margin for holidays
+                start = datetime.now() - timedelta(days=self.window * 365 // TRADING_DAYS + 10)
+            frames = self.market_data.bars_many(portfolio.symbols, start)
+            return portfolio.report(*portfolio.advance(frames))
@@ -0,0 +1,81 @@
+"""Closed-form linear trend prediction, vectorized across symbols
+
+Ordinary least squares on (day index, price) has a two-parameter closed form,
+so a whole matrix of price series is fitted with a handful of array reductions
+instead of one estimator per symbol.
+"""
+import numpy as np
+
+from metrics import timed
+
+DEFAULT_LOOKBACK = 30
+DEFAULT_HORIZON = 1
+
+NO_PREDICTION = {
+    "next_day_price": "N/A",
+    "confidence": 0,
+    "trend": "neutral"
+}
+
+
+def fit_trends(prices, lookback=DEFAULT_LOOKBACK, horizon=DEFAULT_HORIZON):
+    """Fit the last lookback columns of a (symbols x days) price matrix
+
+    Missing values (NaN) are ignored, so shorter series can be left-padded.
+    Returns arrays (slope, intercept, forecast, r_squared, count) with one entry
+    per row; x is the column index and the forecast is taken horizon steps
+    after the last column.
+    """
+    y = np.atleast_2d(np.asarray(prices, dtype=np.float64))[:, -lookback:]
+    valid = ~np.isnan(y)
+    x = np.broadcast_to(np.arange(y.shape[1], dtype=np.float64), y.shape)
+
+    n = valid.sum(axis=1).astype(np.float64)
+    yv = np.where(valid, y, 0.0)
+    xv = np.where(valid, x, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = xv.sum(axis=1) / n
+        y_mean = yv.sum(axis=1) / n
+        dx = np.where(valid, x - x_mean[:, None], 0.0)
+        dy = np.where(valid, y - y_mean[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        sxy = (dx * dy).sum(axis=1)
+        syy = (dy * dy).sum(axis=1)
+
+        slope = sxy / sxx
+        intercept = y_mean - slope * x_mean
+        forecast = intercept + slope * (y.shape[1] - 1 + horizon)
+
+        # R^2 = 1 - SS_res / SS_tot; a flat series is a perfect fit (as in sklearn)
+        ss_res = np.maximum(syy - slope * sxy, 0.0)
+        r_squared = np.where(syy > 0, 1.0 - ss_res / syy, np.where(ss_res > 0, 0.0, 1.0))
+
+    return slope, intercept, forecast, r_squared, n
+
+
+def _as_prediction(slope, forecast, r_squared, count):
+    if count < 2 or not np.isfinite(forecast):
+        return dict(NO_PREDICTION)
+    return {
+        "next_day_price": round(float(forecast), 2),
+        "confidence": round(float(r_squared) * 100, 1),
+        "trend": "bullish" if slope > 0 else "bearish"
+    }
+
+
+@timed("prediction")
+def predict_many(prices, lookback=DEFAULT_LOOKBACK, horizon=DEFAULT_HORIZON):
+    """Prediction dicts for every row of a (symbols x days) price matrix"""
+    slope, _, forecast, r_squared, count = fit_trends(prices, lookback, horizon)
+    return [_as_prediction(*row) for row in zip(slope, forecast, r_squared, count)]
+
+
+def predict(prices, lookback=DEFAULT_LOOKBACK, horizon=DEFAULT_HORIZON):
+    """Prediction dict {next_day_price, confidence, trend} for one price series"""
+    try:
+        values = np.asarray(prices, dtype=np.float64)
+        if values.size == 0:
+            return dict(NO_PREDICTION)
+        return predict_many(values[None, :], lookback, horizon)[0]
+    except Exception:
+        return dict(NO_PREDICTION)
@@ -0,0 +1,217 @@
+"""Batch quote engine - many symbols for roughly the cost of one upstream round trip"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from gateway import UpstreamUnavailable, note_stale
+from metrics import count_error
+
+
+class QuoteEngine:
+    """Fetches latest-bar quotes (and optionally info) for a list of symbols
+
+    Prices come from a single bulk history download; if that fails, each symbol
+    is fetched on its own through a bounded thread pool. Metadata lookups are
+    always fanned out over the pool. A failing symbol is dropped from the result
+    instead of failing the batch. Callers that can tolerate slightly old prices
+    pass max_age to reuse quotes fetched within that many seconds - by this
+    process, or by any worker when a shared cache is configured. With a session
+    calendar, a quote fetched after its market closed is reused by every caller
+    (even with max_age=0) until the market reopens. A symbol whose fetch fails
+    falls back to its last known quote (reported stale) if there is one.
+    """
+
+    # How long quotes are kept around for max_age lookups and stale fallbacks
+    RECENT_TTL = 24 * 3600
+
+    def __init__(self, market_data, max_workers=8, shared=None, sessions=None, max_recent=10000):
+        self.market_data = market_data
+        self.max_workers = max_workers
+        self.max_recent = max_recent
+        self.shared = shared
+        self.sessions = sessions
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quotes")
+        self._recent = OrderedDict()  # (symbol, period) -> (fetched_at, quote), oldest first
+        self._recent_lock = threading.Lock()
+
+    def _histories(self, symbols, period):
+        try:
+            return self.market_data.history_many(symbols, period=period)
+        except UpstreamUnavailable as e:
+            # Refused by the gateway - per-symbol retries would only spend more budget
+            count_error("quotes", e)
+            return {}
+        except Exception as e:
+            count_error("quotes", e)
+            print(f"Bulk history fetch failed, falling back to per-symbol fetches: {e}")
+
+        frames = {}
+        futures = {symbol: self._submit(self.market_data.history, symbol, period=period)
+                   for symbol in symbols}
+        for symbol, future in futures.items():
+            try:
+                frame = future.result()
+                if not frame.empty:
+                    frames[symbol] = frame
+            except Exception as e:
+                count_error("quotes", e)
+                print(f"Error fetching history for {symbol}: {e}")
+        return frames
+
+    def infos(self, symbols, fields=None):
+        """{symbol: info dict}; symbols whose lookup failed get an empty dict"""
+        return self._collect_infos(self._submit_infos(symbols, fields))
+
+    def _submit(self, fn, *args, **kwargs):
+        # Pool threads run in the caller's context so its upstream priority applies
+        return self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def _submit_infos(self, symbols, fields=None):
+        return {symbol: self._submit(self.market_data.info, symbol, fields)
+                for symbol in symbols}
+
+    def _collect_infos(self, futures):
+        infos = {}
+        for symbol, future in futures.items():
+            try:
+                infos[symbol] = future.result() or {}
+            except Exception as e:
+                count_error("quotes", e)
+                print(f"Error fetching info for {symbol}: {e}")
+                infos[symbol] = {}
+        return infos
+
+    def get_quotes(self, symbols, period="2d", with_info=False, info_fields=None, max_age=0):
+        """{symbol: quote} in input order, for every symbol that returned bars
+
+        A quote carries the raw (unrounded) latest close, the previous close
+        (None if only one bar came back), the latest bar's volume/high/low and,
+        with with_info=True, the symbol's info dict (cached; info_fields names
+        the fields the caller reads so only those decide freshness).
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+
+        # Start metadata lookups first so they overlap the price download
+        info_futures = self._submit_infos(symbols, info_fields) if with_info else {}
+        cached = self._cached_quotes(symbols, period, max_age)
+        missing = [symbol for symbol in symbols if symbol not in cached]
+        frames = self._histories(missing, period) if missing else {}
+        failed = [symbol for symbol in missing if symbol not in frames]
+        if failed:
+            stale = self._cached_quotes(failed, period, None)
+            if stale:
+                note_stale("quotes")
+                cached.update(stale)
+        infos = self._collect_infos(info_futures)
+
+        quotes = {}
+        for symbol in symbols:
+            if symbol in cached:
+                quote = dict(cached[symbol])
+                if with_info:
+                    quote["info"] = infos.get(symbol, {})
+                quotes[symbol] = quote
+                continue
+            hist = frames.get(symbol)
+            if hist is None or hist.empty:
+                continue
+            try:
+                quote = {
+                    "symbol": symbol,
+                    "price": float(hist['Close'].iloc[-1]),
+                    "prev_close": float(hist['Close'].iloc[-2]) if len(hist) > 1 else None,
+                    "volume": int(hist['Volume'].iloc[-1]),
+                    "day_high": float(hist['High'].iloc[-1]),
+                    "day_low": float(hist['Low'].iloc[-1]),
+                }
+            except Exception as e:
+                count_error("quotes", e)
+                print(f"Error building quote for {symbol}: {e}")
+                continue
+            self._remember(symbol, period, quote)
+            if with_info:
+                quote["info"] = infos.get(symbol, {})
+            quotes[symbol] = quote
+        return quotes
+
+    def _max_age(self, symbol, max_age):
+        if max_age is None or self.sessions is None:
+            return max_age
+        return self.sessions.max_age(symbol, max_age)
+
+    def _remember(self, symbol, period, quote):
+        # Kept locally even with a shared cache, for the warm cache and as a fallback
+        now = time.time()
+        with self._recent_lock:
+            self._recent[(symbol, period)] = (now, dict(quote))
+            self._recent.move_to_end((symbol, period))
+            self._prune(now)
+        if self.shared is not None:
+            ttl = self.RECENT_TTL
+            if self.sessions is not None:
+                ttl = self.sessions.expires_in(symbol, ttl)
+            self.shared.set(f"quote:{period}:{symbol}", dict(quote), ttl)
+
+    def _prune(self, now):
+        """Drop quotes older than RECENT_TTL, then the oldest beyond max_recent (lock held)"""
+        cutoff = now - self.RECENT_TTL
+        while self._recent and (len(self._recent) > self.max_recent
+                                or next(iter(self._recent.values()))[0] <= cutoff):
+            self._recent.popitem(last=False)
+
+    def export(self):
+        """[(symbol, period, fetched_at, quote)] for the quotes this process remembers"""
+        cutoff = time.time() - self.RECENT_TTL
+        with self._recent_lock:
+            return [(symbol, period, fetched_at, quote)
+                    for (symbol, period), (fetched_at, quote) in self._recent.items() if fetched_at > cutoff]
+
+    def restore(self, entries):
+        """Re-add exported quotes still within RECENT_TTL (newer quotes already held win)
+
+        With a shared cache they are also offered to it, so every worker can use them.
+        """
+        now = time.time()
+        entries = sorted((entry for entry in entries if entry[2] > now - self.RECENT_TTL), key=lambda entry: entry[2])
+        with self._recent_lock:
+            for symbol, period, fetched_at, quote in entries:
+                self._recent.setdefault((symbol, period), (fetched_at, quote))
+            self._prune(now)
+        if self.shared is not None:
+            self.shared.restore([(f"quote:{period}:{symbol}", fetched_at + self.RECENT_TTL, fetched_at, quote)
+                                 for symbol, period, fetched_at, quote in entries])
+
+    def _cached_quotes(self, symbols, period, max_age):
+        cached = {}
+        # max_age=None accepts a quote of any age (fallback when upstream fails)
+        ages = {symbol: self._max_age(symbol, max_age) for symbol in symbols}
+        ages = {symbol: age for symbol, age in ages.items() if age is None or age > 0}
+        if not ages:
+            return cached
+        if self.shared is not None:
+            for symbol, age in ages.items():
+                entry = self.shared.get(f"quote:{period}:{symbol}", age)
+                if entry is not None:
+                    cached[symbol] = entry[0]
+
+        # Quotes this process fetched or restored, for any the shared cache no longer has
+        now = time.time()
+        with self._recent_lock:
+            for symbol, age in ages.items():
+                if symbol in cached:
+                    continue
+                entry = self._recent.get((symbol, period))
+                if entry is not None and (age is None or now - entry[0] < age):
+                    cached[symbol] = entry[1]
+        return cached
+
+
+def create_quote_engine(market_data, shared_cache=None, sessions=None):
+    return QuoteEngine(market_data, max_workers=int(os.environ.get("QUOTE_WORKERS", "8")),
+                       shared=shared_cache, sessions=sessions,
+                       max_recent=int(os.environ.get("RECENT_QUOTES", "10000")))
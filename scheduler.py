@@ -0,0 +1,205 @@
+"""Background-refreshed snapshots served stale-while-revalidate
+
+Endpoints whose result is the same for every user register a compute function
+and an interval. A scheduler thread refreshes each snapshot when it falls due;
+requests always get the last good snapshot immediately and only trigger a
+refresh themselves if the background one has fallen behind. A failed refresh
+(or, for jobs registered with keep_if_empty, an empty result) keeps the
+previous snapshot. Jobs registered with the symbols they quote are not
+refreshed while all of those symbols' markets are closed.
+"""
+import itertools
+import threading
+import time
+
+from http_cache import compress, etag
+from metrics import count_error
+from serialization import dumps
+
+_versions = itertools.count(1)
+
+
+class Snapshot:
+    """A computed value plus its pre-encoded JSON body
+
+    The ETag is a hash of the body, so every worker (and every recompute that
+    yields the same data) hands out the same tag.
+    """
+
+    def __init__(self, value, created_at=None):
+        self.value = value
+        self.body = dumps(value)
+        self.etag = etag(self.body)
+        self.created_at = time.time() if created_at is None else created_at
+        self.version = next(_versions)
+        self._encoded = {}
+
+    def age(self):
+        return time.time() - self.created_at
+
+    def encoded(self, encoding):
+        """Body compressed with encoding, compressed once per snapshot"""
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.body, encoding, best=True)
+        return body
+
+
+class _Job:
+    def __init__(self, name, compute, interval, keep_if_empty, symbols):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.keep_if_empty = keep_if_empty
+        self.symbols = symbols
+        self.snapshot = None
+        self.last_error = None
+        self.last_attempt = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+        self.first_lock = threading.Lock()
+
+
+class SnapshotScheduler:
+    """Keeps named snapshots fresh on their own intervals
+
+    With a shared cache, worker processes take turns: whichever is due first
+    computes the snapshot and the others pick up its result.
+    """
+
+    def __init__(self, tick=1.0, shared=None, sessions=None):
+        self.tick = tick
+        self.shared = shared
+        self.sessions = sessions
+        self._jobs = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def register(self, name, compute, interval, keep_if_empty=False, symbols=()):
+        self._jobs[name] = _Job(name, compute, interval, keep_if_empty, list(symbols))
+
+    def _max_age(self, job):
+        if self.sessions is None or not job.symbols:
+            return job.interval
+        return self.sessions.max_age(job.symbols, job.interval)
+
+    def start(self):
+        """Start the refresh thread (idempotent; called lazily on first use)"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for job in self._jobs.values():
+                if self._due(job):
+                    self._refresh_async(job)
+            self._stop.wait(self.tick)
+
+    def _due(self, job):
+        # Failed refreshes are retried once per interval, not on every tick
+        now = time.time()
+        snapshot_due = job.snapshot is None or now - job.snapshot.created_at >= self._max_age(job)
+        return snapshot_due and now - job.last_attempt >= job.interval
+
+    def _refresh(self, job):
+        job.last_attempt = time.time()
+
+        def compute():
+            value = job.compute()
+            if job.keep_if_empty and not value and job.snapshot is not None:
+                raise RuntimeError("refresh returned no data")
+            return value
+
+        try:
+            if self.shared is None:
+                job.snapshot = Snapshot(compute())
+            else:
+                ttl = job.interval * 10
+                if self.sessions is not None and job.symbols:
+                    ttl = self.sessions.expires_in(job.symbols, ttl)
+                value, created_at = self.shared.get_or_compute("snapshot:" + job.name, compute,
+                                                               max_age=self._max_age(job), ttl=ttl)
+                if job.snapshot is None or created_at != job.snapshot.created_at:
+                    job.snapshot = Snapshot(value, created_at)
+            job.last_error = None
+        except Exception as e:
+            job.last_error = e
+            count_error("snapshot:" + job.name, e)
+            print(f"Error refreshing {job.name} snapshot: {e}")
+            raise
+        finally:
+            with job.lock:
+                job.refreshing = False
+        return job.snapshot
+
+    def _refresh_async(self, job):
+        with job.lock:
+            if job.refreshing:
+                return
+            job.refreshing = True
+
+        def refresh():
+            try:
+                self._refresh(job)
+            except Exception:
+                pass
+
+        threading.Thread(target=refresh, name=f"snapshot-{job.name}", daemon=True).start()
+
+    def get(self, name):
+        """Latest snapshot; computed synchronously only if none exists yet"""
+        self.start()
+        job = self._jobs[name]
+        snapshot = job.snapshot
+        if snapshot is None:
+            # Concurrent first requests wait for one computation and share it
+            with job.first_lock:
+                if job.snapshot is None:
+                    self._refresh(job)
+                return job.snapshot
+        if self._due(job):
+            self._refresh_async(job)
+        return snapshot
+
+    def fresh_for(self, name):
+        """Seconds until the latest snapshot is due for a refresh (0 if it already is)"""
+        job = self._jobs[name]
+        if job.snapshot is None or self._due(job):
+            return 0.0
+        lifetime = job.interval
+        if self.sessions is not None and job.symbols:
+            lifetime = self.sessions.expires_in(job.symbols, job.interval)
+        if lifetime > job.interval:
+            # Markets closed - nothing changes until the next open
+            return lifetime
+        return max(job.interval - job.snapshot.age(), 0.0)
+
+    def export(self):
+        """{name: (value, created_at)} for every job that has a snapshot"""
+        return {name: (job.snapshot.value, job.snapshot.created_at)
+                for name, job in self._jobs.items() if job.snapshot is not None}
+
+    def restore(self, values):
+        """Seed jobs that have no snapshot yet from exported values
+
+        A restored snapshot is served like any other: immediately, and refreshed
+        in the background once due. Values older than ten intervals (the shared
+        cache's lifetime for snapshots) are dropped unless still fresh.
+        """
+        now = time.time()
+        for name, (value, created_at) in values.items():
+            job = self._jobs.get(name)
+            if job is None or job.snapshot is not None:
+                continue
+            if now - created_at < max(self._max_age(job), job.interval * 10):
+                job.snapshot = Snapshot(value, created_at)
+
+    def is_stale(self, name):
+        """True when the snapshot being served survived a failed refresh"""
+        return self._jobs[name].last_error is not None
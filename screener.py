@@ -0,0 +1,211 @@
+"""Universe screener over an aligned close/volume matrix
+
+Every listed symbol's last year of daily bars is stacked into one (symbols x
+bars) close matrix and one volume matrix (right-aligned, as in analytics.py).
+A screen is a list of comparisons such as "rsi14<30" or "close>sma50" plus an
+optional ranking; each term is computed once per matrix for all symbols as
+array operations, so a scan costs the same whether it matches 5 or 5000
+symbols.
+
+The matrix is rebuilt from the bar store (refreshed with a few bulk
+downloads) every refresh_interval seconds while any listed market trades;
+requests keep using the previous matrix while a rebuild runs.
+"""
+import operator
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from analytics import price_matrix
+from gateway import BACKGROUND, priority
+from indicators import MAX_WINDOW, compute_matrix
+from metrics import count_error, timed
+
+# close, volume, change, change_pct (1 bar), or a windowed term: sma50, ema12,
+# rsi14 (Wilder), srsi14, ret5 (5-bar return %), avgvol20 (mean volume)
+TERM_PATTERN = re.compile(r"(close|volume|change|change_pct)|(sma|ema|rsi|srsi|ret|avgvol)(\d+)")
+CLAUSE_PATTERN = re.compile(r"([a-z_]+\d*)\s*(<=|>=|<|>)\s*([a-z_]+\d*|-?\d+(?:\.\d+)?)")
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+# Daily bars kept per symbol - enough for a 200-bar average plus seeding
+MATRIX_BARS = 260
+
+
+def parse_term(text):
+    """Validated term name"""
+    term = text.strip().lower()
+    match = TERM_PATTERN.fullmatch(term)
+    if match is None:
+        raise ValueError(f"Unknown screen term '{text}'")
+    if match.group(3) is not None and not 1 <= int(match.group(3)) <= min(MAX_WINDOW, MATRIX_BARS - 1):
+        raise ValueError(f"Window must be between 1 and {MATRIX_BARS - 1}: '{text}'")
+    if match.group(2) in ("sma", "ema", "rsi", "srsi") and int(match.group(3)) < 2:
+        raise ValueError(f"Indicator window must be at least 2: '{text}'")
+    return term
+
+
+def parse_filters(text):
+    """[(term, op, term or number)] from "rsi14<30,close>sma50" (all must hold)"""
+    filters = []
+    for clause in (part.strip().lower() for part in text.split(",")):
+        if not clause:
+            continue
+        match = CLAUSE_PATTERN.fullmatch(clause)
+        if match is None:
+            raise ValueError(f"Filters look like 'rsi14<30' or 'close>sma50', got '{clause}'")
+        left, op, right = match.groups()
+        right = float(right) if right[0] in "-0123456789" else parse_term(right)
+        filters.append((parse_term(left), op, right))
+    return filters
+
+
+def parse_sort(text):
+    """(term, descending) from "change_pct" or "-change_pct" (highest first)"""
+    text = text.strip()
+    descending = text.startswith("-")
+    return parse_term(text.lstrip("-")), descending
+
+
+class UniverseMatrix:
+    """Close and volume matrices for the symbols with data, plus memoized term vectors"""
+
+    def __init__(self, symbols, frames):
+        self.symbols = [symbol for symbol in symbols if symbol in frames and not frames[symbol].empty]
+        series = [frames[symbol].iloc[-MATRIX_BARS:] for symbol in self.symbols]
+        self.closes = price_matrix(series, "Close")
+        self.volumes = price_matrix(series, "Volume")
+        self.built_at = time.time()
+        self._terms = {}
+        self._lock = threading.Lock()
+
+    def term(self, name):
+        """Vector of term values, one per symbol (NaN where a series is too short)"""
+        with self._lock:
+            values = self._terms.get(name)
+        if values is None:
+            values = self._compute(name)
+            with self._lock:
+                self._terms[name] = values
+        return values
+
+    def _compute(self, name):
+        closes, volumes = self.closes, self.volumes
+        if closes.shape[1] == 0:
+            return np.full(len(self.symbols), np.nan)
+        match = TERM_PATTERN.fullmatch(name)
+        if match.group(1) == "close":
+            return closes[:, -1]
+        if match.group(1) == "volume":
+            return volumes[:, -1]
+        if match.group(1) in ("change", "change_pct"):
+            previous = closes[:, -2] if closes.shape[1] > 1 else np.full(len(closes), np.nan)
+            if match.group(1) == "change":
+                return closes[:, -1] - previous
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return (closes[:, -1] / previous - 1) * 100
+
+        kind, window = match.group(2), int(match.group(3))
+        if kind == "ret":
+            if closes.shape[1] <= window:
+                return np.full(len(closes), np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return (closes[:, -1] / closes[:, -1 - window] - 1) * 100
+        if kind == "avgvol":
+            tail = volumes[:, -window:]
+            count = (~np.isnan(tail)).sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(count >= window, np.nansum(tail, axis=1) / count, np.nan)
+        spec = f"{kind}{window}"
+        return np.array([np.nan if value is None else value for value in compute_matrix(closes, [spec])[spec]],
+                        dtype=np.float64)
+
+
+class Screener:
+    """Filters and ranks the listed universe; the matrix is shared by all requests"""
+
+    def __init__(self, market_data, symbols, refresh_interval=900, sessions=None, chunk_size=500):
+        self.market_data = market_data
+        self.symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        self.refresh_interval = refresh_interval
+        self.sessions = sessions
+        self.chunk_size = chunk_size
+        # One symbol per exchange is enough for session checks
+        self._session_symbols = self.symbols
+        if sessions is not None:
+            by_exchange = {}
+            for symbol in self.symbols:
+                by_exchange.setdefault(sessions.exchange_for(symbol), symbol)
+            self._session_symbols = list(by_exchange.values())
+        self._matrix = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self._first_lock = threading.Lock()
+
+    def _due(self, matrix):
+        max_age = self.refresh_interval
+        if self.sessions is not None:
+            max_age = self.sessions.max_age(self._session_symbols, self.refresh_interval)
+        return time.time() - matrix.built_at >= max_age
+
+    @timed("screen_build")
+    def _build(self):
+        start = datetime.now() - timedelta(days=365)
+        frames = {}
+        # Bulk downloads in chunks, drawn from the background share of the upstream budget
+        with priority(BACKGROUND):
+            for i in range(0, len(self.symbols), self.chunk_size):
+                frames.update(self.market_data.bars_many(self.symbols[i:i + self.chunk_size], start))
+        self._matrix = UniverseMatrix(self.symbols, frames)
+        return self._matrix
+
+    def _rebuild_async(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def rebuild():
+            try:
+                self._build()
+            except Exception as e:
+                count_error("screen", e)
+                print(f"Error rebuilding screener matrix: {e}")
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=rebuild, name="screener-rebuild", daemon=True).start()
+
+    def matrix(self):
+        """Latest universe matrix; built synchronously only if there is none yet"""
+        matrix = self._matrix
+        if matrix is None:
+            with self._first_lock:
+                if self._matrix is None:
+                    self._build()
+                return self._matrix
+        if self._due(matrix):
+            self._rebuild_async()
+        return matrix
+
+    @timed("screen")
+    def screen(self, filters=(), sort=None, limit=50):
+        """(matrix, row indices of the matches in rank order, total matched)"""
+        matrix = self.matrix()
+        mask = np.ones(len(matrix.symbols), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for left, op, right in filters:
+                # NaN (not enough history) never passes a comparison
+                right_values = right if isinstance(right, float) else matrix.term(right)
+                mask &= OPERATORS[op](matrix.term(left), right_values)
+        matched = np.flatnonzero(mask)
+        if sort is not None:
+            term, descending = sort
+            values = matrix.term(term)[matched]
+            key = -values if descending else values
+            # NaN sorts last either way; ties keep listing order
+            matched = matched[np.lexsort((matched, key, np.isnan(key)))]
+        return matrix, matched[:limit], len(matched)
@@ -0,0 +1,126 @@
+"""In-memory symbol search index built once at startup"""
+import bisect
+import csv
+import json
+import os
+
+import numpy as np
+
+# Relevance weights - a listing scores the symbol part plus the name part
+SYMBOL_PREFIX_SCORE = 10
+SYMBOL_MATCH_SCORE = 5
+NAME_PREFIX_SCORE = 8
+NAME_MATCH_SCORE = 3
+
+MAX_GRAM = 3
+
+
+def load_listings(path):
+    """Listings from a CSV (symbol,name[,country,sector] header) or JSON list file"""
+    if path.endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    listings = []
+    for row in rows:
+        symbol = (row.get("symbol") or "").strip().upper()
+        if symbol:
+            listings.append({
+                "symbol": symbol,
+                "name": (row.get("name") or symbol).strip(),
+                "country": row.get("country") or "N/A",
+                "sector": row.get("sector") or "N/A",
+            })
+    return listings
+
+
+class _FieldIndex:
+    """Prefix and substring lookups over one lower-cased text field
+
+    Prefixes are answered from the keys in sorted order (a flattened trie: all
+    keys sharing a prefix are one contiguous slice). Substrings come from
+    posting lists of every 1..3-gram; longer queries intersect their trigram
+    postings and verify the survivors.
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.order = np.array(sorted(range(len(texts)), key=texts.__getitem__), dtype=np.int64)
+        self.sorted_texts = [texts[i] for i in self.order]
+
+        postings = {}
+        for doc_id, text in enumerate(texts):
+            grams = {text[i:i + n] for n in range(1, MAX_GRAM + 1) for i in range(len(text) - n + 1)}
+            for gram in grams:
+                postings.setdefault(gram, []).append(doc_id)
+        self.postings = {gram: np.array(ids, dtype=np.int64) for gram, ids in postings.items()}
+
+    def prefix(self, query):
+        lo = bisect.bisect_left(self.sorted_texts, query)
+        hi = bisect.bisect_left(self.sorted_texts, query + "\uffff")
+        return self.order[lo:hi]
+
+    def contains(self, query):
+        empty = np.empty(0, dtype=np.int64)
+        if len(query) <= MAX_GRAM:
+            return self.postings.get(query, empty)
+
+        candidates = None
+        for i in range(len(query) - MAX_GRAM + 1):
+            ids = self.postings.get(query[i:i + MAX_GRAM])
+            if ids is None:
+                return empty
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+            if candidates.size == 0:
+                return empty
+        return np.array([i for i in candidates if query in self.texts[i]], dtype=np.int64)
+
+
+class SearchIndex:
+    """Relevance-ranked symbol/name search over a fixed set of listings"""
+
+    def __init__(self, listings):
+        # First occurrence of a symbol wins
+        seen_symbols = set()
+        self.listings = []
+        for listing in listings:
+            if listing['symbol'] not in seen_symbols:
+                self.listings.append(listing)
+                seen_symbols.add(listing['symbol'])
+
+        self._symbols = _FieldIndex([listing['symbol'].lower() for listing in self.listings])
+        self._names = _FieldIndex([listing['name'].lower() for listing in self.listings])
+
+    @classmethod
+    def build(cls, listings, path=None):
+        """Index over the given listings plus, if path exists, the listings in that file"""
+        listings = list(listings)
+        if path and os.path.exists(path):
+            listings += load_listings(path)
+        return cls(listings)
+
+    def __len__(self):
+        return len(self.listings)
+
+    def search(self, query, limit=20):
+        """Top listings for query, highest relevance first (ties keep listing order)"""
+        query = query.lower().strip()
+        if not query:
+            return []
+
+        scores = np.zeros(len(self.listings), dtype=np.int64)
+        # A prefix match is also a substring match, so prefix adds the difference
+        scores[self._symbols.contains(query)] += SYMBOL_MATCH_SCORE
+        scores[self._symbols.prefix(query)] += SYMBOL_PREFIX_SCORE - SYMBOL_MATCH_SCORE
+        scores[self._names.contains(query)] += NAME_MATCH_SCORE
+        scores[self._names.prefix(query)] += NAME_PREFIX_SCORE - NAME_MATCH_SCORE
+
+        matched = np.flatnonzero(scores)
+        if matched.size > limit:
+            # Only fully sort the candidates that can make the cut
+            cutoff = np.partition(scores[matched], matched.size - limit)[matched.size - limit]
+            matched = matched[scores[matched] >= cutoff]
+        ranked = matched[np.lexsort((matched, -scores[matched]))][:limit]
+        return [self.listings[i] for i in ranked]
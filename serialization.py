@@ -0,0 +1,66 @@
+"""Vectorized JSON serialization for price series"""
+import json
+
+import numpy as np
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # optional - falls back to the standard library encoder
+    orjson = None
+
+PRICE_COLUMNS = (("open", "Open"), ("high", "High"), ("low", "Low"), ("close", "Close"))
+
+
+def historical_columns(frame, date_format='%Y-%m-%d'):
+    """Parallel arrays {dates, open, high, low, close, volume} for an OHLCV frame"""
+    columns = {"dates": frame.index.strftime(date_format).tolist()}
+    for key, name in PRICE_COLUMNS:
+        columns[key] = np.round(frame[name].to_numpy(dtype=np.float64), 2).tolist()
+    columns["volume"] = frame['Volume'].to_numpy(dtype=np.float64).astype(np.int64).tolist()
+    return columns
+
+
+def historical_rows(frame, date_format='%Y-%m-%d'):
+    """One {date, open, high, low, close, volume} dict per bar, built from the column arrays"""
+    columns = historical_columns(frame, date_format)
+    return [
+        {"date": date, "open": o, "high": h, "low": l, "close": c, "volume": v}
+        for date, o, h, l, c, v in zip(columns["dates"], columns["open"], columns["high"],
+                                       columns["low"], columns["close"], columns["volume"])
+    ]
+
+
+def historical_payload(frame, fmt="rows", date_format='%Y-%m-%d'):
+    """Historical series in the requested response format ("rows" or "columnar")"""
+    if fmt == "columnar":
+        return historical_columns(frame, date_format)
+    return historical_rows(frame, date_format)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """Serialize to compact JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_json_default, separators=(",", ":")).encode()
+
+
+def loads(data):
+    """Parse JSON bytes or text, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(data, status=200):
+    """Flask response for data encoded with the fast encoder"""
+    return Response(dumps(data), status=status, mimetype="application/json")
@@ -0,0 +1,285 @@
+"""Exchange trading calendars and session-aware cache lifetimes
+
+Each exchange's sessions (open and close instants, as epoch seconds) are
+precomputed for a rolling window of days, so checking whether a market is open
+is a bisect over a sorted list rather than a timezone conversion.
+
+Caches ask two questions of the calendar:
+  max_age(symbols, ttl)     - how old a cached value may be when served. While
+                              a market trades (or is settling right after the
+                              close) that is ttl; once it is closed, anything
+                              fetched after it settled is fresh until it opens.
+  expires_in(symbols, ttl)  - how long to keep a value fetched now: ttl while
+                              trading, otherwise until the next open.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pytz
+
+# Minutes after the close during which late prints and the official close can
+# still change the last bar - treated as trading for cache purposes
+SETTLE_SECONDS = 15 * 60
+
+# Days of sessions precomputed either side of "now"
+WINDOW_DAYS = 400
+
+# Full-day closures on weekdays. Festival holidays in India follow the
+# exchange's annual circular: 2026 is the full NSE list (including the 15 January
+# municipal election closure); 2027 has only the fixed-date holidays until the
+# circular is out - add them via MARKET_HOLIDAYS_FILE.
+HOLIDAYS = {
+    "NYSE": [
+        "2025-01-01", "2025-01-09", "2025-01-20", "2025-02-17", "2025-04-18", "2025-05-26",
+        "2025-06-19", "2025-07-04", "2025-09-01", "2025-11-27", "2025-12-25",
+        "2026-01-01", "2026-01-19", "2026-02-16", "2026-04-03", "2026-05-25", "2026-06-19",
+        "2026-07-03", "2026-09-07", "2026-11-26", "2026-12-25",
+        "2027-01-01", "2027-01-18", "2027-02-15", "2027-03-26", "2027-05-31", "2027-06-18",
+        "2027-07-05", "2027-09-06", "2027-11-25", "2027-12-24",
+    ],
+    "NSE": [
+        "2025-02-26", "2025-03-14", "2025-03-31", "2025-04-10", "2025-04-14", "2025-04-18",
+        "2025-05-01", "2025-08-15", "2025-08-27", "2025-10-02", "2025-10-21", "2025-10-22",
+        "2025-11-05", "2025-12-25",
+        "2026-01-15", "2026-01-26", "2026-03-03", "2026-03-26", "2026-03-31", "2026-04-03",
+        "2026-04-14", "2026-05-01", "2026-05-28", "2026-06-26", "2026-09-14", "2026-10-02",
+        "2026-10-20", "2026-11-10", "2026-11-24", "2026-12-25",
+        "2027-01-26", "2027-03-26", "2027-04-14",
+    ],
+    "LSE": [
+        "2025-01-01", "2025-04-18", "2025-04-21", "2025-05-05", "2025-05-26", "2025-08-25",
+        "2025-12-25", "2025-12-26",
+        "2026-01-01", "2026-04-03", "2026-04-06", "2026-05-04", "2026-05-25", "2026-08-31",
+        "2026-12-25", "2026-12-28",
+        "2027-01-01", "2027-03-26", "2027-03-29", "2027-05-03", "2027-05-31", "2027-08-30",
+        "2027-12-27", "2027-12-28",
+    ],
+    "TSE": [
+        "2025-01-01", "2025-01-02", "2025-01-03", "2025-01-13", "2025-02-11", "2025-02-24",
+        "2025-03-20", "2025-04-29", "2025-05-05", "2025-05-06", "2025-07-21", "2025-08-11",
+        "2025-09-15", "2025-09-23", "2025-10-13", "2025-11-03", "2025-11-24", "2025-12-31",
+        "2026-01-01", "2026-01-02", "2026-01-12", "2026-02-11", "2026-02-23", "2026-03-20",
+        "2026-04-29", "2026-05-04", "2026-05-05", "2026-05-06", "2026-07-20", "2026-08-11",
+        "2026-09-21", "2026-09-22", "2026-09-23", "2026-10-12", "2026-11-03", "2026-11-23",
+        "2026-12-31",
+        "2027-01-01", "2027-01-11", "2027-02-11", "2027-02-23", "2027-03-22", "2027-04-29",
+        "2027-05-03", "2027-05-04", "2027-05-05", "2027-07-19", "2027-08-11", "2027-09-20",
+        "2027-09-23", "2027-10-11", "2027-11-03", "2027-11-23", "2027-12-31",
+    ],
+}
+
+# Shortened sessions - date -> close time
+EARLY_CLOSES = {
+    "NYSE": {"2025-07-03": "13:00", "2025-11-28": "13:00", "2025-12-24": "13:00",
+             "2026-11-27": "13:00", "2026-12-24": "13:00", "2027-11-26": "13:00"},
+    "LSE": {"2025-12-24": "12:30", "2025-12-31": "12:30", "2026-12-24": "12:30",
+            "2026-12-31": "12:30", "2027-12-24": "12:30", "2027-12-31": "12:30"},
+}
+
+# Symbol suffix / index -> exchange; anything else is treated as a US listing
+SUFFIX_EXCHANGES = {".NS": "NSE", ".BO": "NSE", ".L": "LSE", ".T": "TSE"}
+INDEX_EXCHANGES = {"^NSEI": "NSE", "^BSESN": "NSE", "^FTSE": "LSE", "^N225": "TSE"}
+
+
+def _minutes(text):
+    hours, minutes = map(int, text.split(":"))
+    return hours * 60 + minutes
+
+
+class Exchange:
+    """One exchange's regular hours, holidays and precomputed sessions
+
+    A trading day with breaks (e.g. Tokyo's lunch) is split into one session
+    per trading period, so a break is closed time like any other.
+    """
+
+    def __init__(self, code, name, timezone, open_time, close_time, holidays=(), early_closes=None,
+                 breaks=()):
+        self.code = code
+        self.name = name
+        self.timezone = timezone
+        self.tz = pytz.timezone(timezone)
+        self.open_minute = _minutes(open_time)
+        self.close_minute = _minutes(close_time)
+        self.holidays = {date.fromisoformat(day) for day in holidays}
+        self.early_closes = {date.fromisoformat(day): _minutes(close)
+                             for day, close in (early_closes or {}).items()}
+        self.breaks = [(_minutes(start), _minutes(end)) for start, end in breaks]
+        self._opens = []
+        self._closes = []
+        self._built_for = None
+        self._lock = threading.Lock()
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def _instant(self, day, minute):
+        local = datetime(day.year, day.month, day.day, minute // 60, minute % 60)
+        return self.tz.localize(local).timestamp()
+
+    def _periods(self, day):
+        """(open, close) minutes of each trading period of a trading day"""
+        close = self.early_closes.get(day, self.close_minute)
+        periods, start = [], self.open_minute
+        for break_start, break_end in self.breaks:
+            if break_start >= close:
+                break
+            periods.append((start, break_start))
+            start = break_end
+        if start < close:
+            periods.append((start, close))
+        return periods
+
+    def _sessions(self, now):
+        # Rebuild the window at most once a day
+        today = date.fromtimestamp(now)
+        with self._lock:
+            if self._built_for != today:
+                opens, closes = [], []
+                day = today - timedelta(days=WINDOW_DAYS)
+                for _ in range(2 * WINDOW_DAYS + 1):
+                    if self.is_trading_day(day):
+                        for start, end in self._periods(day):
+                            opens.append(self._instant(day, start))
+                            closes.append(self._instant(day, end))
+                    day += timedelta(days=1)
+                self._opens, self._closes, self._built_for = opens, closes, today
+            return self._opens, self._closes
+
+    def session_at(self, now):
+        """(index of the latest session opened at or before now, opens, closes)"""
+        opens, closes = self._sessions(now)
+        return bisect.bisect_right(opens, now) - 1, opens, closes
+
+    def is_open(self, now=None):
+        now = time.time() if now is None else now
+        i, opens, closes = self.session_at(now)
+        return i >= 0 and now < closes[i]
+
+    def quiet_since(self, now=None):
+        """Epoch from which nothing changes until the next open, or None while trading or settling"""
+        now = time.time() if now is None else now
+        i, opens, closes = self.session_at(now)
+        if i < 0:
+            return None
+        settled = closes[i] + SETTLE_SECONDS
+        return settled if now >= settled else None
+
+    def next_open(self, now=None):
+        """Epoch of the next session open after now (None beyond the precomputed window)"""
+        now = time.time() if now is None else now
+        i, opens, _ = self.session_at(now)
+        return opens[i + 1] if i + 1 < len(opens) else None
+
+    def status(self, now=None):
+        now = time.time() if now is None else now
+        local_time = datetime.fromtimestamp(now, self.tz)
+        is_open = self.is_open(now)
+        if is_open:
+            status = "OPEN"
+        elif local_time.weekday() >= 5:
+            status = "WEEKEND"
+        elif local_time.date() in self.holidays:
+            status = "HOLIDAY"
+        elif any(start <= local_time.hour * 60 + local_time.minute < end for start, end in self.breaks):
+            status = "BREAK"
+        else:
+            status = "CLOSED"
+        return {
+            "market": self.name,
+            "status": status,
+            "local_time": local_time.strftime("%H:%M"),
+            "timezone": self.timezone,
+            "is_open": is_open
+        }
+
+
+class SessionCalendar:
+    """Trading calendar for the exchanges the dashboard lists"""
+
+    def __init__(self, exchanges):
+        self.exchanges = {exchange.code: exchange for exchange in exchanges}
+
+    def exchange_for(self, symbol):
+        """Exchange a symbol trades on (None for round-the-clock FX, futures and crypto)"""
+        symbol = symbol.upper()
+        if symbol in INDEX_EXCHANGES:
+            return self.exchanges.get(INDEX_EXCHANGES[symbol])
+        if "=" in symbol or symbol.endswith("-USD"):
+            return None
+        for suffix, code in SUFFIX_EXCHANGES.items():
+            if symbol.endswith(suffix):
+                return self.exchanges.get(code)
+        return self.exchanges.get("NYSE")
+
+    def _exchanges_for(self, symbols):
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        return {self.exchange_for(symbol) for symbol in symbols}
+
+    def is_open(self, symbol, now=None):
+        exchange = self.exchange_for(symbol)
+        return exchange is None or exchange.is_open(now)
+
+    def max_age(self, symbols, ttl, now=None):
+        """Maximum age of a cached value for symbols: ttl, or since all their markets settled"""
+        now = time.time() if now is None else now
+        quiet_since = []
+        for exchange in self._exchanges_for(symbols):
+            since = None if exchange is None else exchange.quiet_since(now)
+            if since is None:
+                return ttl
+            quiet_since.append(since)
+        if not quiet_since:
+            return ttl
+        return max(ttl, now - max(quiet_since))
+
+    def expires_in(self, symbols, ttl, now=None):
+        """How long to keep a value fetched now: ttl, or until the first of the markets opens"""
+        now = time.time() if now is None else now
+        next_opens = []
+        for exchange in self._exchanges_for(symbols):
+            if exchange is None or exchange.quiet_since(now) is None:
+                return ttl
+            next_opens.append(exchange.next_open(now) or now + ttl)
+        if not next_opens:
+            return ttl
+        return max(ttl, min(next_opens) - now)
+
+    def market_status(self, now=None):
+        """Status rows for every exchange, in calendar order"""
+        return [exchange.status(now) for exchange in self.exchanges.values()]
+
+
+def create_session_calendar():
+    """Calendar for the US, Indian, UK and Japanese markets
+
+    MARKET_HOLIDAYS_FILE may point to a JSON file of extra closures, e.g.
+    {"NSE": ["2026-03-03", ...]}. MARKET_CALENDAR=24x7 treats every market as
+    always open (benchmarks and replays that must not depend on the clock).
+    """
+    if os.environ.get("MARKET_CALENDAR") == "24x7":
+        return SessionCalendar([])
+
+    holidays = {code: list(days) for code, days in HOLIDAYS.items()}
+    path = os.environ.get("MARKET_HOLIDAYS_FILE")
+    if path:
+        with open(path) as f:
+            for code, days in json.load(f).items():
+                holidays.setdefault(code, []).extend(days)
+
+    return SessionCalendar([
+        Exchange("NYSE", "US Markets (NYSE/NASDAQ)", "America/New_York", "09:30", "16:00",
+                 holidays["NYSE"], EARLY_CLOSES["NYSE"]),
+        Exchange("NSE", "Indian Markets (NSE/BSE)", "Asia/Kolkata", "09:15", "15:30",
+                 holidays["NSE"]),
+        Exchange("LSE", "London Stock Exchange", "Europe/London", "08:00", "16:30",
+                 holidays["LSE"], EARLY_CLOSES["LSE"]),
+        # Cash session runs to 15:30 since November 2024, with a lunch break
+        Exchange("TSE", "Tokyo Stock Exchange", "Asia/Tokyo", "09:00", "15:30",
+                 holidays["TSE"], breaks=[("11:30", "12:30")]),
+    ])
@@ -0,0 +1,315 @@
+"""Cache shared by all worker processes on a node
+
+Backends:
+  local             - plain in-process dict (single worker, tests)
+  file:<dir>        - one file per key in a shared-memory directory (a per-user
+                      directory under /dev/shm by default), cross-process
+                      locking with flock
+  redis://host/db   - a Redis (or Redis-protocol) server, locking with SET NX
+
+get_or_compute() is the cross-process single-flight: when a key is missing or
+too old, one worker takes the key's lock and recomputes while the others wait
+and then read its result.
+
+Values cross process boundaries as JSON, never pickle, so whoever can write
+to the directory or the Redis server can at worst poison cached data - they
+cannot run code in the workers. Values must therefore be JSON-compatible;
+tuples come back as lists and non-string dict keys as strings.
+"""
+import contextlib
+import hashlib
+import os
+import stat
+import tempfile
+import threading
+import time
+import uuid
+
+from metrics import count_error
+from serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+
+class _KeyLocks:
+    """Lazily created threading lock per key"""
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        with self._guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+
+class LocalBackend:
+    name = "local"
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = _KeyLocks()
+
+    def get_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1], entry[2]
+
+    def set_entry(self, key, stored_at, value, ttl):
+        self._entries[key] = (time.time() + ttl, stored_at, value)
+
+    def lock(self, key):
+        return self._locks.get(key)
+
+    def entries(self):
+        """[(key, expires_at, stored_at, value)] - only this backend lives and dies with the process"""
+        return [(key,) + entry for key, entry in list(self._entries.items())]
+
+
+def _private_dir(root):
+    """Create root readable by this user only, or refuse an existing one anybody else controls"""
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):  # Windows - the default temp directory is already per user
+        return root
+    info = os.lstat(root)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Shared cache directory {root} must be a directory owned by "
+                              f"uid {os.getuid()} with mode 0700")
+    return root
+
+
+class FileBackend:
+    """Entries as JSON files in a private (shared-memory) directory
+
+    Each file's mtime is set to its expiry time, so sweep() finds expired
+    entries from the directory listing alone. Any worker writing an entry
+    sweeps at most every sweep_interval seconds, deleting expired entries with
+    their lock files and, beyond max_entries, those expiring soonest.
+    """
+
+    name = "file"
+
+    # Temporary files older than this were left by a crashed write
+    STALE_TMP_SECONDS = 3600
+
+    def __init__(self, root, max_entries=10000, sweep_interval=60):
+        self.root = _private_dir(root)
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._swept_at = 0.0
+        self._locks = _KeyLocks()
+
+    def _path(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest())
+
+    def get_entry(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at, stored_at, value = loads(f.read())
+        except (OSError, ValueError, TypeError):
+            return None
+        if expires_at < time.time():
+            return None
+        return stored_at, value
+
+    def set_entry(self, key, stored_at, value, ttl):
+        path = self._path(key)
+        expires_at = time.time() + ttl
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(dumps([expires_at, stored_at, value]))
+        os.utime(tmp_path, (expires_at, expires_at))
+        os.replace(tmp_path, path)
+        if time.time() - self._swept_at >= self.sweep_interval:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired entries, entries beyond max_entries and lock files without an entry"""
+        self._swept_at = now = time.time()
+        entries, locks = [], []
+        with os.scandir(self.root) as items:
+            for item in items:
+                try:
+                    mtime = item.stat(follow_symlinks=False).st_mtime
+                except OSError:
+                    continue
+                if item.name.endswith('.lock'):
+                    locks.append(item.name)
+                elif item.name.endswith('.tmp'):
+                    if now - mtime > self.STALE_TMP_SECONDS:
+                        _remove(item.path)
+                else:
+                    entries.append((mtime, item.name))
+        # Sorted by expiry time, so the live entries expiring soonest go first
+        entries.sort()
+        live = [name for expires_at, name in entries if expires_at >= now]
+        excess = max(len(live) - self.max_entries, 0)
+        for expires_at, name in entries:
+            if expires_at < now:
+                _remove(os.path.join(self.root, name))
+        for name in live[:excess]:
+            _remove(os.path.join(self.root, name))
+        kept = set(live[excess:])
+        for name in locks:
+            if name[:-len('.lock')] not in kept:
+                self._remove_lock(os.path.join(self.root, name))
+
+    def _remove_lock(self, path):
+        if fcntl is None:
+            _remove(path)
+            return
+        try:
+            with open(path, 'a') as lock_file:
+                # Never delete a lock somebody holds; one about to be taken at worst lets two
+                # workers compute the same entry once
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                _remove(path)
+        except OSError:
+            pass
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        # Threads of this process serialise on a threading lock, processes on flock
+        with self._locks.get(key):
+            if fcntl is None:
+                yield
+                return
+            with open(self._path(key) + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RedisBackend:
+    """Entries in Redis; requires the optional redis package"""
+
+    name = "redis"
+
+    def __init__(self, url, lock_timeout=30):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.lock_timeout = lock_timeout
+        self._locks = _KeyLocks()
+
+    def get_entry(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        return tuple(loads(raw))
+
+    def set_entry(self, key, stored_at, value, ttl):
+        self.client.set(key, dumps([stored_at, value]), ex=max(int(ttl), 1))
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        lock_key = "lock:" + key
+        token = uuid.uuid4().hex
+        with self._locks.get(key):
+            # Expiring lock so a crashed worker cannot hold a key forever
+            deadline = time.time() + self.lock_timeout
+            while not self.client.set(lock_key, token, nx=True, px=self.lock_timeout * 1000):
+                if time.time() > deadline:
+                    break
+                time.sleep(0.05)
+            try:
+                yield
+            finally:
+                if self.client.get(lock_key) == token.encode():
+                    self.client.delete(lock_key)
+
+
+class SharedCache:
+    """Front end over a backend with hit/miss counters"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {"hits": 0, "misses": 0, "computes": 0}
+
+    def get(self, key, max_age=None):
+        """(value, stored_at) if present and younger than max_age, else None"""
+        try:
+            entry = self.backend.get_entry(key)
+        except Exception as e:
+            count_error("shared_cache", e)
+            print(f"Shared cache read failed for {key}: {e}")
+            entry = None
+        if entry is None or (max_age is not None and time.time() - entry[0] >= max_age):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry[1], entry[0]
+
+    def set(self, key, value, ttl, stored_at=None):
+        try:
+            self.backend.set_entry(key, time.time() if stored_at is None else stored_at, value, ttl)
+        except Exception as e:
+            count_error("shared_cache", e)
+            print(f"Shared cache write failed for {key}: {e}")
+
+    def get_or_compute(self, key, compute, max_age, ttl=None):
+        """(value, stored_at) for key, computed by at most one worker at a time
+
+        ttl is how long the backend keeps the entry at all (defaults to 10x
+        max_age) so callers with a longer max_age can still use it.
+        """
+        cached = self.get(key, max_age)
+        if cached is not None:
+            return cached
+        with self.backend.lock(key):
+            # Another worker may have refreshed it while we waited for the lock
+            cached = self.get(key, max_age)
+            if cached is not None:
+                return cached
+            value = compute()
+            stored_at = time.time()
+            self.stats["computes"] += 1
+            self.set(key, value, ttl or max_age * 10, stored_at)
+            return value, stored_at
+
+    def export(self, prefixes):
+        """Unexpired [(key, expires_at, stored_at, value)] under prefixes, for a process-local backend
+
+        Other backends already outlive the process, so they export nothing.
+        """
+        if not hasattr(self.backend, "entries"):
+            return []
+        now = time.time()
+        return [entry for entry in self.backend.entries() if entry[0].startswith(prefixes) and entry[1] > now]
+
+    def restore(self, entries):
+        """Re-add exported entries that have not expired and are not already present"""
+        now = time.time()
+        for key, expires_at, stored_at, value in entries:
+            if expires_at > now and self.backend.get_entry(key) is None:
+                self.backend.set_entry(key, stored_at, value, expires_at - now)
+
+
+def create_shared_cache():
+    """Backend from SHARED_CACHE ("local", "file:<dir>" or "redis://...")"""
+    spec = os.environ.get("SHARED_CACHE", "file")
+    if spec == "local":
+        return SharedCache(LocalBackend())
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return SharedCache(RedisBackend(spec))
+    root = spec[len("file:"):] if spec.startswith("file:") else None
+    if not root:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        owner = os.getuid() if hasattr(os, "getuid") else "user"
+        root = os.path.join(base, f"stock-dashboard-cache-{owner}")
+    return SharedCache(FileBackend(root, max_entries=int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", "10000"))))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
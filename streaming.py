@@ -0,0 +1,161 @@
+"""Quote fan-out hub for Server-Sent Events streaming
+
+One background poller runs per subscribed symbol no matter how many clients
+are listening. Each poll result is compared with the previous one and only the
+changed fields are pushed to subscribers. The poller stops when the last
+subscriber for its symbol disconnects, and with a session calendar it sleeps
+from the close (once the last bar has settled) until the next open.
+"""
+import queue
+import threading
+
+from flask import Response
+
+from metrics import count_error
+from serialization import dumps
+
+
+class StreamLimitReached(Exception):
+    """Every poller slot is taken, so no new symbol can be streamed for now"""
+
+
+class Subscription:
+    """One client's queue of quote updates for a symbol"""
+
+    def __init__(self, hub, symbol, maxsize=100):
+        self.hub = hub
+        self.symbol = symbol
+        self.updates = queue.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def push(self, update, snapshot):
+        try:
+            self.updates.put_nowait(update)
+        except queue.Full:
+            # Slow client - drop its backlog and resync with the full quote
+            while not self.updates.empty():
+                try:
+                    self.updates.get_nowait()
+                except queue.Empty:
+                    break
+            self.updates.put_nowait(snapshot)
+
+    def get(self, timeout=None):
+        return self.updates.get(timeout=timeout)
+
+    def close(self):
+        """Leave the hub (idempotent - both the stream and the response may call it)"""
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self)
+
+
+class _Channel:
+    def __init__(self):
+        self.subscribers = set()
+        self.last = None
+        self.stop = threading.Event()
+        self.thread = None
+
+
+class QuoteHub:
+    """Shares one upstream poller per symbol between all its subscribers
+
+    At most max_symbols pollers (threads) run at once; subscribing to another
+    symbol raises StreamLimitReached until one of them stops.
+    """
+
+    def __init__(self, fetch, interval=10, sessions=None, max_symbols=100):
+        self.fetch = fetch
+        self.interval = interval
+        self.sessions = sessions
+        self.max_symbols = max_symbols
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbol):
+        symbol = symbol.upper()
+        subscription = Subscription(self, symbol)
+        with self._lock:
+            channel = self._channels.get(symbol)
+            if channel is None:
+                if len(self._channels) >= self.max_symbols:
+                    raise StreamLimitReached(f"At most {self.max_symbols} symbols can be streamed at once")
+                channel = self._channels[symbol] = _Channel()
+                channel.thread = threading.Thread(target=self._poll, args=(symbol, channel),
+                                                  name=f"quote-poller-{symbol}", daemon=True)
+                channel.thread.start()
+            elif channel.last is not None:
+                # Late joiner starts from the current quote
+                subscription.push(dict(channel.last), channel.last)
+            channel.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            channel = self._channels.get(subscription.symbol)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscription)
+            if not channel.subscribers:
+                channel.stop.set()
+                del self._channels[subscription.symbol]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "symbols": len(self._channels),
+                "subscribers": sum(len(channel.subscribers) for channel in self._channels.values())
+            }
+
+    def _poll(self, symbol, channel):
+        while not channel.stop.is_set():
+            try:
+                quote = self.fetch(symbol)
+            except Exception as e:
+                count_error("stream", e)
+                print(f"Error polling real-time data for {symbol}: {e}")
+                quote = None
+
+            if quote is not None:
+                with self._lock:
+                    last = channel.last or {}
+                    changed = {key: value for key, value in quote.items() if last.get(key) != value}
+                    if changed:
+                        changed["symbol"] = quote.get("symbol", symbol)
+                        channel.last = quote
+                        for subscription in channel.subscribers:
+                            subscription.push(changed, quote)
+
+            wait = self.interval
+            if self.sessions is not None:
+                wait = self.sessions.expires_in(symbol, wait)
+            channel.stop.wait(wait)
+
+
+def sse_response(subscription, heartbeat=15):
+    """text/event-stream response for a subscription
+
+    The subscription is also closed with the response, so a client that goes
+    away before the first chunk (the generator never starts, and its finally
+    never runs) does not keep a poller and its slot alive.
+    """
+    response = Response(sse_events(subscription, heartbeat), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(subscription.close)
+    return response
+
+
+def sse_events(subscription, heartbeat=15):
+    """Server-Sent Events lines for a subscription; closes it when the client goes away"""
+    try:
+        while True:
+            try:
+                update = subscription.get(timeout=heartbeat)
+            except queue.Empty:
+                # Comment line keeps proxies from timing out an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            yield "data: " + dumps(update).decode() + "\n\n"
+    finally:
+        subscription.close()
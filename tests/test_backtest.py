@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from backtest import rolling_trends, run_backtest
+from bar_store import BarStore
+from prediction import fit_trends
+
+
+def walk(days, level=100.0, seed=0, drift=0.0005, volatility=0.02):
+    rng = np.random.default_rng(seed)
+    return level * np.exp(np.cumsum(rng.normal(drift, volatility, days)))
+
+
+def window_by_window(closes, lookback, horizon):
+    """fit_trends on every lookback window, NaN where a window has a missing close"""
+    windows = np.lib.stride_tricks.sliding_window_view(closes, lookback)
+    slope, _, forecast, r_squared, _ = fit_trends(windows, lookback, horizon)
+    gaps = np.isnan(windows).any(axis=1)
+    pad = np.full(lookback - 1, np.nan)
+    return tuple(np.concatenate((pad, np.where(gaps, np.nan, values))) for values in (slope, forecast, r_squared))
+
+
+@pytest.mark.parametrize("days,level", [(2520, 100.0), (10000, 5000.0), (30000, 1.0)])
+@pytest.mark.parametrize("lookback,horizon", [(2, 1), (30, 1), (250, 5)])
+def test_rolling_fit_matches_fit_trends_on_long_series(days, level, lookback, horizon):
+    closes = walk(days, level, volatility=0.03)
+    closes[days // 3] = np.nan
+    slope, forecast, r_squared = rolling_trends(closes, lookback, horizon)
+    expected_slope, expected_forecast, expected_r_squared = window_by_window(closes, lookback, horizon)
+
+    np.testing.assert_array_equal(np.isnan(slope), np.isnan(expected_slope))
+    np.testing.assert_allclose(slope, expected_slope, rtol=1e-6)
+    np.testing.assert_allclose(forecast, expected_forecast, rtol=1e-10)
+    np.testing.assert_allclose(r_squared, expected_r_squared, rtol=0, atol=1e-9)
+
+
+def test_flat_windows_fit_exactly():
+    closes = np.concatenate((walk(40), np.full(40, 123.45), walk(40, seed=1)))
+    slope, forecast, r_squared = rolling_trends(closes, 30)
+    flat = slice(69, 80)
+    assert (slope[flat] == 0).all() and (r_squared[flat] == 1).all()
+    np.testing.assert_allclose(forecast[flat], 123.45, rtol=1e-12)
+
+
+def test_series_shorter_than_the_lookback_has_no_fits():
+    assert np.isnan(rolling_trends(walk(29), 30)).all()
+
+
+@pytest.fixture
+def store_root(tmp_path):
+    store = BarStore(str(tmp_path))
+    end = pd.Timestamp.now().normalize()
+    for seed, days in enumerate((600, 300, 40, 10)):
+        index = pd.bdate_range(end=end, periods=days).tz_localize("America/New_York").as_unit("ns")
+        closes = walk(days, seed=seed)
+        store.write(f"S{seed}", pd.DataFrame({"Open": closes, "High": closes, "Low": closes, "Close": closes,
+                                              "Volume": np.full(days, 1000.0)}, index=index))
+    return str(tmp_path)
+
+
+def test_pool_and_in_process_runs_agree(store_root, monkeypatch):
+    symbols = ["S0", "S1", "S2", "S3", "MISSING"]
+    serial = run_backtest(store_root, symbols, years=2, workers=1)
+    monkeypatch.setattr(backtest, "PARALLEL_MIN_SYMBOLS", 1)
+    pooled = run_backtest(store_root, symbols, years=2, workers=2)
+    for report in (serial, pooled):
+        report.pop("elapsed_ms")
+    assert pooled == serial
+    assert serial["symbols"] == 3
+    assert serial["missing"] == ["S3", "MISSING"]
+    assert serial["predictions"] == sum(row["predictions"] for row in serial["per_symbol"].values())
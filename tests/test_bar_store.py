@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import COLUMNS, BarStore
+
+SYMBOL = "TEST"
+
+
+def bars(start, days, first_close=100.0, tz="America/New_York"):
+    index = pd.bdate_range(start, periods=days).tz_localize(tz).as_unit("ns")
+    closes = first_close + np.arange(days, dtype=float)
+    return pd.DataFrame({"Open": closes - 0.5, "High": closes + 1, "Low": closes - 1, "Close": closes,
+                         "Volume": np.arange(days, dtype=float) * 100}, index=index)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(str(tmp_path))
+
+
+def test_round_trip_keeps_values_index_and_timezone(store):
+    frame = bars("2024-01-02", 30)
+    store.write(SYMBOL, frame)
+    loaded = store.load(SYMBOL)
+    pd.testing.assert_frame_equal(loaded, frame[list(COLUMNS)], check_freq=False)
+    assert str(loaded.index.tz) == "America/New_York"
+    assert store.last_timestamp(SYMBOL) == frame.index[-1]
+
+
+def test_load_slices_by_start_and_end(store):
+    frame = bars("2024-01-02", 30)
+    store.write(SYMBOL, frame)
+    loaded = store.load(SYMBOL, start=frame.index[5], end=frame.index[10])
+    pd.testing.assert_frame_equal(loaded, frame.iloc[5:10], check_freq=False)
+
+
+def test_append_replaces_the_overlapping_tail(store):
+    store.write(SYMBOL, bars("2024-01-02", 30))
+    # Re-read of the last bar (which was still forming) plus five new ones
+    delta = bars("2024-01-02", 35, first_close=200.0).iloc[29:]
+    store.write(SYMBOL, delta)
+
+    loaded = store.load(SYMBOL)
+    assert len(loaded) == 35
+    np.testing.assert_array_equal(loaded["Close"].to_numpy()[:29], 100.0 + np.arange(29))
+    np.testing.assert_array_equal(loaded["Close"].to_numpy()[29:], delta["Close"].to_numpy())
+
+
+def test_backfill_before_the_series_rewrites_it_in_order(store):
+    recent = bars("2024-03-01", 20)
+    older = bars("2024-01-02", 30, first_close=50.0)
+    store.write(SYMBOL, recent)
+    store.write(SYMBOL, older)
+
+    loaded = store.load(SYMBOL)
+    expected = pd.concat([older, recent])
+    assert loaded.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(loaded, expected, check_freq=False)
+
+
+def test_backfill_inside_the_series_replaces_only_its_range(store):
+    store.write(SYMBOL, bars("2024-01-02", 40))
+    middle = bars("2024-01-02", 40, first_close=500.0).iloc[10:20]
+    store.write(SYMBOL, middle)
+
+    closes = store.load(SYMBOL)["Close"].to_numpy()
+    assert len(closes) == 40
+    np.testing.assert_array_equal(closes[10:20], middle["Close"].to_numpy())
+    np.testing.assert_array_equal(closes[:10], 100.0 + np.arange(10))
+    np.testing.assert_array_equal(closes[20:], 100.0 + np.arange(20, 40))
+
+
+def test_torn_write_is_read_at_the_shortest_column(store):
+    store.write(SYMBOL, bars("2024-01-02", 10))
+    # A crash after appending timestamps but before the values
+    with open(store._path(SYMBOL, "1d", "ts"), "ab") as f:
+        f.write(np.zeros(3, dtype="<i8").tobytes())
+    assert len(store.load(SYMBOL)) == 10
+    assert len(store.columns(SYMBOL, ("ts", "Close"))["ts"]) == 10
+
+
+def test_replace_swaps_the_whole_series(store):
+    store.write(SYMBOL, bars("2024-01-02", 30))
+    replacement = bars("2024-01-02", 31, first_close=50.0)
+    store.replace(SYMBOL, replacement)
+    pd.testing.assert_frame_equal(store.load(SYMBOL), replacement, check_freq=False)
+
+
+def test_missing_series_is_empty(store):
+    assert store.load("NONE").empty
+    assert store.last_timestamp("NONE") is None
@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import InfoCache, SingleFlight
+from gateway import track_stale
+from shared_cache import LocalBackend, SharedCache
+
+
+class Upstream:
+    def __init__(self, release=None):
+        self.calls = []
+        self.release = release
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def __call__(self, symbol):
+        with self._lock:
+            self.calls.append(symbol)
+        if self.release is not None:
+            self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return {"symbol": symbol, "longName": f"{symbol} Inc.", "volume": len(self.calls)}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock.time)
+    return clock
+
+
+def concurrently(count, fn):
+    results, errors = [None] * count, []
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_concurrent_lookups_make_one_upstream_call():
+    release = threading.Event()
+    upstream = Upstream(release)
+    info_cache = InfoCache(upstream)
+    threads, results, errors = concurrently(16, lambda: info_cache.get("aapl", ("longName",)))
+    # Hold the first fetch until every caller has missed and joined it
+    wait_for(lambda: info_cache.stats["misses"] == 16)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert upstream.calls == ["aapl"]
+    assert all(result is results[0] for result in results)
+    assert info_cache.get("AAPL", ("longName",)) is results[0]
+    assert len(upstream.calls) == 1
+
+
+def test_single_flight_shares_errors_then_forgets_the_key():
+    release = threading.Event()
+    flight = SingleFlight()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("boom")
+
+    threads, _, errors = concurrently(4, lambda: flight.do("key", fail))
+    wait_for(lambda: calls)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and len(errors) == 4
+    assert all(str(e) == "boom" for e in errors)
+    assert flight.do("key", lambda: 42) == 42
+
+
+def test_expired_field_triggers_a_refetch(clock):
+    upstream = Upstream()
+    info_cache = InfoCache(upstream)
+    info_cache.get("AAPL", ("longName", "volume"))
+    clock.now += 120
+    # longName keeps for a day, volume for a minute
+    assert info_cache.get("AAPL", ("longName",))["volume"] == 1
+    assert len(upstream.calls) == 1
+    assert info_cache.get("AAPL", ("volume",))["volume"] == 2
+    assert len(upstream.calls) == 2
+    # Fields without their own TTL use the default
+    clock.now += cache.DEFAULT_INFO_TTL - 1
+    info_cache.get("AAPL", ("website",))
+    assert len(upstream.calls) == 2
+    clock.now += 1
+    info_cache.get("AAPL", ("website",))
+    assert len(upstream.calls) == 3
+
+
+def test_failed_refresh_serves_the_expired_entry_as_stale(clock):
+    upstream = Upstream()
+    info_cache = InfoCache(upstream)
+    info_cache.get("AAPL", ("volume",))
+    clock.now += 61
+    upstream.fail = True
+    notes = track_stale()
+    assert info_cache.get("AAPL", ("volume",))["volume"] == 1
+    assert notes == ["info"]
+    with pytest.raises(RuntimeError):
+        info_cache.get("MSFT", ("volume",))
+
+
+def test_lru_eviction_by_count_and_size():
+    info_cache = InfoCache(Upstream(), max_entries=2)
+    for symbol in ("A", "B"):
+        info_cache.get(symbol)
+    info_cache.get("A")  # A is now the most recently used
+    info_cache.get("C")
+    assert [symbol for symbol, _, _ in info_cache.export()] == ["A", "C"]
+
+    info_cache = InfoCache(Upstream(), max_bytes=200)
+    for symbol in ("A", "B", "C"):
+        info_cache.put(symbol, {"description": "x" * 60})
+    assert [symbol for symbol, _, _ in info_cache.export()] == ["B", "C"]
+
+
+def test_workers_share_one_fetch_through_the_shared_cache():
+    shared = SharedCache(LocalBackend())
+    upstream = Upstream()
+    first, second = InfoCache(upstream, shared=shared), InfoCache(upstream, shared=shared)
+    assert first.get("AAPL", ("longName",)) == second.get("AAPL", ("longName",))
+    assert upstream.calls == ["AAPL"]
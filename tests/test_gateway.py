@@ -0,0 +1,139 @@
+import pytest
+
+import gateway
+from gateway import (BACKGROUND, SEARCH, CircuitBreaker, TokenBucket, UpstreamGateway, UpstreamUnavailable,
+                     priority)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gateway.time, "time", clock.time)
+    return clock
+
+
+def test_bucket_spends_burst_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate_per_hour=3600, capacity=3)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(1.0)
+    clock.now += 1
+    assert bucket.take() == 0.0
+    assert bucket.take() > 0
+
+
+def test_bucket_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate_per_hour=3600, capacity=2)
+    clock.now += 3600
+    assert bucket.take(cost=2) == 0.0
+    assert bucket.take() > 0
+
+
+def test_bucket_keeps_reserve_for_higher_classes(clock):
+    bucket = TokenBucket(rate_per_hour=3600, capacity=10)
+    assert bucket.take(reserve=0.5, cost=5) == 0.0
+    # Five tokens left, all of them reserved
+    assert bucket.take(reserve=0.5) > 0
+    assert bucket.take(reserve=0.0, cost=5) == 0.0
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.failure()
+    assert not breaker.allow()
+
+
+def test_breaker_opens_at_once_when_throttled(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10)
+    breaker.failure(throttled=True)
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_probe_closes_on_success(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.failure()
+    clock.now += 10
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_failed_probe_doubles_cooldown(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, max_cooldown=15)
+    breaker.failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.failure()
+    clock.now += 14
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_cancelled_probe_lets_next_call_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.cancel_probe()
+    assert breaker.allow()
+
+
+class BulkProvider:
+    name = "bulk"
+
+    def __init__(self):
+        self.requests = []
+
+    def history_many(self, symbols, period="2d", interval="1d"):
+        self.requests.append(list(symbols))
+        return {symbol: symbol.lower() for symbol in symbols}
+
+
+def test_bulk_download_costs_one_token_per_symbol(clock):
+    provider = BulkProvider()
+    bucket = TokenBucket(rate_per_hour=3600, capacity=40)
+    upstream = UpstreamGateway(provider, bucket)
+    symbols = [f"S{i}" for i in range(25)]
+    with priority(BACKGROUND):
+        frames = upstream.history_many(symbols)
+
+    assert frames == {symbol: symbol.lower() for symbol in symbols}
+    # Background calls leave a quarter of the bucket: chunks of 30 at most
+    assert [len(chunk) for chunk in provider.requests] == [25]
+    assert bucket.take(cost=15) == 0.0
+    assert bucket.take() > 0
+
+
+def test_bulk_download_is_chunked_and_keeps_fetched_chunks(clock, monkeypatch):
+    monkeypatch.setitem(gateway.DEADLINES, SEARCH, 0.0)
+    provider = BulkProvider()
+    upstream = UpstreamGateway(provider, TokenBucket(rate_per_hour=3600, capacity=40))
+    symbols = [f"S{i}" for i in range(50)]
+    with priority(SEARCH):
+        frames = upstream.history_many(symbols)
+
+    # Search may draw 20 tokens; the second chunk would cut into the reserve
+    assert provider.requests == [symbols[:20]]
+    assert list(frames) == symbols[:20]
+    with priority(SEARCH), pytest.raises(UpstreamUnavailable):
+        upstream.history_many(symbols)
+
+
+def test_budget_interval_fits_a_job_into_its_share_of_the_rate():
+    upstream = UpstreamGateway(BulkProvider(), TokenBucket(rate_per_hour=200, capacity=40))
+    # 13 symbols a refresh within a fifth of 200 tokens an hour: every 1170 s
+    assert upstream.budget_interval(13, 0.2) == pytest.approx(1170)
+    assert 3600 / upstream.budget_interval(13, 0.2) * 13 == pytest.approx(40)
+    assert UpstreamGateway(BulkProvider(), TokenBucket(0, 40)).budget_interval(13, 0.2) == 0.0
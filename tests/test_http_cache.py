@@ -0,0 +1,86 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, g, jsonify, request
+
+import http_cache
+from http_cache import cacheable, compress_response, etag, not_modified, uncacheable
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    quote = {"symbol": "AAPL", "price": 190.5, "history": list(range(400))}
+
+    @app.after_request
+    def finish(response):
+        if g.get("stale"):
+            uncacheable(response)
+        return compress_response(response)
+
+    @app.route("/quote")
+    def get_quote():
+        g.stale = request.args.get("stale") == "1"
+        tag = etag(quote["price"])
+        cached = not_modified(tag, 30)
+        if cached is not None:
+            return cached
+        return cacheable(jsonify(quote), tag, 30)
+
+    app.quote = quote
+    return app.test_client()
+
+
+def test_matching_if_none_match_gets_a_304(client):
+    first = client.get("/quote")
+    assert first.status_code == 200
+    assert first.headers["ETag"].startswith('W/"')
+    assert first.headers["Cache-Control"] == "public, max-age=30"
+
+    again = client.get("/quote", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.get_data() == b""
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+
+def test_changed_tag_gets_a_200(client):
+    old_tag = client.get("/quote").headers["ETag"]
+    client.application.quote["price"] = 191.0
+    response = client.get("/quote", headers={"If-None-Match": old_tag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != old_tag
+    assert response.get_json()["price"] == 191.0
+
+
+def test_stale_responses_are_neither_tagged_nor_cached(client):
+    response = client.get("/quote?stale=1")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_gzip_when_brotli_is_not_accepted(client):
+    response = client.get("/quote", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.get_data()))["symbol"] == "AAPL"
+
+
+def test_brotli_when_preferred(client):
+    brotli = pytest.importorskip("brotli")
+    response = client.get("/quote", headers={"Accept-Encoding": "gzip;q=0.5, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.get_data()))["symbol"] == "AAPL"
+
+
+def test_gzip_only_without_brotli(client, monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    response = client.get("/quote", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_identity_without_accept_encoding_or_for_small_bodies(client):
+    assert "Content-Encoding" not in client.get("/quote").headers
+    client.application.quote["history"] = []
+    assert "Content-Encoding" not in client.get("/quote", headers={"Accept-Encoding": "gzip"}).headers
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import IndicatorEngine, build_indicator, compute_matrix
+
+SPECS = ["sma20", "ema12", "rsi14", "srsi14", "bb20", "macd"]
+
+
+def closes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+def incremental(spec, values):
+    indicator = build_indicator(spec)
+    for close in values:
+        indicator.push(float(close))
+    return indicator.value
+
+
+def same(left, right):
+    if left is None or right is None:
+        return left is None and right is None
+    if isinstance(left, dict):
+        return left.keys() == right.keys() and all(same(left[k], right[k]) for k in left)
+    return left == pytest.approx(right, rel=1e-9, abs=1e-9)
+
+
+def frame(values, start="2024-01-02"):
+    index = pd.bdate_range(start, periods=len(values)).as_unit("ns")
+    return pd.DataFrame({"Close": values}, index=index)
+
+
+@pytest.mark.parametrize("n", [5, 14, 15, 20, 34, 35, 300])
+def test_incremental_matches_vectorized(n):
+    values = closes(n)
+    matrix = compute_matrix(values[None, :], SPECS)
+    for spec in SPECS:
+        assert same(incremental(spec, values), matrix[spec][0]), (spec, n)
+
+
+def test_vectorized_rows_of_different_length_match_incremental():
+    series = [closes(n, seed) for seed, n in enumerate((300, 120, 30, 10))]
+    matrix = np.full((len(series), 300), np.nan)
+    for row, values in enumerate(series):
+        matrix[row, -len(values):] = values
+    result = compute_matrix(matrix, SPECS)
+    for spec in SPECS:
+        for row, values in enumerate(series):
+            assert same(incremental(spec, values), result[spec][row]), (spec, row)
+
+
+def test_sma_and_bollinger_match_pandas_rolling():
+    values = pd.Series(closes(200))
+    assert incremental("sma20", values) == pytest.approx(values.rolling(20).mean().iloc[-1])
+    band = incremental("bb20", values)
+    std = values.rolling(20).std(ddof=0).iloc[-1]
+    assert band["middle"] == pytest.approx(values.rolling(20).mean().iloc[-1])
+    assert band["upper"] - band["middle"] == pytest.approx(2 * std)
+
+
+@pytest.mark.parametrize("spec", SPECS)
+def test_replace_matches_pushing_the_revised_bar(spec):
+    values = closes(100)
+    revised = build_indicator(spec)
+    for close in values[:-1]:
+        revised.push(float(close))
+    revised.push(float(values[-1]) * 1.05)
+    revised.replace(float(values[-1]))
+    assert same(revised.value, incremental(spec, values))
+
+
+def test_engine_advances_to_the_same_values_as_a_fresh_computation():
+    values = closes(260)
+    engine = IndicatorEngine()
+    engine.compute("AAPL", frame(values[:200]), SPECS)
+
+    # New bars, then a revision of the newest one, then a new spec
+    engine.compute("AAPL", frame(values[:230]), SPECS)
+    revised = values.copy()
+    revised[229] *= 0.98
+    advanced = engine.compute("AAPL", frame(revised[:230]), SPECS + ["sma50"])
+    fresh = IndicatorEngine().compute("AAPL", frame(revised[:230]), SPECS + ["sma50"])
+    for spec in fresh:
+        assert same(advanced[spec], fresh[spec]), spec
+
+
+def test_engine_starts_over_when_the_series_is_rewritten():
+    values = closes(120)
+    engine = IndicatorEngine()
+    engine.compute("AAPL", frame(values), SPECS)
+    backfilled = frame(closes(150, seed=1), start="2023-06-01")
+    assert all(same(engine.compute("AAPL", backfilled, SPECS)[spec], value)
+               for spec, value in IndicatorEngine().compute("AAPL", backfilled, SPECS).items())
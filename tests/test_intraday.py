@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from intraday import COLUMNS, IntradayBuffer, IntradayStore
+
+
+def minutes(start, n, tz="America/New_York", base=0.0):
+    index = pd.date_range(start, periods=n, freq="min", tz=tz).as_unit("ns")
+    values = base + np.arange(n, dtype=np.float64)
+    return pd.DataFrame({column: values for column in COLUMNS}, index=index)
+
+
+def test_merge_wraps_around_and_keeps_the_newest_bars():
+    buffer = IntradayBuffer(capacity=8)
+    buffer.merge(minutes("2024-03-04 09:30", 5))
+    buffer.merge(minutes("2024-03-04 09:35", 6, base=5))
+    assert buffer.count == 8
+    assert buffer.start == 3
+    frame = buffer.frame()
+    assert list(frame["Close"]) == [3, 4, 5, 6, 7, 8, 9, 10]
+    assert frame.index.is_monotonic_increasing
+    assert str(frame.index.tz) == "America/New_York"
+    assert frame.index[-1] == pd.Timestamp("2024-03-04 09:40", tz="America/New_York")
+
+
+def test_merge_of_more_than_capacity_keeps_only_the_newest():
+    buffer = IntradayBuffer(capacity=4)
+    buffer.merge(minutes("2024-03-04 09:30", 10))
+    assert list(buffer.frame()["Close"]) == [6, 7, 8, 9]
+    assert buffer.tail() == pd.Timestamp("2024-03-04 09:39", tz="America/New_York").value
+
+
+def test_tail_bar_is_replaced_and_older_bars_ignored():
+    buffer = IntradayBuffer(capacity=8)
+    buffer.merge(minutes("2024-03-04 09:30", 3))
+    # Upstream repeats old bars and the still-forming tail with a new value
+    buffer.merge(minutes("2024-03-04 09:29", 5, base=100))
+    assert list(buffer.frame()["Close"]) == [0, 1, 103, 104]
+
+
+def test_frame_keeps_only_the_newest_session_by_default():
+    buffer = IntradayBuffer(capacity=16)
+    buffer.merge(minutes("2024-03-04 15:57", 3))
+    buffer.merge(minutes("2024-03-05 09:30", 2, base=10))
+    assert list(buffer.frame()["Close"]) == [10, 11]
+    assert len(buffer.frame(session_only=False)) == 5
+
+
+def test_state_round_trips_through_from_arrays():
+    buffer = IntradayBuffer(capacity=4)
+    buffer.merge(minutes("2024-03-04 09:30", 6))
+    state, ts, values = buffer.copy_state()
+    rebuilt = IntradayBuffer.from_arrays(ts, values, state["start"], state["count"], state["tz"])
+    pd.testing.assert_frame_equal(rebuilt.frame(), buffer.frame())
+    rebuilt.merge(minutes("2024-03-04 09:36", 1, base=6))
+    assert list(rebuilt.frame()["Close"]) == [3, 4, 5, 6]
+    assert list(buffer.frame()["Close"]) == [2, 3, 4, 5]
+
+
+class FakeMarketData:
+    def __init__(self, frame):
+        self.frame = frame
+        self.calls = []
+        self.fail = False
+
+    def history(self, symbol, period=None, start=None, interval=None):
+        self.calls.append((symbol, period, start, interval))
+        if self.fail:
+            raise RuntimeError("upstream down")
+        if start is None:
+            return self.frame
+        return self.frame[self.frame.index >= start]
+
+
+def test_store_refreshes_with_a_tail_delta_and_keeps_bars_on_errors():
+    now = pd.Timestamp.now(tz="UTC").floor("min")
+    market_data = FakeMarketData(minutes(now - pd.Timedelta(minutes=9), 10, tz="UTC"))
+    store = IntradayStore(market_data, capacity=8, refresh_interval=0)
+
+    assert len(store.bars("aapl", session_only=False)) == 8
+    assert market_data.calls[0][1] == "1d"
+
+    market_data.frame = minutes(now - pd.Timedelta(minutes=9), 12, tz="UTC")
+    bars = store.bars("AAPL", session_only=False)
+    assert market_data.calls[1][2] == now
+    assert list(bars["Close"]) == [4, 5, 6, 7, 8, 9, 10, 11]
+
+    market_data.fail = True
+    assert list(store.bars("AAPL", session_only=False)["Close"]) == list(bars["Close"])
+    with pytest.raises(RuntimeError):
+        store.bars("MSFT")
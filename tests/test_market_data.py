@@ -0,0 +1,122 @@
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import BarStore
+from market_data import FixtureProvider, MarketData, request_start, validate_range
+
+SYMBOL = "TEST"
+# Recent enough that bulk delta fetches only cover the last few days
+FIRST_DAY = pd.Timestamp.now().normalize() - pd.offsets.BDay(42)
+START = FIRST_DAY.strftime("%Y-%m-%d")
+
+
+def bars(days, close=100.0, tz="America/New_York"):
+    index = pd.bdate_range(FIRST_DAY, periods=days).tz_localize(tz)
+    closes = close + np.arange(days, dtype=float)
+    return pd.DataFrame({"Open": closes - 0.5, "High": closes + 1, "Low": closes - 1, "Close": closes,
+                         "Volume": np.full(days, 1000.0)}, index=index)
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """(provider, publish) - publish(frame) replaces what the fixture provider serves"""
+    directory = tmp_path / "fixtures" / SYMBOL
+    directory.mkdir(parents=True)
+    (directory / "info.json").write_text(json.dumps({"exchangeTimezoneName": "America/New_York"}))
+    provider = FixtureProvider(str(tmp_path / "fixtures"))
+
+    def publish(frame):
+        frame.to_csv(directory / "1d.csv")
+        provider._frames.clear()
+
+    return provider, publish
+
+
+@pytest.fixture
+def market_data(tmp_path, upstream):
+    return MarketData(upstream[0], BarStore(str(tmp_path / "bars")), refresh_interval=0)
+
+
+def stored_closes(market_data):
+    return market_data.store.load(SYMBOL)["Close"].to_numpy()
+
+
+def test_delta_fetch_appends_new_bars(market_data, upstream):
+    provider, publish = upstream
+    publish(bars(40))
+    market_data.bars(SYMBOL, START)
+    publish(bars(41))
+    market_data.bars(SYMBOL, START)
+
+    np.testing.assert_array_equal(stored_closes(market_data), bars(41)["Close"].to_numpy())
+    # The initial download plus one delta fetch, no full refetch
+    assert provider.calls["history"] == 2
+
+
+def test_split_rescales_stored_history(market_data, upstream):
+    provider, publish = upstream
+    publish(bars(40))
+    market_data.bars(SYMBOL, START)
+
+    # 2:1 split on a new bar: upstream halves every earlier adjusted price
+    split = bars(41)
+    split[["Open", "High", "Low", "Close"]] /= 2
+    split["Stock Splits"] = 0.0
+    split.iloc[-1, split.columns.get_loc("Stock Splits")] = 2.0
+    publish(split)
+    frame = market_data.bars(SYMBOL, START)
+
+    np.testing.assert_allclose(stored_closes(market_data), split["Close"].to_numpy())
+    np.testing.assert_allclose(frame["Close"].to_numpy(), split["Close"].to_numpy())
+    assert provider.calls["history"] == 3
+
+
+def test_bulk_delta_detects_restated_overlap_bar(market_data, upstream):
+    provider, publish = upstream
+    publish(bars(40))
+    market_data.bars_many([SYMBOL], START)
+
+    # A dividend the delta frame does not report: only the re-read bar shows it
+    adjusted = bars(41)
+    adjusted[["Open", "High", "Low", "Close"]] *= 0.99
+    publish(adjusted)
+    market_data.bars_many([SYMBOL], START)
+
+    np.testing.assert_allclose(stored_closes(market_data), adjusted["Close"].to_numpy())
+
+
+def test_one_minute_ranges_fit_yahoo_limits():
+    validate_range("5d", "1m")
+    validate_range("1mo", "5m")
+    with pytest.raises(ValueError):
+        validate_range("1mo", "1m")
+    with pytest.raises(ValueError):
+        validate_range("6mo", "15m")
+
+
+def test_one_minute_requests_span_at_most_seven_days():
+    now = datetime.now()
+    assert request_start(now - timedelta(days=8), "1m") > now - timedelta(days=7)
+    recent = now - timedelta(days=2)
+    assert request_start(recent, "1m") == recent
+    assert request_start(now - timedelta(days=8), "5m") == now - timedelta(days=8)
+    aware = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=20)
+    assert request_start(aware, "1m") > pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=7)
+
+
+def test_five_days_of_minute_bars_ask_for_at_most_seven_days(tmp_path, upstream):
+    provider, _ = upstream
+    starts = []
+    history = provider.history
+
+    def spy(symbol, start=None, **kwargs):
+        starts.append(pd.Timestamp(start))
+        return history(symbol, start=start, **kwargs)
+
+    provider.history = spy
+    MarketData(provider, BarStore(str(tmp_path / "bars"))).range_bars(SYMBOL, "5d", "1m")
+    assert starts and starts[0] > pd.Timestamp.now() - pd.Timedelta(days=7)
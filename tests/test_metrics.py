@@ -0,0 +1,24 @@
+from metrics import Registry, from_plain, merge, render, to_plain
+
+
+def worker(in_flight, breaker, requests):
+    registry = Registry()
+    registry.gauge("in_flight", "Requests in flight").set(in_flight)
+    registry.gauge("breaker", "Breaker state", aggregate="max").set(breaker)
+    registry.counter("requests", "Requests", ("route",)).inc(requests, route="/")
+    registry.histogram("latency", "Latency", buckets=(0.1, 1.0)).observe(0.5)
+    return registry.snapshot()
+
+
+def test_merge_sums_counters_and_takes_max_of_state_gauges():
+    merged = merge([worker(2, 0, 3), worker(1, 2, 4), worker(0, 1, 5)])
+    assert merged["in_flight"][4] == {(): 3}
+    assert merged["breaker"][4] == {(): 2}
+    assert merged["requests"][4] == {("/",): 12}
+    assert merged["latency"][4] == {(): [[0, 3, 0], 1.5, 3]}
+
+
+def test_snapshot_survives_the_plain_round_trip():
+    snapshot = worker(1, 2, 3)
+    assert from_plain(to_plain(snapshot)) == snapshot
+    assert 'requests{route="/"} 3' in render(snapshot)
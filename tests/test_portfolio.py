@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from portfolio import RunningCovariance
+
+
+def returns(rows, columns, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.02, (rows, columns)) + rng.normal(0, 0.01, (rows, 1))
+
+
+def running(rows):
+    covariance = RunningCovariance(rows.shape[1])
+    covariance.update(rows)
+    return covariance
+
+
+def test_matches_np_cov_on_complete_rows():
+    rows = returns(250, 5)
+    np.testing.assert_allclose(running(rows).covariance(), np.cov(rows, rowvar=False), rtol=1e-9)
+
+
+def test_sliding_window_matches_a_fresh_computation():
+    rows = returns(300, 4)
+    covariance = running(rows[:250])
+    covariance.update(rows[250:])
+    covariance.update(rows[:50], sign=-1)
+    np.testing.assert_allclose(covariance.covariance(), np.cov(rows[50:], rowvar=False), rtol=1e-8)
+
+
+def test_missing_returns_use_pairwise_complete_rows():
+    rows = returns(120, 4)
+    rows[:30, 0] = np.nan       # listed later
+    rows[::7, 1] = np.nan       # holidays on another exchange
+    rows[100:, 2] = np.nan      # delisted
+    expected = pd.DataFrame(rows).cov().to_numpy()
+    np.testing.assert_allclose(running(rows).covariance(), expected, rtol=1e-8)
+
+
+def test_pairs_with_fewer_than_two_common_rows_are_nan():
+    rows = np.array([[0.01, np.nan, 0.02],
+                     [np.nan, 0.03, -0.01],
+                     [0.02, np.nan, 0.01]])
+    covariance = running(rows).covariance()
+    assert np.isnan(covariance[0, 1]) and np.isnan(covariance[1, 1])
+    assert not np.isnan(covariance[0, 2])
+
+
+def test_copy_is_independent():
+    rows = returns(60, 3)
+    original = running(rows)
+    before = original.covariance()
+    other = original.copy()
+    other.update(returns(10, 3, seed=1))
+    np.testing.assert_array_equal(original.covariance(), before)
@@ -0,0 +1,82 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from prediction import NO_PREDICTION, fit_trends, predict, predict_many
+
+linear_model = pytest.importorskip("sklearn.linear_model")
+
+
+def reference(prices, lookback=30, horizon=1):
+    """(slope, intercept, forecast, r_squared) from sklearn, as the predictor used to compute them"""
+    recent = np.asarray(prices, dtype=np.float64)[-lookback:]
+    days = np.arange(len(recent)).reshape(-1, 1)
+    model = linear_model.LinearRegression().fit(days, recent)
+    forecast = model.predict(np.array([[len(recent) - 1 + horizon]]))[0]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        r_squared = model.score(days, recent)
+    return model.coef_[0], model.intercept_, forecast, r_squared
+
+
+def series(rows, days, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0.001, 0.02, (rows, days)), axis=1))
+
+
+@pytest.mark.parametrize("lookback,horizon", [(30, 1), (2, 1), (10, 5), (365, 30)])
+def test_matches_linear_regression(lookback, horizon):
+    prices = series(20, 400)
+    slope, intercept, forecast, r_squared, count = fit_trends(prices, lookback, horizon)
+    for row, values in enumerate(prices):
+        expected = reference(values, lookback, horizon)
+        assert (slope[row], intercept[row], forecast[row], r_squared[row]) == pytest.approx(expected, rel=1e-9)
+        assert count[row] == lookback
+
+
+def test_prediction_dict_matches_the_sklearn_version():
+    for values in series(10, 60, seed=1):
+        slope, _, forecast, r_squared = reference(values)
+        assert predict(values) == {"next_day_price": round(forecast, 2),
+                                   "confidence": round(r_squared * 100, 1),
+                                   "trend": "bullish" if slope > 0 else "bearish"}
+
+
+def test_left_padded_rows_match_their_own_series():
+    full = series(1, 50, seed=2)[0]
+    short = series(1, 12, seed=3)[0]
+    matrix = np.full((2, 50), np.nan)
+    matrix[0], matrix[1, -12:] = full, short
+    slope, _, forecast, r_squared, count = fit_trends(matrix, lookback=30)
+    assert list(count) == [30, 12]
+    for row, values in enumerate((full, short)):
+        expected_slope, _, expected_forecast, expected_r2 = reference(values)
+        assert (slope[row], forecast[row], r_squared[row]) == pytest.approx(
+            (expected_slope, expected_forecast, expected_r2), rel=1e-9)
+
+
+def test_lookback_longer_than_history_uses_every_price():
+    values = series(1, 7, seed=4)[0]
+    assert predict(values, lookback=30) == predict(values, lookback=7)
+    assert predict(values, lookback=30)["next_day_price"] == round(reference(values)[2], 2)
+
+
+def test_constant_series_is_a_flat_perfect_fit():
+    slope, intercept, forecast, r_squared, _ = fit_trends(np.full((1, 30), 42.0))
+    expected = reference(np.full(30, 42.0))
+    assert (slope[0], intercept[0], forecast[0], r_squared[0]) == pytest.approx(expected, abs=1e-9)
+    assert predict(np.full(30, 42.0)) == {"next_day_price": 42.0, "confidence": 100.0, "trend": "bearish"}
+
+
+@pytest.mark.parametrize("prices", [[], [101.5], [np.nan, np.nan, 3.0]])
+def test_too_few_prices_give_no_prediction(prices):
+    assert predict(prices) == NO_PREDICTION
+
+
+def test_rows_are_independent():
+    prices = series(3, 40, seed=5)
+    prices[1] = np.nan
+    predictions = predict_many(prices)
+    assert predictions[1] == NO_PREDICTION
+    assert predictions[0] == predict(prices[0]) and predictions[2] == predict(prices[2])
@@ -0,0 +1,51 @@
+import quotes
+from quotes import QuoteEngine
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+def engine(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(quotes.time, "time", clock.time)
+    return QuoteEngine(market_data=None, max_workers=1, **kwargs), clock
+
+
+def quote(symbol):
+    return {"symbol": symbol, "price": 1.0}
+
+
+def test_recent_quotes_expire_after_recent_ttl(monkeypatch):
+    quote_engine, clock = engine(monkeypatch)
+    quote_engine._remember("OLD", "2d", quote("OLD"))
+    clock.now += QuoteEngine.RECENT_TTL / 2
+    quote_engine._remember("NEW", "2d", quote("NEW"))
+    clock.now += QuoteEngine.RECENT_TTL / 2
+    quote_engine._remember("LAST", "2d", quote("LAST"))
+    assert list(quote_engine._recent) == [("NEW", "2d"), ("LAST", "2d")]
+
+
+def test_recent_quotes_are_capped_oldest_first(monkeypatch):
+    quote_engine, clock = engine(monkeypatch, max_recent=3)
+    for symbol in ("A", "B", "C", "D"):
+        quote_engine._remember(symbol, "2d", quote(symbol))
+        clock.now += 1
+    # Refetching a symbol makes it the newest again
+    quote_engine._remember("B", "2d", quote("B"))
+    quote_engine._remember("E", "2d", quote("E"))
+    assert [symbol for symbol, _ in quote_engine._recent] == ["D", "B", "E"]
+    assert quote_engine._cached_quotes(["B", "A"], "2d", None) == {"B": quote("B")}
+
+
+def test_restore_keeps_the_newest_within_the_cap(monkeypatch):
+    quote_engine, clock = engine(monkeypatch, max_recent=2)
+    now = clock.now
+    quote_engine.restore([("A", "2d", now - 10, quote("A")), ("C", "2d", now - 30, quote("C")),
+                          ("B", "2d", now - 20, quote("B")),
+                          ("X", "2d", now - QuoteEngine.RECENT_TTL - 1, quote("X"))])
+    assert [symbol for symbol, _ in quote_engine._recent] == ["B", "A"]
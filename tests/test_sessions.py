@@ -0,0 +1,101 @@
+import json
+from datetime import datetime
+
+import pytest
+import pytz
+
+from sessions import SETTLE_SECONDS, create_session_calendar
+
+
+def at(timezone, text):
+    """Epoch seconds of a wall-clock time on an exchange"""
+    return pytz.timezone(timezone).localize(datetime.fromisoformat(text)).timestamp()
+
+
+def ny(text):
+    return at("America/New_York", text)
+
+
+def tokyo(text):
+    return at("Asia/Tokyo", text)
+
+
+def kolkata(text):
+    return at("Asia/Kolkata", text)
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    monkeypatch.delenv("MARKET_CALENDAR", raising=False)
+    monkeypatch.delenv("MARKET_HOLIDAYS_FILE", raising=False)
+    return create_session_calendar()
+
+
+def test_session_boundaries(calendar):
+    nyse = calendar.exchanges["NYSE"]
+    assert not nyse.is_open(ny("2026-10-14 09:29:59"))
+    assert nyse.is_open(ny("2026-10-14 09:30"))
+    assert nyse.is_open(ny("2026-10-14 15:59:59"))
+    assert not nyse.is_open(ny("2026-10-14 16:00"))
+    assert not nyse.is_open(ny("2026-10-17 12:00"))
+    assert nyse.status(ny("2026-10-17 12:00"))["status"] == "WEEKEND"
+    # Day after Thanksgiving closes early
+    assert not nyse.is_open(ny("2026-11-27 13:00"))
+
+
+def test_tokyo_lunch_break(calendar):
+    tse = calendar.exchanges["TSE"]
+    assert tse.is_open(tokyo("2026-10-14 11:29"))
+    assert not tse.is_open(tokyo("2026-10-14 11:30"))
+    assert tse.status(tokyo("2026-10-14 12:00"))["status"] == "BREAK"
+    assert tse.is_open(tokyo("2026-10-14 12:30"))
+    assert tse.next_open(tokyo("2026-10-14 12:00")) == tokyo("2026-10-14 12:30")
+    # Values fetched once the morning settled are kept until the afternoon open
+    now = tokyo("2026-10-14 12:00")
+    assert calendar.expires_in("7203.T", 5, now) == pytest.approx(30 * 60)
+    assert calendar.max_age("7203.T", 5, now) == pytest.approx(now - tokyo("2026-10-14 11:45"))
+
+
+@pytest.mark.parametrize("day", ["2026-03-03", "2026-03-26", "2026-03-31", "2026-05-28", "2026-06-26",
+                                 "2026-09-14", "2026-10-20", "2026-11-10", "2026-11-24"])
+def test_nse_festival_holidays(calendar, day):
+    now = kolkata(f"{day} 11:00")
+    assert not calendar.is_open("RELIANCE.NS", now)
+    assert calendar.exchanges["NSE"].status(now)["status"] == "HOLIDAY"
+    assert calendar.expires_in("RELIANCE.NS", 5, now) > 3600
+
+
+def test_dussehra_keeps_indian_quotes_until_the_next_open(calendar):
+    now = kolkata("2026-10-20 11:00")
+    assert calendar.exchanges["NSE"].next_open(now) == kolkata("2026-10-21 09:15")
+    assert calendar.expires_in(["^NSEI", "TCS.NS"], 5, now) == pytest.approx(kolkata("2026-10-21 09:15") - now)
+
+
+def test_ttl_while_trading_or_settling(calendar):
+    assert calendar.expires_in("AAPL", 5, ny("2026-10-14 10:00")) == 5
+    settling = ny("2026-10-14 16:00") + SETTLE_SECONDS - 1
+    assert calendar.max_age("AAPL", 5, settling) == 5
+    assert calendar.expires_in("AAPL", 5, settling) == 5
+
+
+def test_mixed_markets_expire_at_the_first_open(calendar):
+    # Friday evening in New York: Tokyo reopens Monday before New York does
+    now = ny("2026-10-16 20:00")
+    assert calendar.expires_in(["AAPL", "7203.T"], 5, now) == pytest.approx(tokyo("2026-10-19 09:00") - now)
+    # One market still trading keeps the short ttl
+    assert calendar.expires_in(["AAPL", "TCS.NS"], 5, kolkata("2026-10-15 10:00")) == 5
+
+
+def test_round_the_clock_symbols_always_use_the_ttl(calendar):
+    assert calendar.is_open("BTC-USD", ny("2026-10-17 12:00"))
+    assert calendar.expires_in("EURUSD=X", 60, ny("2026-10-17 12:00")) == 60
+
+
+def test_holidays_file_adds_closures(tmp_path, monkeypatch):
+    path = tmp_path / "holidays.json"
+    path.write_text(json.dumps({"NSE": ["2027-03-10"]}))
+    monkeypatch.delenv("MARKET_CALENDAR", raising=False)
+    monkeypatch.setenv("MARKET_HOLIDAYS_FILE", str(path))
+    calendar = create_session_calendar()
+    assert not calendar.is_open("TCS.NS", kolkata("2027-03-10 11:00"))
+    assert calendar.is_open("TCS.NS", kolkata("2027-03-11 11:00"))
@@ -0,0 +1,83 @@
+import os
+import pickle
+import time
+
+import pytest
+
+from shared_cache import FileBackend, SharedCache
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return FileBackend(str(tmp_path / "cache"))
+
+
+def test_values_round_trip_as_json(backend):
+    cache = SharedCache(backend)
+    cache.set("quote:AAPL", {"price": 1.5, "levels": (1, 2), "missing": None}, ttl=60)
+    value, _ = cache.get("quote:AAPL")
+    assert value == {"price": 1.5, "levels": [1, 2], "missing": None}
+
+
+def test_get_or_compute_computes_once(backend):
+    cache = SharedCache(backend)
+    calls = []
+    for _ in range(3):
+        value, _ = cache.get_or_compute("key", lambda: calls.append(1) or len(calls), max_age=60)
+    assert value == 1 and len(calls) == 1
+
+
+def test_expired_entry_is_a_miss(backend):
+    cache = SharedCache(backend)
+    cache.set("key", "value", ttl=-1)
+    assert cache.get("key") is None
+
+
+def test_directory_is_private(tmp_path):
+    backend = FileBackend(str(tmp_path / "new"))
+    assert os.stat(backend.root).st_mode & 0o777 == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_refuses_directory_others_can_write(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    with pytest.raises(PermissionError):
+        FileBackend(str(shared))
+
+
+def test_planted_pickle_is_never_loaded(backend):
+    class Payload:
+        def __reduce__(self):
+            return (os.system, ("false",))
+
+    with open(backend._path("key"), "wb") as f:
+        pickle.dump((time.time() + 60, time.time(), Payload()), f)
+    assert backend.get_entry("key") is None
+
+
+def test_sweep_removes_expired_entries_and_their_locks(backend):
+    backend.set_entry("old", time.time(), 1, ttl=-1)
+    backend.set_entry("new", time.time(), 2, ttl=60)
+    for key in ("old", "new"):
+        with backend.lock(key):
+            pass
+    backend.sweep()
+    assert sorted(os.listdir(backend.root)) == sorted([os.path.basename(backend._path("new")),
+                                                        os.path.basename(backend._path("new")) + ".lock"])
+
+
+def test_sweep_keeps_held_locks(backend):
+    with backend.lock("computing"):
+        backend.sweep()
+        assert os.path.exists(backend._path("computing") + ".lock")
+
+
+def test_sweep_caps_entry_count(tmp_path):
+    backend = FileBackend(str(tmp_path / "cache"), max_entries=3, sweep_interval=3600)
+    for i in range(6):
+        backend.set_entry(f"key{i}", time.time(), i, ttl=100 + i)
+    backend.sweep()
+    # The entries expiring soonest go first
+    assert [key for key in (f"key{i}" for i in range(6)) if backend.get_entry(key)] == ["key3", "key4", "key5"]
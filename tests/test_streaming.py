@@ -0,0 +1,40 @@
+import pytest
+
+from streaming import QuoteHub, StreamLimitReached, sse_response
+
+
+def test_hub_caps_pollers_and_frees_slots_on_unsubscribe():
+    hub = QuoteHub(lambda symbol: {"symbol": symbol, "price": 1.0}, interval=3600, max_symbols=2)
+    first, second = hub.subscribe("AAA"), hub.subscribe("BBB")
+    # Another client on a streamed symbol needs no new poller
+    extra = hub.subscribe("aaa")
+    with pytest.raises(StreamLimitReached):
+        hub.subscribe("CCC")
+    assert hub.stats() == {"symbols": 2, "subscribers": 3}
+
+    second.close()
+    hub.subscribe("CCC").close()
+    for subscription in (first, extra):
+        subscription.close()
+    assert hub.stats() == {"symbols": 0, "subscribers": 0}
+
+
+def test_response_closed_before_streaming_releases_the_subscription():
+    hub = QuoteHub(lambda symbol: {"symbol": symbol, "price": 1.0}, interval=3600, max_symbols=1)
+    response = sse_response(hub.subscribe("AAA"))
+    assert hub.stats() == {"symbols": 1, "subscribers": 1}
+    # The client goes away before the first chunk - the generator never starts
+    response.close()
+    assert hub.stats() == {"symbols": 0, "subscribers": 0}
+    hub.subscribe("BBB").close()
+
+
+def test_stream_yields_the_first_quote_and_closes_once():
+    hub = QuoteHub(lambda symbol: {"symbol": symbol, "price": 1.0}, interval=3600)
+    subscription = hub.subscribe("AAA")
+    response = sse_response(subscription, heartbeat=5)
+    chunk = next(iter(response.response))
+    assert chunk.startswith("data: ") and '"price":1.0' in chunk
+    response.close()
+    subscription.close()
+    assert subscription.closed and hub.stats() == {"symbols": 0, "subscribers": 0}
@@ -0,0 +1,62 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache import InfoCache
+from intraday import COLUMNS, IntradayStore
+from quotes import QuoteEngine
+from scheduler import SnapshotScheduler
+from warm_cache import MAGIC, WarmCache
+
+
+def caches(path):
+    info = InfoCache(fetch=lambda symbol: {"symbol": symbol})
+    quotes = QuoteEngine(market_data=None, max_workers=1)
+    snapshots = SnapshotScheduler()
+    snapshots.register("trending", lambda: [], 60)
+    intraday = IntradayStore(market_data=None, capacity=8)
+    return WarmCache(str(path), info, quotes, snapshots, intraday)
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "warm.bin"
+    saved = caches(path)
+    saved.info_cache.put("AAPL", {"shortName": "Apple Inc.", "marketCap": 3.1e12})
+    saved.quote_engine._remember("AAPL", "2d", {"symbol": "AAPL", "price": 190.5})
+    saved.snapshots.restore({"trending": ([{"symbol": "AAPL"}], 1e12)})
+    index = pd.date_range("2024-03-04 09:30", periods=10, freq="min", tz="America/New_York")
+    frame = pd.DataFrame({column: np.arange(10.0) for column in COLUMNS}, index=index)
+    saved.intraday._buffer("AAPL").merge(frame)
+    assert saved.save()
+
+    restored = caches(path)
+    assert restored.restore() == {"info": 1, "quotes": 1, "snapshots": 1, "shared": 0, "intraday": 1}
+    assert restored.info_cache.export()[0][:2] == ("AAPL", {"shortName": "Apple Inc.", "marketCap": 3.1e12})
+    assert restored.quote_engine.export()[0][3] == {"symbol": "AAPL", "price": 190.5}
+    assert restored.snapshots.export()["trending"][0] == [{"symbol": "AAPL"}]
+    symbol, buffer = restored.intraday.export()[0]
+    pd.testing.assert_frame_equal(buffer.frame(), saved.intraday.export()[0][1].frame())
+
+
+@pytest.mark.parametrize("magic", [MAGIC, b"SDWARM01"])
+def test_planted_pickle_header_is_never_loaded(tmp_path, magic):
+    class Payload:
+        def __reduce__(self):
+            return (os.system, (f"touch {tmp_path / 'pwned'}",))
+
+    body = pickle.dumps({"info": [], "quotes": [], "snapshots": {}, "shared": [], "intraday": [],
+                         "payload": Payload()})
+    path = tmp_path / "warm.bin"
+    path.write_bytes(magic + len(body).to_bytes(8, "little") + body)
+    assert caches(path).restore() is None
+    assert not (tmp_path / "pwned").exists()
+
+
+def test_malformed_header_is_ignored(tmp_path):
+    path = tmp_path / "warm.bin"
+    body = b"[1, 2, 3]"
+    path.write_bytes(MAGIC + len(body).to_bytes(8, "little") + body)
+    assert caches(path).restore() is None
@@ -0,0 +1,166 @@
+"""Warm-start file for the in-process hot caches
+
+A restarted worker otherwise begins with empty caches and pays an upstream
+round trip for every first quote, info lookup and intraday chart. Instead the
+cached ticker info, recent quotes, snapshot values and intraday ring buffers
+(plus the entries of a process-local shared cache) are written to one file
+every interval seconds and at exit, and read back on boot. Daily bars need no
+copy: the bar store already keeps them on disk.
+
+File layout:
+
+  MAGIC | header length (8 bytes, little endian) | JSON header | padding |
+  intraday arrays (per symbol: capacity int64 timestamps, then capacity x 5
+  float64 values)
+
+The header is plain JSON - never pickle, since anyone who can write the file
+would otherwise run code at boot; the intraday arrays are memory-mapped copy-on-write,
+so boot does not read them and buffers that are never requested again are
+never paged in. Writes go to a temporary file that replaces the old one, so a
+reader never sees a partial file. With several workers the last one to save
+wins - each worker starts from the saved state, so that is a superset of what
+it restored.
+"""
+import atexit
+import os
+import threading
+import time
+
+import numpy as np
+
+from intraday import COLUMNS, IntradayBuffer
+from metrics import count_error
+from serialization import dumps, loads
+
+MAGIC = b"SDWARM02"
+ALIGN = 64
+
+# Shared cache entries worth keeping: quotes, real-time quotes, info, snapshots
+SHARED_PREFIXES = ("quote:", "realtime:", "info:", "snapshot:")
+
+SECTIONS = {"info", "quotes", "snapshots", "shared", "intraday"}
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+class WarmCache:
+    """Saves and restores the info cache, recent quotes, snapshots and intraday buffers"""
+
+    def __init__(self, path, info_cache, quote_engine, snapshots, intraday, shared=None):
+        self.path = path
+        self.shared = shared
+        self.info_cache = info_cache
+        self.quote_engine = quote_engine
+        self.snapshots = snapshots
+        self.intraday = intraday
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save(self):
+        """Write the current cache contents; returns False if there was nothing to save"""
+        with self._save_lock:
+            header = {"saved_at": time.time(),
+                      "info": self.info_cache.export(),
+                      "quotes": self.quote_engine.export(),
+                      "snapshots": self.snapshots.export(),
+                      "shared": self.shared.export(SHARED_PREFIXES) if self.shared is not None else [],
+                      "intraday": []}
+            arrays = []
+            offset = 0
+            for symbol, buffer in self.intraday.export():
+                state, ts, values = buffer.copy_state()
+                if state["count"] == 0:
+                    continue
+                header["intraday"].append((symbol, state, offset))
+                arrays.append((ts, values))
+                offset += ts.nbytes + values.nbytes
+            if not (header["info"] or header["quotes"] or header["snapshots"] or header["shared"] or arrays):
+                # e.g. a reloader parent that never served a request - keep the last good file
+                return False
+
+            body = dumps(header)
+            prefix = MAGIC + len(body).to_bytes(8, "little") + body
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(prefix)
+                f.write(b"\0" * (_aligned(len(prefix)) - len(prefix)))
+                for ts, values in arrays:
+                    f.write(ts.astype("<i8", copy=False).tobytes())
+                    f.write(values.astype("<f8", copy=False).tobytes())
+            os.replace(tmp_path, self.path)
+            return True
+
+    def restore(self):
+        """Seed the caches from the saved file; {section: entries restored}, or None without a file"""
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError("not a warm cache file")
+                length = int.from_bytes(f.read(8), "little")
+                header = loads(f.read(length))
+            if not isinstance(header, dict) or not SECTIONS <= header.keys():
+                raise ValueError("malformed warm cache header")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            count_error("warm_cache", e)
+            print(f"Ignoring unreadable warm cache {self.path}: {e}")
+            return None
+
+        self.info_cache.restore(header["info"])
+        self.quote_engine.restore(header["quotes"])
+        self.snapshots.restore(header["snapshots"])
+        if self.shared is not None:
+            self.shared.restore(header["shared"])
+        restored = 0
+        if header["intraday"]:
+            data = np.memmap(self.path, dtype=np.uint8, mode="c",
+                             offset=_aligned(len(MAGIC) + 8 + length))
+            for symbol, state, offset in header["intraday"]:
+                capacity = state["capacity"]
+                values_at = offset + capacity * 8
+                ts = data[offset:values_at].view("<i8")
+                values = data[values_at:values_at + capacity * len(COLUMNS) * 8].view("<f8")
+                buffer = IntradayBuffer.from_arrays(ts, values.reshape(capacity, len(COLUMNS)),
+                                                    state["start"], state["count"], state["tz"],
+                                                    state["checked_at"])
+                restored += self.intraday.restore(symbol, buffer)
+        return {"info": len(header["info"]), "quotes": len(header["quotes"]),
+                "snapshots": len(header["snapshots"]), "shared": len(header["shared"]), "intraday": restored}
+
+    def _save_quietly(self):
+        try:
+            self.save()
+        except Exception as e:
+            count_error("warm_cache", e)
+            print(f"Error saving warm cache {self.path}: {e}")
+
+    def start(self, interval):
+        """Save every interval seconds from a daemon thread, and once more at exit"""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                self._save_quietly()
+
+        self._thread = threading.Thread(target=run, name="warm-cache", daemon=True)
+        self._thread.start()
+        atexit.register(self._save_quietly)
+
+    def stop(self):
+        self._stop.set()
+
+
+def create_warm_cache(info_cache, quote_engine, snapshots, intraday, shared=None):
+    """WarmCache at WARM_CACHE_FILE, or None when that is set to an empty string"""
+    path = os.environ.get("WARM_CACHE_FILE", os.path.join("data", "warm_cache.bin"))
+    if not path:
+        return None
+    return WarmCache(path, info_cache, quote_engine, snapshots, intraday, shared)
@@ -0,0 +1,68 @@
+"""SQLite-backed watchlists shared by all worker processes"""
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist_items (
+    list_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (list_id, symbol)
+) WITHOUT ROWID
+"""
+
+
+class WatchlistStore:
+    """Named watchlists (one per user or list id) in a WAL-mode SQLite database"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def symbols(self, list_id):
+        """Symbols in the list, oldest first"""
+        rows = self._connection().execute(
+            "SELECT symbol FROM watchlist_items WHERE list_id = ? ORDER BY added_at, symbol", (list_id,))
+        return [row[0] for row in rows]
+
+    def add(self, list_id, symbols):
+        """Add symbols in one transaction; returns the ones that were not already present"""
+        now = time.time()
+        added = []
+        with self._connection() as conn:
+            for offset, symbol in enumerate(dict.fromkeys(symbols)):
+                # Offset keeps insertion order stable for symbols added in the same call
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO watchlist_items (list_id, symbol, added_at) VALUES (?, ?, ?)",
+                    (list_id, symbol, now + offset * 1e-6))
+                if cursor.rowcount:
+                    added.append(symbol)
+        return added
+
+    def remove(self, list_id, symbols):
+        """Remove symbols in one transaction; returns the ones that were present"""
+        removed = []
+        with self._connection() as conn:
+            for symbol in dict.fromkeys(symbols):
+                cursor = conn.execute(
+                    "DELETE FROM watchlist_items WHERE list_id = ? AND symbol = ?", (list_id, symbol))
+                if cursor.rowcount:
+                    removed.append(symbol)
+        return removed